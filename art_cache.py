@@ -0,0 +1,88 @@
+import os
+from collections import OrderedDict
+from io import BytesIO
+
+from PyQt5.QtGui import QPixmap
+
+from library import user_data_dir
+from startup import profile
+from tags import art_hash
+
+
+# PIL.Image, imported when the first picture has to be decoded
+Image = None
+
+
+def _load_pil():
+    global Image
+    if Image is None:
+        with profile.step('load PIL'):
+            from PIL import Image as module
+        Image = module
+    return Image
+
+
+class ArtCache:
+    """Album art cache keyed by picture content hash.
+
+    Ready-to-show QPixmaps are kept in a bounded in-memory LRU, and every
+    decoded picture is also written to disk as a pre-sized thumbnail, so a
+    picture is only decoded from the audio file's embedded data once.
+    """
+
+    def __init__(self, directory=None, size=(200, 200), capacity=64):
+        if directory is None:
+            directory = os.path.join(user_data_dir(), 'art')
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.size = size
+        self.capacity = capacity
+        self._pixmaps = OrderedDict()
+
+    def _thumbnail_path(self, key):
+        return os.path.join(self.directory, f'{key}.jpg')
+
+    def _remember(self, key, pixmap):
+        self._pixmaps[key] = pixmap
+        self._pixmaps.move_to_end(key)
+        while len(self._pixmaps) > self.capacity:
+            self._pixmaps.popitem(last=False)
+
+    def get(self, key):
+        """Return the cached pixmap for an art hash, or None if it was never decoded"""
+        if not key:
+            return None
+        pixmap = self._pixmaps.get(key)
+        if pixmap is not None:
+            self._pixmaps.move_to_end(key)
+            return pixmap
+        path = self._thumbnail_path(key)
+        if os.path.exists(path):
+            pixmap = QPixmap(path)
+            if not pixmap.isNull():
+                self._remember(key, pixmap)
+                return pixmap
+        return None
+
+    def put(self, data):
+        """Return (art hash, pixmap) for embedded picture data, decoding only on a cache miss"""
+        key = art_hash(data)
+        pixmap = self.get(key)
+        if pixmap is not None:
+            return key, pixmap
+        try:
+            image = _load_pil().open(BytesIO(data))
+            # Let the JPEG decoder downscale while decoding instead of
+            # decoding the full-size picture and resizing afterwards
+            image.draft('RGB', self.size)
+            image = image.convert('RGB').resize(self.size)
+            path = self._thumbnail_path(key)
+            image.save(path + '.tmp', 'JPEG', quality=90)
+            os.replace(path + '.tmp', path)
+        except Exception:
+            return key, None
+        pixmap = QPixmap(path)
+        if pixmap.isNull():
+            return key, None
+        self._remember(key, pixmap)
+        return key, pixmap
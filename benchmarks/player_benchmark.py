@@ -0,0 +1,298 @@
+"""End-to-end benchmarks of the player, run headless.
+
+Drives a real MusicPlayer window on Qt's offscreen platform with the silent
+stub playback backend (stub_vlc) and a throwaway data directory, against
+synthetic libraries from synthetic_library.py. For each library size it
+measures:
+
+  import.cold_s / import.warm_s  importing every file with an empty and with
+                                 a filled library cache, until the scan ends
+  view.<mode>_ms                 switching to each sort mode, including the
+                                 repaint (median of --repeats switches)
+  memory.bytes_per_track         Playlist (TrackStore and every index) per track
+  art.cold_ms / art.disk_ms / art.memory_ms
+                                 showing a track's cover: decoded from the
+                                 file, from the thumbnail cache on disk, and
+                                 from the in-memory pixmap cache (medians)
+  switch.gui_ms / switch.latency_ms / switch.latency_p95_ms
+                                 skipping to the next track: time spent in
+                                 forward() and time until the backend reports
+                                 playing (the stub does not decode, so this is
+                                 the player's own overhead)
+
+Libraries are cached between runs. --json writes the results with the
+machine and library parameters; --compare prints the change against such a
+file, e.g. from before a change:
+
+  python benchmarks/player_benchmark.py --tracks 1000,10000 --json before.json
+  python benchmarks/player_benchmark.py --tracks 1000,10000 --compare before.json
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import re
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Before anything imports Qt or the playback engine
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+os.environ['MUSIC_PLAYER_BACKEND'] = 'stub'
+
+from PyQt5.QtCore import QEventLoop, QT_VERSION_STR, PYQT_VERSION_STR
+from PyQt5.QtWidgets import QApplication
+
+import synthetic_library
+
+# Seconds to let the player settle (preload the next track) between skips
+SETTLE = 0.05
+
+
+def wait_for(app, condition, timeout=600.0):
+    """Process events until condition() is true; raise on timeout"""
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            raise TimeoutError('Timed out waiting for the player')
+        app.processEvents(QEventLoop.AllEvents, 10)
+
+
+def settle(app, seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        app.processEvents(QEventLoop.AllEvents, 10)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def run_import(app, player, paths):
+    done = []
+    player.scanner.finished.connect(done.append)
+    start = time.perf_counter()
+    player.import_paths(list(paths))
+    wait_for(app, lambda: done)
+    elapsed = time.perf_counter() - start
+    player.scanner.finished.disconnect(done.append)
+    if done[0] or len(player.tracks) != len(paths):
+        raise RuntimeError(f'Import incomplete: {len(player.tracks)} of {len(paths)} tracks')
+    return elapsed
+
+
+def bench_views(app, player, repeats):
+    player.finish_indexing()
+    modes = list(player.playlist.views.modes)
+    times = {mode: [] for mode in modes}
+    for _ in range(repeats):
+        for mode in modes:
+            # Switch away first so every measured switch rebuilds the view
+            other = modes[(modes.index(mode) + 1) % len(modes)]
+            player.sort_mode.setCurrentText(other)
+            app.processEvents()
+            start = time.perf_counter()
+            player.sort_mode.setCurrentText(mode)
+            player.tree_view.repaint()
+            app.processEvents()
+            times[mode].append(time.perf_counter() - start)
+    return {'view.' + re.sub(r'\W+', '_', mode.lower()) + '_ms': statistics.median(values) * 1000
+            for mode, values in times.items()}
+
+
+def bench_memory(player, paths):
+    from playlist import Playlist
+    from tags import read_tags
+
+    # Metadata comes from the library cache as fresh objects, as on import
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    playlist = Playlist()
+    playlist.add_many(zip(paths, player.library.resolve(paths, read_tags)))
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del playlist
+    return {'memory.bytes_per_track': used / len(paths)}
+
+
+def bench_art(app, player, directory, samples):
+    from PyQt5.QtGui import QPixmapCache
+
+    from art_cache import ArtCache
+
+    # One track per album, so every measurement is a different picture
+    tracks, seen = [], set()
+    for track in player.tracks:
+        art = player.tracks[track]['art_hash']
+        if art and art not in seen:
+            seen.add(art)
+            tracks.append(track)
+        if len(tracks) == samples:
+            break
+    if not tracks:
+        return {}
+
+    def show_all():
+        times = []
+        for track in tracks:
+            player.current_index = track
+            start = time.perf_counter()
+            player.update_metadata_and_art()
+            times.append(time.perf_counter() - start)
+        return statistics.median(times) * 1000
+
+    art_dir = os.path.join(directory, 'art-bench')
+    shutil.rmtree(art_dir, ignore_errors=True)
+    player.art_cache = ArtCache(art_dir, capacity=max(64, samples))
+    cold = show_all()
+    memory = show_all()
+    player.art_cache = ArtCache(art_dir, capacity=max(64, samples))
+    # QPixmap(path) is answered from Qt's own cache for files it loaded before
+    QPixmapCache.clear()
+    disk = show_all()
+    return {'art.cold_ms': cold, 'art.disk_ms': disk, 'art.memory_ms': memory}
+
+
+def bench_switch(app, player, switches):
+    engine = player.engine
+    player.current_index = next(iter(player.queue))
+    engine.latency = None
+    player.play_music()
+    wait_for(app, lambda: engine.latency is not None, timeout=30)
+    gui, latency = [], []
+    for _ in range(switches):
+        settle(app, SETTLE)
+        engine.latency = None
+        start = time.perf_counter()
+        player.forward()
+        gui.append(time.perf_counter() - start)
+        wait_for(app, lambda: engine.latency is not None, timeout=30)
+        latency.append(engine.latency)
+    player.stop_music()
+    return {
+        'switch.gui_ms': statistics.median(gui) * 1000,
+        'switch.latency_ms': statistics.median(latency) * 1000,
+        'switch.latency_p95_ms': percentile(latency, 0.95) * 1000,
+    }
+
+
+def bench_size(app, count, args, workdir):
+    from music_player import MusicPlayer
+
+    library_dir = args.library_dir or synthetic_library.default_directory(count, args.formats, args.seed)
+    print(f'Preparing {count} tracks in {library_dir}', file=sys.stderr)
+    paths = synthetic_library.generate(
+        library_dir, count, args.formats, args.seed,
+        progress=lambda done, total: print(f'  generated {done}/{total}', file=sys.stderr))
+
+    # A fresh data directory per size: empty library cache, art cache and session
+    data_dir = os.path.join(workdir, f'data-{count}')
+    os.environ['MUSIC_PLAYER_DATA_DIR'] = data_dir
+    player = MusicPlayer()
+    player.show()
+    app.processEvents()
+    results = {'tracks': len(paths)}
+    try:
+        results['import.cold_s'] = run_import(app, player, paths)
+        results['import.warm_s'] = run_import(app, player, paths)
+        results.update(bench_views(app, player, args.repeats))
+        results.update(bench_memory(player, paths))
+        results.update(bench_art(app, player, data_dir, args.art_samples))
+        results.update(bench_switch(app, player, args.switches))
+    finally:
+        player.close()
+        player.deleteLater()
+        app.processEvents()
+    return results
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpus': os.cpu_count(),
+        'qt': QT_VERSION_STR,
+        'pyqt': PYQT_VERSION_STR,
+    }
+
+
+def print_results(report, previous=None):
+    old_runs = (previous or {}).get('runs', {})
+    for size, results in report['runs'].items():
+        print(f'\n{size} tracks')
+        old = old_runs.get(size, {})
+        for name, value in results.items():
+            if name == 'tracks':
+                continue
+            line = f'  {name:28} {value:12.2f}'
+            if isinstance(old.get(name), (int, float)) and old[name]:
+                change = (value - old[name]) / old[name] * 100
+                line += f'   was {old[name]:10.2f}  {change:+6.1f}%'
+            print(line)
+    if previous is not None:
+        # Results from different machines or libraries are not comparable
+        for key in ('environment', 'params'):
+            if previous.get(key) != report[key]:
+                print(f'\nNote: {key} differs from the compared run', file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the player headless against synthetic libraries.')
+    parser.add_argument('--tracks', default='1000',
+                        help='comma-separated library sizes, e.g. 1000,10000,100000')
+    parser.add_argument('--formats', default=','.join(synthetic_library.FORMATS))
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--repeats', type=int, default=5, help='switches per sort mode')
+    parser.add_argument('--art-samples', type=int, default=20, help='albums whose art is shown')
+    parser.add_argument('--switches', type=int, default=50, help='track skips')
+    parser.add_argument('--library-dir', help='where to generate the library (one size only)')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--compare', help='results file from an earlier run to compare with')
+    args = parser.parse_args()
+    args.formats = tuple(args.formats.split(','))
+    sizes = [int(size) for size in args.tracks.split(',')]
+    if args.library_dir and len(sizes) > 1:
+        parser.error('--library-dir needs a single --tracks size')
+
+    app = QApplication(sys.argv[:1])
+    report = {
+        'environment': environment(),
+        'params': {'formats': list(args.formats), 'seed': args.seed, 'repeats': args.repeats,
+                   'art_samples': args.art_samples, 'switches': args.switches,
+                   'library_version': synthetic_library.VERSION},
+        'started': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'runs': {},
+    }
+    workdir = tempfile.mkdtemp(prefix='music-player-bench-')
+    try:
+        for count in sizes:
+            report['runs'][str(count)] = bench_size(app, count, args, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    previous = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            previous = json.load(f)
+    print_results(report, previous)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+"""Deterministic synthetic music libraries for the benchmarks.
+
+Writes tagged MP3, FLAC and WAV files laid out like a real collection
+(Artist/Album/NN Title.ext, ~10 tracks per album and ~5 albums per artist,
+one format and one JPEG cover per album). The same (count, formats, seed)
+always produces the same files, so results stay comparable across runs
+and machines.
+
+Files are tiny but parse like the real thing: MP3s are a Xing frame
+announcing a realistic frame count plus a few silent frames, FLACs carry a
+STREAMINFO with a realistic sample count, WAVs hold half a second of quiet
+8 kHz noise. Every file has ReplayGain tags, so importing does not start
+loudness analysis.
+
+Usage: python benchmarks/synthetic_library.py DIR [--tracks N] [--formats mp3,flac,wav] [--seed S]
+"""
+import argparse
+import io
+import json
+import os
+import random
+import struct
+import sys
+
+FORMATS = ('mp3', 'flac', 'wav')
+TRACKS_PER_ALBUM = 10
+ALBUMS_PER_ARTIST = 5
+ART_SIZE = 500
+
+# Bump when the generated files change, so cached libraries are rebuilt
+VERSION = 1
+MARKER = '.synthetic-library.json'
+
+WORDS = ('Love', 'Night', 'Fire', 'Blue', 'Heart', 'Rain', 'Gold', 'River', 'Ghost', 'Summer',
+         'Electric', 'Silent', 'Wild', 'Dream', 'Ocean', 'Stone', 'Light', 'Shadow', 'Road', 'Echo')
+
+# MPEG-1 Layer III, 128 kbit/s, 44.1 kHz, mono, no CRC: 417-byte frames of 1152 samples
+_MP3_HEADER = b'\xff\xfb\x90\xc0'
+_MP3_FRAME = 417
+_MP3_SIDE_INFO = 17
+
+
+def default_directory(count, formats=FORMATS, seed=1):
+    """Cache location for a library, under the system temp directory"""
+    import tempfile
+    name = f"library-{count}-{'-'.join(formats)}-{seed}"
+    return os.path.join(tempfile.gettempdir(), 'music-player-bench', name)
+
+
+def _mp3_audio(frames):
+    # Xing frame (frame count only) followed by a few silent frames
+    xing = bytearray(_MP3_FRAME)
+    xing[:4] = _MP3_HEADER
+    offset = 4 + _MP3_SIDE_INFO
+    xing[offset:offset + 12] = b'Xing' + struct.pack('>II', 1, frames)
+    silent = _MP3_HEADER + bytes(_MP3_FRAME - 4)
+    return bytes(xing) + silent * 8
+
+
+def _flac_audio(samples, rate, rng):
+    # STREAMINFO: block sizes, frame sizes (unknown), rate/channels/bits/total samples, MD5.
+    # A few bytes stand in for the frames so every file's audio differs.
+    info = struct.pack('>HH3s3s', 4096, 4096, bytes(3), bytes(3))
+    info += ((rate << 44) | (1 << 41) | (15 << 36) | samples).to_bytes(8, 'big') + bytes(16)
+    header = bytes([0x80, 0, 0, len(info)])
+    return b'fLaC' + header + info + rng.randbytes(256)
+
+
+def _wav_audio(rng):
+    rate = 8000
+    samples = struct.pack(f'<{rate // 2}h', *(rng.randint(-800, 800) for _ in range(rate // 2)))
+    fmt = struct.pack('<HHIIHH', 1, 1, rate, rate * 2, 2, 16)
+    body = b'WAVE' + b'fmt ' + struct.pack('<I', len(fmt)) + fmt + b'data' + struct.pack('<I', len(samples)) + samples
+    return b'RIFF' + struct.pack('<I', len(body)) + body
+
+
+def _cover(album, rng):
+    """A gradient JPEG cover, different for every album"""
+    from PIL import Image
+
+    gradient = Image.linear_gradient('L').resize((ART_SIZE, ART_SIZE))
+    colors = [Image.new('L', (ART_SIZE, ART_SIZE), rng.randrange(256)) for _ in range(2)]
+    image = Image.merge('RGB', (gradient, colors[0], gradient.rotate(90 * (album % 4))))
+    image = Image.blend(image, Image.merge('RGB', (colors[1], gradient, colors[0])), 0.5)
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=85)
+    return buffer.getvalue()
+
+
+def _tag_id3(tags, meta, cover):
+    from mutagen.id3 import APIC, TALB, TIT2, TPE1, TRCK, TXXX
+
+    tags.add(TIT2(encoding=3, text=meta['title']))
+    tags.add(TPE1(encoding=3, text=meta['artist']))
+    tags.add(TALB(encoding=3, text=meta['album']))
+    tags.add(TRCK(encoding=3, text=meta['tracknumber']))
+    tags.add(TXXX(encoding=3, desc='REPLAYGAIN_TRACK_GAIN', text=f"{meta['gain']:.2f} dB"))
+    tags.add(TXXX(encoding=3, desc='REPLAYGAIN_TRACK_PEAK', text='0.950000'))
+    tags.add(APIC(encoding=3, mime='image/jpeg', type=3, desc='Cover', data=cover))
+
+
+def _write_track(filepath, fmt, meta, cover, rng):
+    duration = meta['duration']
+    if fmt == 'mp3':
+        from mutagen.id3 import ID3
+
+        with open(filepath, 'wb') as f:
+            f.write(_mp3_audio(int(duration * 44100 / 1152)))
+        tags = ID3()
+        _tag_id3(tags, meta, cover)
+        tags.save(filepath, v2_version=3)
+    elif fmt == 'flac':
+        from mutagen.flac import FLAC, Picture
+
+        with open(filepath, 'wb') as f:
+            f.write(_flac_audio(int(duration * 44100), 44100, rng))
+        audio = FLAC(filepath)
+        audio['title'] = meta['title']
+        audio['artist'] = meta['artist']
+        audio['album'] = meta['album']
+        audio['tracknumber'] = meta['tracknumber']
+        audio['replaygain_track_gain'] = f"{meta['gain']:.2f} dB"
+        audio['replaygain_track_peak'] = '0.950000'
+        picture = Picture()
+        picture.type = 3
+        picture.mime = 'image/jpeg'
+        picture.width = picture.height = ART_SIZE
+        picture.depth = 24
+        picture.data = cover
+        audio.add_picture(picture)
+        audio.save()
+    elif fmt == 'wav':
+        from mutagen.wave import WAVE
+
+        with open(filepath, 'wb') as f:
+            f.write(_wav_audio(rng))
+        audio = WAVE(filepath)
+        audio.add_tags()
+        _tag_id3(audio.tags, meta, cover)
+        audio.save(v2_version=3)
+    else:
+        raise ValueError(f'Unsupported format: {fmt}')
+
+
+def _is_current(directory, params):
+    try:
+        with open(os.path.join(directory, MARKER), encoding='utf-8') as f:
+            return json.load(f) == params
+    except (OSError, ValueError):
+        return False
+
+
+def generate(directory, count, formats=FORMATS, seed=1, progress=None):
+    """Create a library of `count` tracks in `directory`, unless the same
+    library is already there; return the sorted list of file paths.
+
+    `progress(done, total)` is called every 1000 files while generating.
+    """
+    formats = tuple(formats)
+    for fmt in formats:
+        if fmt not in FORMATS:
+            raise ValueError(f'Unsupported format: {fmt}')
+    params = {'version': VERSION, 'count': count, 'formats': list(formats), 'seed': seed}
+    paths = []
+    if _is_current(directory, params):
+        for folder, _, files in os.walk(directory):
+            paths.extend(os.path.join(folder, name) for name in files if name != MARKER)
+        return sorted(paths)
+
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    marker = os.path.join(directory, MARKER)
+    if os.path.exists(marker):
+        os.remove(marker)
+    cover = album_name = None
+    for i in range(count):
+        album, number = divmod(i, TRACKS_PER_ALBUM)
+        artist = album // ALBUMS_PER_ARTIST
+        fmt = formats[album % len(formats)]
+        if number == 0:
+            cover = _cover(album, rng)
+            album_name = f'{rng.choice(WORDS)} {album:06d}'
+        title = ' '.join(rng.sample(WORDS, rng.randint(1, 3)))
+        meta = {
+            'title': title,
+            'artist': f'Artist {artist:05d}',
+            'album': album_name,
+            'tracknumber': f'{number + 1}/{TRACKS_PER_ALBUM}',
+            'duration': rng.uniform(120, 400),
+            'gain': rng.uniform(-12, 2),
+        }
+        folder = os.path.join(directory, f'Artist {artist:05d}', f'Album {album:06d}')
+        os.makedirs(folder, exist_ok=True)
+        filepath = os.path.join(folder, f'{number + 1:02d} {title}.{fmt}')
+        _write_track(filepath, fmt, meta, cover, rng)
+        paths.append(filepath)
+        if progress is not None and (i + 1) % 1000 == 0:
+            progress(i + 1, count)
+    with open(marker, 'w', encoding='utf-8') as f:
+        json.dump(params, f)
+    return sorted(paths)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic tagged music library.')
+    parser.add_argument('directory')
+    parser.add_argument('--tracks', type=int, default=1000)
+    parser.add_argument('--formats', default=','.join(FORMATS))
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    paths = generate(args.directory, args.tracks, args.formats.split(','), args.seed,
+                     progress=lambda done, total: print(f'{done}/{total}', file=sys.stderr))
+    print(f'{len(paths)} tracks in {args.directory}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Bytes per track of the playlist data: per-track dicts vs. TrackStore.
+
+Usage: python benchmarks/track_memory.py [tracks]
+"""
+import os
+import random
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from track_store import TrackStore
+
+
+def synthetic_tracks(count, seed=1):
+    """Yield (path, metadata) pairs shaped like a real library: ~10 tracks
+    per album and ~5 albums per artist. Every string is a fresh object, as
+    the tag reader produces."""
+    rng = random.Random(seed)
+    for i in range(count):
+        album = i // 10
+        artist = album // 5
+        path = f'/home/user/Music/Artist {artist}/Album {album}/{i % 10 + 1:02d} Track {i}.mp3'
+        yield path, {
+            'title': f'Track {i} {rng.choice(["Love", "Night", "Fire", "Blue"])}',
+            'artist': f'Artist {artist}',
+            'album': f'Album {album}',
+            'tracknumber': f'{i % 10 + 1}/10',
+            'duration': rng.uniform(120, 400),
+            'bitrate': 320000,
+            'art_hash': f'{album:040x}',
+            'track_gain': None,
+            'track_peak': None,
+            'album_gain': None,
+            'album_peak': None,
+        }
+
+
+def measure(build, count):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    data = build(synthetic_tracks(count))
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del data
+    return used / count
+
+
+def build_lists(tracks):
+    playlist, metadata_list = [], []
+    for path, meta in tracks:
+        playlist.append(path)
+        metadata_list.append(meta)
+    return playlist, metadata_list
+
+
+def build_store(tracks):
+    store = TrackStore()
+    for path, meta in tracks:
+        store.add(path, meta)
+    return store
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    lists = measure(build_lists, count)
+    store = measure(build_store, count)
+    print(f'{count} tracks')
+    print(f'  list of dicts: {lists:8.0f} bytes/track')
+    print(f'  TrackStore:    {store:8.0f} bytes/track  ({lists / store:.1f}x smaller)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+import os
+
+from PyQt5.QtCore import QTimer
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QTreeWidget, QTreeWidgetItem, QPushButton, QFileDialog, QLabel
+
+from metrics import metrics, profiler
+
+
+class DebugPanel(QWidget):
+    """Live view of the metrics, opened with Ctrl+Shift+D.
+
+    Refreshes once a second while shown. Timers show count, mean, max and
+    last in ms; counters show their value. Snapshots can be saved as JSON
+    and a cProfile run of the GUI thread can be started and saved.
+    """
+
+    COLUMNS = ('Name', 'Count', 'Mean ms', 'Max ms', 'Last ms', 'Total ms')
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle('Music Player Metrics')
+        self.resize(560, 420)
+        layout = QVBoxLayout(self)
+
+        self.table = QTreeWidget()
+        self.table.setHeaderLabels(self.COLUMNS)
+        self.table.setRootIsDecorated(True)
+        self.table.setColumnWidth(0, 200)
+        layout.addWidget(self.table)
+
+        self.status = QLabel()
+        layout.addWidget(self.status)
+
+        buttons = QHBoxLayout()
+        self.reset_button = QPushButton('Reset')
+        self.reset_button.clicked.connect(self.reset)
+        buttons.addWidget(self.reset_button)
+        self.save_button = QPushButton('Save JSON...')
+        self.save_button.clicked.connect(self.save)
+        buttons.addWidget(self.save_button)
+        self.profile_button = QPushButton()
+        self.profile_button.clicked.connect(self.toggle_profiler)
+        buttons.addWidget(self.profile_button)
+        layout.addLayout(buttons)
+
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(1000)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.update_profile_button()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.refresh()
+        self.refresh_timer.start()
+
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self.refresh_timer.stop()
+
+    def refresh(self):
+        snapshot = metrics.snapshot()
+        self.table.clear()
+        timers = QTreeWidgetItem(['Timers'])
+        for name, timer in snapshot['timers'].items():
+            timers.addChild(QTreeWidgetItem([name, str(timer['count'])] + [
+                f"{timer[key]:.2f}" for key in ('mean_ms', 'max_ms', 'last_ms', 'total_ms')]))
+        counters = QTreeWidgetItem(['Counters'])
+        for name, value in snapshot['counters'].items():
+            counters.addChild(QTreeWidgetItem([name, str(value)]))
+        self.table.addTopLevelItems([timers, counters])
+        timers.setExpanded(True)
+        counters.setExpanded(True)
+        self.status.setText(f"Collected over {snapshot['duration_s']:.0f} s")
+
+    def reset(self):
+        metrics.reset()
+        self.refresh()
+
+    def save(self):
+        filepath, _ = QFileDialog.getSaveFileName(self, 'Save Metrics', 'metrics.json', 'JSON (*.json)')
+        if not filepath:
+            return
+        try:
+            metrics.dump(filepath)
+        except OSError as e:
+            self.status.setText(f'Could not save metrics: {e}')
+            return
+        self.status.setText(f'Saved {os.path.basename(filepath)}')
+
+    def toggle_profiler(self):
+        if not profiler.running:
+            profiler.start()
+        else:
+            filepath, _ = QFileDialog.getSaveFileName(self, 'Save Profile', 'player.prof', 'cProfile stats (*.prof)')
+            if filepath:
+                try:
+                    profiler.stop(filepath)
+                except OSError as e:
+                    self.status.setText(f'Could not save profile: {e}')
+        self.update_profile_button()
+
+    def update_profile_button(self):
+        self.profile_button.setText('Stop cProfile...' if profiler.running else 'Start cProfile')
@@ -0,0 +1,291 @@
+import hashlib
+import mmap
+import os
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from library import file_fingerprint
+from metrics import metrics
+
+
+# Bytes of audio hashed to tell same-size candidates apart before reading whole files
+HEAD_BYTES = 64 * 1024
+_CHUNK = 1 << 20
+
+
+def _skip_id3v2(f, start):
+    # ID3v2 tags (possibly more than one) in front of MP3 and some FLAC files
+    f.seek(start)
+    header = f.read(10)
+    while len(header) == 10 and header[:3] == b'ID3':
+        size = (header[6] & 0x7f) << 21 | (header[7] & 0x7f) << 14 | (header[8] & 0x7f) << 7 | header[9] & 0x7f
+        start += 10 + size + (10 if header[5] & 0x10 else 0)
+        f.seek(start)
+        header = f.read(10)
+    return start
+
+
+def _mp3_ranges(f, size):
+    start = _skip_id3v2(f, 0)
+    end = size
+    while True:
+        # Trailing ID3v1 and APEv2 tags, in either order
+        if end - start >= 128:
+            f.seek(end - 128)
+            if f.read(3) == b'TAG':
+                end -= 128
+                continue
+        if end - start >= 32:
+            f.seek(end - 32)
+            footer = f.read(32)
+            if footer[:8] == b'APETAGEX':
+                tag_size = int.from_bytes(footer[12:16], 'little')
+                has_header = int.from_bytes(footer[20:24], 'little') & 0x80000000
+                end -= tag_size + (32 if has_header else 0)
+                continue
+        break
+    return [(start, max(0, end - start))]
+
+
+def _flac_ranges(f, size):
+    start = _skip_id3v2(f, 0)
+    f.seek(start)
+    if f.read(4) != b'fLaC':
+        return None
+    pos = start + 4
+    while True:
+        # Metadata blocks (stream info, tags, pictures, padding) precede the frames
+        f.seek(pos)
+        block = f.read(4)
+        if len(block) < 4:
+            return None
+        pos += 4 + int.from_bytes(block[1:4], 'big')
+        if block[0] & 0x80:
+            return [(pos, max(0, size - pos))]
+
+
+def _wav_ranges(f, size):
+    header = f.read(12)
+    if header[:4] != b'RIFF' or header[8:12] != b'WAVE':
+        return None
+    pos = 12
+    while pos + 8 <= size:
+        f.seek(pos)
+        chunk = f.read(8)
+        length = int.from_bytes(chunk[4:8], 'little')
+        if chunk[:4] == b'data':
+            return [(pos + 8, min(length, size - pos - 8))]
+        pos += 8 + length + (length & 1)
+    return None
+
+
+def _mp4_ranges(f, size):
+    pos = 0
+    while pos + 8 <= size:
+        f.seek(pos)
+        atom = f.read(8)
+        length, header = int.from_bytes(atom[:4], 'big'), 8
+        if length == 1:
+            length, header = int.from_bytes(f.read(8), 'big'), 16
+        elif length == 0:
+            length = size - pos
+        if length < header:
+            return None
+        if atom[4:8] == b'mdat':
+            return [(pos + header, min(length, size - pos) - header)]
+        pos += length
+    return None
+
+
+def _ogg_ranges(f, size):
+    # Page headers carry sequence numbers and checksums that change when the
+    # comment header is resized, so only audio page bodies are compared
+    ranges = []
+    pos = 0
+    while pos + 27 <= size:
+        f.seek(pos)
+        header = f.read(27)
+        if header[:4] != b'OggS':
+            return None
+        segments = f.read(header[26])
+        body = sum(segments)
+        start = pos + 27 + header[26]
+        # Header packets (identification, comments, setup) sit on granule 0 pages
+        if int.from_bytes(header[6:14], 'little') != 0:
+            ranges.append((start, body))
+        pos = start + body
+    return ranges
+
+
+_PAYLOAD_READERS = {
+    '.mp3': _mp3_ranges,
+    '.flac': _flac_ranges,
+    '.wav': _wav_ranges,
+    '.m4a': _mp4_ranges,
+    '.ogg': _ogg_ranges,
+}
+
+
+def audio_ranges(filepath):
+    """Return the (offset, length) ranges holding a file's audio data.
+
+    Tags, pictures and container metadata are left out, so copies that only
+    differ in their tags cover the same bytes. Unknown or unparseable files
+    are taken whole.
+    """
+    size = os.path.getsize(filepath)
+    reader = _PAYLOAD_READERS.get(os.path.splitext(filepath)[1].lower())
+    ranges = None
+    if reader is not None:
+        with open(filepath, 'rb') as f:
+            ranges = reader(f, size)
+    return ranges if ranges is not None else [(0, size)]
+
+
+def hash_ranges(filepath, ranges, limit=None):
+    """Hash the given byte ranges of a file (only the first `limit` bytes if set)
+    through a memory map, a chunk at a time"""
+    digest = hashlib.blake2b(digest_size=16)
+    remaining = sum(length for _, length in ranges) if limit is None else limit
+    with open(filepath, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return digest.hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for offset, length in ranges:
+                end = offset + min(length, remaining)
+                for start in range(offset, end, _CHUNK):
+                    digest.update(data[start:min(start + _CHUNK, end)])
+                remaining -= end - offset
+                if remaining <= 0:
+                    break
+    return digest.hexdigest()
+
+
+class DuplicateFinder(QObject):
+    """Finds tracks with identical audio in a background thread.
+
+    Candidates are narrowed in steps so that most files are never read:
+    same duration (from the library, no I/O), then the same audio payload
+    size, then the same hash of the first HEAD_BYTES, and only then a full
+    hash of the audio. Tag blocks are excluded, so re-tagged copies match.
+    Sizes and hashes are cached in the library per file version.
+    """
+
+    finished = pyqtSignal(list)  # lists of track ids with identical audio
+    progress = pyqtSignal(str)
+
+    _finished = pyqtSignal(int, list)
+    _progress = pyqtSignal(int, str)
+
+    def __init__(self, library, workers=None, parent=None):
+        super().__init__(parent)
+        self.library = library
+        self.workers = workers or min(8, (os.cpu_count() or 1) + 2)
+        self._generation = 0
+        self._cancel = None
+        self._finished.connect(self._on_finished)
+        self._progress.connect(self._on_progress)
+
+    def find(self, tracks):
+        """Start a search over (track id, path, duration in seconds) triples"""
+        self.cancel()
+        self._generation += 1
+        self._cancel = threading.Event()
+        threading.Thread(target=self._run, args=(self._generation, list(tracks), self._cancel), daemon=True).start()
+
+    def cancel(self):
+        """Stop the search; a result it already queued for the GUI thread is
+        dropped, since its track ids may name other tracks by then"""
+        if self._cancel is not None:
+            self._cancel.set()
+        self._generation += 1
+
+    def _run(self, generation, tracks, cancel):
+        groups = []
+        try:
+            with metrics.timer('dedupe.find'):
+                groups = self._find(generation, tracks, cancel)
+        finally:
+            self._finished.emit(generation, [] if cancel.is_set() else groups)
+
+    def _find(self, generation, tracks, cancel):
+        by_duration = defaultdict(list)
+        for track, filepath, duration in tracks:
+            if duration > 0:
+                by_duration[round(duration)].append((track, filepath))
+        candidates = [item for bucket in by_duration.values() if len(bucket) > 1 for item in bucket]
+        if not candidates:
+            return []
+        self._progress.emit(generation, f'Checking {len(candidates)} possible duplicates...')
+
+        # Per file: fingerprint, cached (size, head, full) and the payload ranges once read
+        info = {}
+        for track, filepath in candidates:
+            fingerprint = file_fingerprint(filepath)
+            cached = self.library.get_audio_hash(filepath, fingerprint)
+            size, head, full = (cached.split(':') + ['', ''])[:3] if cached else ('', '', '')
+            info[track] = {'path': filepath, 'fingerprint': fingerprint, 'ranges': None,
+                           'size': int(size) if size else None, 'head': head or None, 'full': full or None}
+
+        pool = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            def fill(items, step):
+                for track, _ in zip(items, pool.map(step, items)):
+                    if cancel.is_set():
+                        return
+
+            def measure(track):
+                entry = info[track]
+                try:
+                    entry['ranges'] = audio_ranges(entry['path'])
+                    entry['size'] = sum(length for _, length in entry['ranges'])
+                except OSError:
+                    entry['size'] = None
+
+            def hasher(key, limit):
+                def step(track):
+                    entry = info[track]
+                    try:
+                        if entry['ranges'] is None:
+                            entry['ranges'] = audio_ranges(entry['path'])
+                        entry[key] = hash_ranges(entry['path'], entry['ranges'], limit)
+                    except (OSError, ValueError):
+                        entry[key] = None
+                return step
+
+            def regroup(groups, key):
+                result = []
+                for group in groups:
+                    buckets = defaultdict(list)
+                    for track in group:
+                        # Files without audio data (size 0) are never duplicates
+                        if info[track][key]:
+                            buckets[info[track][key]].append(track)
+                    result.extend(bucket for bucket in buckets.values() if len(bucket) > 1)
+                return result
+
+            groups = [[track for track, _ in bucket] for bucket in by_duration.values() if len(bucket) > 1]
+            fill([track for group in groups for track in group if info[track]['size'] is None], measure)
+            groups = regroup(groups, 'size')
+            fill([track for group in groups for track in group if info[track]['head'] is None], hasher('head', HEAD_BYTES))
+            groups = regroup(groups, 'head')
+            fill([track for group in groups for track in group if info[track]['full'] is None], hasher('full', None))
+            groups = regroup(groups, 'full')
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+        self.library.set_audio_hashes(
+            (entry['path'], entry['fingerprint'], f"{entry['size']}:{entry['head'] or ''}:{entry['full'] or ''}")
+            for entry in info.values() if entry['size'] is not None)
+        return [sorted(group) for group in groups]
+
+    def _on_progress(self, generation, message):
+        if generation == self._generation:
+            self.progress.emit(message)
+
+    def _on_finished(self, generation, groups):
+        if generation == self._generation:
+            self.finished.emit(groups)
@@ -0,0 +1,185 @@
+import os
+import sqlite3
+import sys
+import threading
+
+
+def user_data_dir():
+    # Per-user application data directory, created on first use.
+    # MUSIC_PLAYER_DATA_DIR replaces it on every platform (benchmarks, tests)
+    override = os.environ.get('MUSIC_PLAYER_DATA_DIR')
+    if override:
+        os.makedirs(override, exist_ok=True)
+        return override
+    if sys.platform == 'win32':
+        base = os.environ.get('APPDATA') or os.path.expanduser('~')
+    elif sys.platform == 'darwin':
+        base = os.path.expanduser('~/Library/Application Support')
+    else:
+        base = os.environ.get('XDG_DATA_HOME') or os.path.expanduser('~/.local/share')
+    path = os.path.join(base, 'MusicPlayer')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def file_fingerprint(filepath):
+    """Return (mtime_ns, size) for a file, or None if it cannot be stat'ed"""
+    try:
+        st = os.stat(filepath)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+class LibraryCache:
+    """SQLite-backed metadata cache keyed by path, mtime and size.
+
+    Entries are only trusted while the file's (mtime, size) fingerprint is
+    unchanged, so a re-import only re-parses files that were modified.
+    """
+
+    FIELDS = ('title', 'artist', 'album', 'tracknumber', 'duration', 'bitrate', 'art_hash',
+              'track_gain', 'track_peak', 'album_gain', 'album_peak')
+    # Columns added after the first schema, with their SQL types
+    ADDED_COLUMNS = {'bitrate': 'INTEGER', 'track_gain': 'REAL', 'track_peak': 'REAL',
+                     'album_gain': 'REAL', 'album_peak': 'REAL'}
+    # Columns filled in on demand rather than from the tags, so adding them
+    # does not invalidate existing entries
+    DERIVED_COLUMNS = {'audio_hash': 'TEXT'}
+
+    def __init__(self, db_path=None):
+        if db_path is None:
+            db_path = os.path.join(user_data_dir(), 'library.db')
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS tracks ('
+            ' path TEXT PRIMARY KEY,'
+            ' mtime INTEGER NOT NULL,'
+            ' size INTEGER NOT NULL,'
+            ' title TEXT, artist TEXT, album TEXT, tracknumber TEXT,'
+            ' duration REAL, art_hash TEXT)'
+        )
+        existing = {row['name'] for row in self._conn.execute('PRAGMA table_info(tracks)')}
+        missing = [column for column in self.ADDED_COLUMNS if column not in existing]
+        for column in missing:
+            self._conn.execute(f'ALTER TABLE tracks ADD COLUMN {column} {self.ADDED_COLUMNS[column]}')
+        if missing:
+            # Entries cached before the new columns existed are re-read once
+            self._conn.execute('UPDATE tracks SET mtime = -1')
+        for column, kind in self.DERIVED_COLUMNS.items():
+            if column not in existing:
+                self._conn.execute(f'ALTER TABLE tracks ADD COLUMN {column} {kind}')
+        self._conn.commit()
+        self._select = 'SELECT path, {} FROM tracks'.format(', '.join(self.FIELDS))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def get(self, filepath, fingerprint):
+        """Return the cached row for filepath if its fingerprint still matches"""
+        if fingerprint is None:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                self._select + ' WHERE path = ? AND mtime = ? AND size = ?',
+                (filepath, fingerprint[0], fingerprint[1]),
+            ).fetchone()
+        return row
+
+    def put_many(self, entries):
+        """Store (path, fingerprint, metadata) tuples in a single transaction"""
+        rows = []
+        for filepath, fingerprint, meta in entries:
+            if fingerprint is None:
+                continue
+            rows.append((filepath, fingerprint[0], fingerprint[1]) + tuple(meta.get(f) for f in self.FIELDS))
+        if not rows:
+            return
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    'INSERT OR REPLACE INTO tracks (path, mtime, size, {}) VALUES (?, ?, ?{})'.format(
+                        ', '.join(self.FIELDS), ', ?' * len(self.FIELDS)),
+                    rows,
+                )
+
+    def set_art_hash(self, filepath, art_hash):
+        with self._lock:
+            with self._conn:
+                self._conn.execute('UPDATE tracks SET art_hash = ? WHERE path = ?', (art_hash, filepath))
+
+    def set_loudness(self, filepath, track_gain, track_peak):
+        """Store analyzed loudness for a file that has no ReplayGain tags"""
+        with self._lock:
+            with self._conn:
+                self._conn.execute('UPDATE tracks SET track_gain = ?, track_peak = ? WHERE path = ?',
+                                   (track_gain, track_peak, filepath))
+
+    def fingerprint(self, filepath):
+        """Return the (mtime_ns, size) a file had when it was cached, or None"""
+        with self._lock:
+            row = self._conn.execute('SELECT mtime, size FROM tracks WHERE path = ?', (filepath,)).fetchone()
+        return (row['mtime'], row['size']) if row is not None else None
+
+    def rename(self, old_path, new_path):
+        """Keep the entry of a moved file, which has the same fingerprint"""
+        with self._lock:
+            with self._conn:
+                self._conn.execute('DELETE FROM tracks WHERE path = ?', (new_path,))
+                self._conn.execute('UPDATE tracks SET path = ? WHERE path = ?', (new_path, old_path))
+
+    def remove_many(self, paths):
+        rows = [(filepath,) for filepath in paths]
+        if not rows:
+            return
+        with self._lock:
+            with self._conn:
+                self._conn.executemany('DELETE FROM tracks WHERE path = ?', rows)
+
+    def get_audio_hash(self, filepath, fingerprint):
+        """Return the stored audio hash for filepath if its fingerprint still matches"""
+        if fingerprint is None:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT audio_hash FROM tracks WHERE path = ? AND mtime = ? AND size = ?',
+                (filepath, fingerprint[0], fingerprint[1]),
+            ).fetchone()
+        return row['audio_hash'] if row is not None else None
+
+    def set_audio_hashes(self, entries):
+        """Store (path, fingerprint, audio hash) tuples; entries for files that
+        changed since they were hashed are skipped"""
+        rows = [(audio_hash, filepath, fingerprint[0], fingerprint[1])
+                for filepath, fingerprint, audio_hash in entries if fingerprint is not None]
+        if not rows:
+            return
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    'UPDATE tracks SET audio_hash = ? WHERE path = ? AND mtime = ? AND size = ?', rows)
+
+    def resolve(self, paths, parse):
+        """Return metadata rows for paths, parsing only new or modified files.
+
+        Fresh entries come straight from the index; stale ones are parsed with
+        `parse(path)` and written back in one transaction.
+        """
+        results = []
+        stale = []
+        for filepath in paths:
+            fingerprint = file_fingerprint(filepath)
+            row = self.get(filepath, fingerprint)
+            if row is None:
+                meta = parse(filepath)
+                stale.append((filepath, fingerprint, meta))
+                row = meta
+            results.append(row)
+        self.put_many(stale)
+        return results
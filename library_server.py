@@ -0,0 +1,335 @@
+import asyncio
+import functools
+import json
+import os
+import socket
+import threading
+from urllib.parse import unquote, urljoin, urlsplit
+
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+from metrics import metrics
+
+
+DEFAULT_PORT = 8765
+
+# Content types for the formats the scanner imports
+AUDIO_TYPES = {
+    '.mp3': 'audio/mpeg',
+    '.flac': 'audio/flac',
+    '.wav': 'audio/wav',
+    '.ogg': 'audio/ogg',
+    '.m4a': 'audio/mp4',
+}
+
+# Metadata fields published per track, with the type a client accepts
+TRACK_FIELDS = {
+    'title': str, 'artist': str, 'album': str, 'tracknumber': str,
+    'duration': float, 'bitrate': int,
+    'track_gain': float, 'track_peak': float, 'album_gain': float, 'album_peak': float,
+}
+
+_MAX_HEAD = 16384  # bytes of request line and headers
+_IDLE_TIMEOUT = 30.0  # seconds a kept-alive connection may wait for its next request
+_REASONS = {200: 'OK', 206: 'Partial Content', 400: 'Bad Request', 404: 'Not Found',
+            405: 'Method Not Allowed', 416: 'Range Not Satisfiable'}
+
+
+def lan_address():
+    """Best guess at this machine's address on the local network"""
+    probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        # No packet is sent: connecting a UDP socket only picks the outgoing interface
+        probe.connect(('192.0.2.1', 9))
+        return probe.getsockname()[0]
+    except OSError:
+        return '127.0.0.1'
+    finally:
+        probe.close()
+
+
+def parse_range(value, size):
+    """(start, end) inclusive for a single-range Range header, None to send the
+    whole file, or False if the range cannot be satisfied"""
+    if not value or not value.startswith('bytes='):
+        return None
+    spec = value[6:].strip()
+    if ',' in spec:
+        # Multiple ranges: answering with the whole file is allowed
+        return None
+    first, dash, last = spec.partition('-')
+    if not dash:
+        return None
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+        else:
+            # Suffix range: the last N bytes
+            start = max(0, size - int(last))
+            end = size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        return False
+    if start < 0 or start > end:
+        return None
+    return start, min(end, size - 1)
+
+
+def parse_library(data, base_url):
+    """Turn a library listing from a LibraryServer into (url, metadata) pairs.
+
+    Raises ValueError if `data` is not a listing. Unknown or mistyped fields
+    are replaced by the player's defaults.
+    """
+    if not isinstance(data, dict) or not isinstance(data.get('tracks'), list):
+        raise ValueError('URL returned JSON, not a music library')
+    entries = []
+    for item in data['tracks']:
+        if not isinstance(item, dict) or not isinstance(item.get('url'), str):
+            continue
+        meta = {'title': '-', 'artist': '-', 'album': '-', 'tracknumber': '0', 'duration': 0.0, 'bitrate': 0,
+                'art_hash': '', 'track_gain': None, 'track_peak': None, 'album_gain': None, 'album_peak': None}
+        for field, kind in TRACK_FIELDS.items():
+            value = item.get(field)
+            if isinstance(value, kind) or (kind is float and isinstance(value, int) and not isinstance(value, bool)):
+                meta[field] = kind(value)
+        entries.append((urljoin(base_url, item['url']), meta))
+    return entries
+
+
+class LibraryServer(QObject):
+    """Serves the playlist's local files to other players on the network.
+
+    `GET /` returns the library as JSON (one entry per track, with its
+    metadata and a relative audio URL) and `GET /tracks/<id>.<ext>` returns
+    a track's file. Single byte ranges are honoured so players can seek, and
+    file bodies go out with `loop.sendfile`, which uses os.sendfile (no copy
+    through Python) where the platform has it.
+
+    Requests are handled by an asyncio event loop in a background thread, so
+    any number of clients can stream and seek at once without touching the
+    GUI thread. The listing is rebuilt on the GUI thread from the Playlist,
+    once its tracks have stopped changing for a check interval, and handed
+    to the server as immutable data.
+    """
+
+    started = pyqtSignal(str)  # URL to connect to
+    stopped = pyqtSignal()
+    failed = pyqtSignal(str)
+
+    # Internal signal carrying the run generation and the URL or the error
+    _state = pyqtSignal(int, object)
+
+    def __init__(self, playlist, name=None, check_interval=2000, parent=None):
+        super().__init__(parent)
+        self.playlist = playlist
+        self.name = name or socket.gethostname()
+        self.url = None
+        self._generation = 0
+        self._loop = None
+        self._task = None  # the server coroutine, cancelled to stop it
+        self._listing = b'{"tracks": []}'
+        self._files = {}  # track id -> path, for the published tracks only
+        self._published = None  # playlist version of the current listing
+        self._seen = None  # playlist version at the last check
+        self._check = QTimer(self)
+        self._check.setInterval(check_interval)
+        self._check.timeout.connect(self._refresh)
+        self._state.connect(self._on_state)
+
+    @property
+    def running(self):
+        return self._loop is not None
+
+    def start(self, host='0.0.0.0', port=DEFAULT_PORT):
+        if self.running:
+            return
+        self._generation += 1
+        self._publish()
+        self._check.start()
+        self._loop = asyncio.new_event_loop()
+        # Created before the thread runs the loop, so stop() always has it
+        self._task = self._loop.create_task(self._serve(self._generation, host, port))
+        threading.Thread(target=self._run, args=(self._generation, self._loop, self._task), daemon=True).start()
+
+    def stop(self):
+        if not self.running:
+            return
+        self._generation += 1
+        self._check.stop()
+        loop, task = self._loop, self._task
+        self._loop = self._task = None
+        self.url = None
+        try:
+            loop.call_soon_threadsafe(task.cancel)
+        except RuntimeError:
+            pass  # the loop already ended (the server failed to start)
+        self.stopped.emit()
+
+    def _refresh(self):
+        # Rebuild once the playlist has settled, not on every scanned batch
+        version = self.playlist.version
+        if version == self._seen and version != self._published:
+            self._publish()
+        self._seen = version
+
+    def _publish(self):
+        with metrics.timer('server.publish'):
+            tracks = self.playlist.tracks
+            files = {}
+            items = []
+            for track in tracks:
+                filepath = tracks.path(track)
+                if '://' in filepath:
+                    continue
+                meta = tracks[track]
+                item = {field: meta[field] for field in TRACK_FIELDS}
+                item['id'] = track
+                item['url'] = f'/tracks/{track}{os.path.splitext(filepath)[1].lower()}'
+                items.append(item)
+                files[track] = filepath
+            listing = json.dumps({'name': self.name, 'tracks': items}, separators=(',', ':')).encode('utf-8')
+        # Swapped as whole objects: the server thread only ever reads them
+        self._listing, self._files = listing, files
+        self._published = self._seen = self.playlist.version
+
+    def _run(self, generation, loop, task):
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(task)
+        except asyncio.CancelledError:
+            pass  # stopped
+        except Exception as e:
+            self._state.emit(generation, e)
+        finally:
+            loop.close()
+
+    async def _serve(self, generation, host, port):
+        handlers = set()  # one task per open connection
+        server = await asyncio.start_server(functools.partial(self._handle, handlers), host, port, limit=_MAX_HEAD)
+        bound = server.sockets[0].getsockname()[1]
+        address = lan_address() if host in ('0.0.0.0', '') else host
+        self._state.emit(generation, f'http://{address}:{bound}/')
+        try:
+            await asyncio.get_running_loop().create_future()  # until stop() cancels this task
+        finally:
+            # Clients that are connected (idle keep-alive, mid-file) are cut
+            # off too: stopping means no more files go out
+            server.close()
+            await asyncio.sleep(0)  # connections accepted just now start their handlers
+            while handlers:
+                for task in handlers:
+                    task.cancel()
+                await asyncio.gather(*handlers, return_exceptions=True)
+            await server.wait_closed()
+
+    def _on_state(self, generation, result):
+        if generation != self._generation:
+            return
+        if isinstance(result, Exception):
+            self._loop = self._task = None
+            self._check.stop()
+            self.failed.emit(f'Could not share library: {result}')
+            return
+        self.url = result
+        self.started.emit(result)
+
+    async def _handle(self, handlers, reader, writer):
+        task = asyncio.current_task()
+        handlers.add(task)
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), _IDLE_TIMEOUT)
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError):
+                    break
+                lines = head.decode('latin-1').split('\r\n')
+                parts = lines[0].split()
+                if len(parts) != 3 or not parts[2].startswith('HTTP/'):
+                    await self._send_status(writer, 400, keep_alive=False)
+                    break
+                method, target, version = parts
+                headers = {}
+                for line in lines[1:]:
+                    name, colon, value = line.partition(':')
+                    if colon:
+                        headers[name.strip().lower()] = value.strip()
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection == 'keep-alive' if version == 'HTTP/1.0' else connection != 'close'
+                metrics.count('server.requests')
+                if method not in ('GET', 'HEAD'):
+                    await self._send_status(writer, 405, keep_alive, {'Allow': 'GET, HEAD'})
+                elif not await self._respond(writer, method, unquote(urlsplit(target).path), headers, keep_alive):
+                    break
+                if not keep_alive:
+                    break
+        except OSError:
+            pass  # client went away
+        except asyncio.CancelledError:
+            pass  # the server is stopping; ending normally keeps asyncio from logging it
+        finally:
+            handlers.discard(task)
+            writer.close()
+
+    async def _respond(self, writer, method, path, headers, keep_alive):
+        # Returns False once the connection can no longer be reused
+        if path in ('/', '/library.json'):
+            body = self._listing
+            await self._send_head(writer, 200, keep_alive, {
+                'Content-Type': 'application/json; charset=utf-8', 'Content-Length': len(body),
+                'Cache-Control': 'no-cache'})
+            if method == 'GET':
+                writer.write(body)
+                await writer.drain()
+            return True
+        name = path[len('/tracks/'):] if path.startswith('/tracks/') else ''
+        track = os.path.splitext(name)[0]
+        filepath = self._files.get(int(track)) if track.isdigit() else None
+        if filepath is None:
+            await self._send_status(writer, 404, keep_alive)
+            return True
+        try:
+            f = open(filepath, 'rb')
+        except OSError:
+            await self._send_status(writer, 404, keep_alive)
+            return True
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            requested = parse_range(headers.get('range'), size)
+            fields = {'Content-Type': AUDIO_TYPES.get(os.path.splitext(filepath)[1].lower(), 'application/octet-stream'),
+                      'Accept-Ranges': 'bytes'}
+            if requested is False:
+                fields['Content-Range'] = f'bytes */{size}'
+                await self._send_status(writer, 416, keep_alive, fields)
+                return True
+            if requested is None:
+                status, start, length = 200, 0, size
+            else:
+                start, end = requested
+                status, length = 206, end - start + 1
+                fields['Content-Range'] = f'bytes {start}-{end}/{size}'
+            fields['Content-Length'] = length
+            await self._send_head(writer, status, keep_alive, fields)
+            if method == 'GET' and length:
+                # Clients often drop a connection mid-file to seek elsewhere
+                sent = await asyncio.get_running_loop().sendfile(writer.transport, f, start, length)
+                metrics.count('server.bytes_sent', sent)
+                if sent < length:
+                    return False
+        return True
+
+    async def _send_head(self, writer, status, keep_alive, fields):
+        lines = [f'HTTP/1.1 {status} {_REASONS[status]}', 'Server: MusicPlayer']
+        lines.extend(f'{name}: {value}' for name, value in fields.items())
+        lines.append('Connection: ' + ('keep-alive' if keep_alive else 'close'))
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        await writer.drain()
+
+    async def _send_status(self, writer, status, keep_alive, fields=None):
+        body = f'{status} {_REASONS[status]}\n'.encode('ascii')
+        fields = dict(fields or {}, **{'Content-Type': 'text/plain', 'Content-Length': len(body)})
+        await self._send_head(writer, status, keep_alive, fields)
+        writer.write(body)
+        await writer.drain()
@@ -0,0 +1,520 @@
+import math
+import multiprocessing
+import operator
+import os
+import sys
+import wave
+from array import array
+from collections import deque
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+
+# ReplayGain 2.0 reference level: gain = REFERENCE_LUFS - integrated loudness
+REFERENCE_LUFS = -18.0
+
+# Files the analyzer decodes itself, without libvlc or an external decoder
+ANALYZABLE_EXTENSIONS = ('.wav', '.flac')
+
+# BS.1770 gating
+_BLOCK_SUBBLOCKS = 4  # 400 ms blocks made of 100 ms steps (75% overlap)
+_ABSOLUTE_GATE = 10 ** ((-70.0 + 0.691) / 10)
+_RELATIVE_GATE = 10 ** (-10.0 / 10)
+
+
+def gain_adjustment(meta, album=False):
+    """dB to apply for a track's ReplayGain values (0.0 when unknown), limited
+    so the track's peak does not clip. Album mode falls back to track gain."""
+    gain, peak = meta['track_gain'], meta['track_peak']
+    if album and meta['album_gain'] is not None:
+        gain, peak = meta['album_gain'], meta['album_peak']
+    if gain is None:
+        return 0.0
+    if peak:
+        gain = min(gain, -20 * math.log10(peak))
+    return gain
+
+
+def k_weighting(rate):
+    """BS.1770 K-weighting coefficients for a sample rate: a high shelf
+    (b0, b1, b2, a1, a2) followed by a high-pass with b = (1, -2, 1) (a1, a2)"""
+    k = math.tan(math.pi * 1681.974450955533 / rate)
+    q = 0.7071752369554196
+    vh = 10 ** (3.999843853973347 / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf = ((vh + vb * k / q + k * k) / a0, 2 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0,
+             2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0)
+    k = math.tan(math.pi * 38.13547087602444 / rate)
+    q = 0.5003270373238773
+    a0 = 1 + k / q + k * k
+    return shelf + (2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0)
+
+
+def _k_filter(samples, coeffs, state):
+    """Run one channel through the K-weighting filter; return its sum of squares"""
+    b0, b1, b2, a1, a2, c1, c2 = coeffs
+    z1, z2, w1, w2 = state
+    total = 0.0
+    for x in samples:
+        y = b0 * x + z1
+        z1 = b1 * x - a1 * y + z2
+        z2 = b2 * x - a2 * y
+        v = y + w1
+        w1 = -2.0 * y - c1 * v + w2
+        w2 = y - c2 * v
+        total += v * v
+    state[:] = z1, z2, w1, w2
+    return total
+
+
+def _pcm_samples(data, width):
+    """Interleaved integer samples and the full-scale value for little-endian PCM"""
+    if width == 1:
+        # 8-bit WAV is unsigned
+        return array('h', (value - 128 for value in data)), 128
+    if width == 2:
+        samples = array('h', data)
+        scale = 1 << 15
+    elif width in (3, 4):
+        if width == 3:
+            # Widen 24-bit samples to 32-bit by putting each in the top three bytes
+            padded = bytearray(len(data) // 3 * 4)
+            padded[1::4] = data[0::3]
+            padded[2::4] = data[1::3]
+            padded[3::4] = data[2::3]
+            data = padded
+        samples = array('i')
+        if samples.itemsize != 4:
+            raise ValueError('no 32-bit integer array type')
+        samples.frombytes(data)
+        scale = 1 << 31
+    else:
+        raise ValueError(f'unsupported sample width {width}')
+    if sys.byteorder == 'big':
+        samples.byteswap()
+    return samples, scale
+
+
+def _integrated_loudness(chunks, channels, rate, scale):
+    """(integrated loudness in LUFS, sample peak) of audio given as chunks of
+    per-channel samples of any length, with `scale` the full-scale value.
+
+    Loudness is None when the audio is shorter than one gating block or silent.
+    """
+    coeffs = k_weighting(rate)
+    # Surround channels of a 5.1 layout count more, LFE not at all
+    weights = (1.0, 1.0, 1.0, 0.0, 1.41, 1.41) if channels == 6 else (1.0,) * channels
+    states = [[0.0] * 4 for _ in range(channels)]
+    step = max(1, round(rate / 10))
+    pending = [[] for _ in range(channels)]
+    subblocks = []
+    peak = 0
+    for chunk in chunks:
+        for channel in range(channels):
+            pending[channel].extend(chunk[channel])
+        # Measured in 100 ms steps; an incomplete last step is not part of any block
+        while len(pending[0]) >= step:
+            energy = 0.0
+            for channel in range(channels):
+                samples = pending[channel][:step]
+                del pending[channel][:step]
+                peak = max(peak, max(samples), -min(samples))
+                if weights[channel]:
+                    energy += weights[channel] * _k_filter(samples, coeffs, states[channel])
+            subblocks.append(energy / (step * scale * scale))
+    blocks = [sum(subblocks[i:i + _BLOCK_SUBBLOCKS]) / _BLOCK_SUBBLOCKS
+              for i in range(len(subblocks) - _BLOCK_SUBBLOCKS + 1)]
+    gated = [z for z in blocks if z > _ABSOLUTE_GATE]
+    if gated:
+        threshold = sum(gated) / len(gated) * _RELATIVE_GATE
+        gated = [z for z in gated if z > threshold]
+    loudness = -0.691 + 10 * math.log10(sum(gated) / len(gated)) if gated else None
+    return loudness, min(1.0, peak / scale)
+
+
+def wav_loudness(filepath):
+    """Return (integrated loudness in LUFS, sample peak) of a PCM WAV file.
+
+    Loudness is None when the file is shorter than one gating block or silent.
+    Raises wave.Error or ValueError for files it cannot decode.
+    """
+    with wave.open(filepath, 'rb') as wav:
+        channels = wav.getnchannels()
+        width = wav.getsampwidth()
+        rate = wav.getframerate()
+        step = max(1, round(rate / 10))
+
+        def chunks():
+            while True:
+                data = wav.readframes(step)
+                if len(data) < step * channels * width:
+                    return
+                samples, _ = _pcm_samples(data, width)
+                yield [samples[channel::channels] for channel in range(channels)]
+
+        # 24-bit samples are widened to 32 bits
+        scale = 1 << (8 * (4 if width == 3 else width) - 1)
+        return _integrated_loudness(chunks(), channels, rate, scale)
+
+
+# FLAC decoding (RFC 9639), enough to measure loudness without libFLAC
+
+# Fixed predictor coefficients by order, for the previous samples newest first
+_FIXED_PREDICTORS = ((), (1,), (2, -1), (3, -3, 1), (4, -6, 4, -1))
+_SAMPLE_SIZES = {1: 8, 2: 12, 4: 16, 5: 20, 6: 24, 7: 32}
+
+
+class _BitReader:
+    """Most-significant-bit-first reader over a bytes object"""
+
+    def __init__(self, data, pos=0):
+        self.data = data
+        self.pos = pos  # in bits
+
+    def read(self, n):
+        pos = self.pos
+        end = (pos + n + 7) >> 3
+        if end > len(self.data):
+            raise EOFError('FLAC stream ends inside a frame')
+        self.pos = pos + n
+        return (int.from_bytes(self.data[pos >> 3:end], 'big') >> ((end << 3) - pos - n)) & ((1 << n) - 1)
+
+    def signed(self, n):
+        value = self.read(n)
+        return value - (1 << n) if value >> (n - 1) else value
+
+    def unary(self):
+        """Number of 0 bits before the next 1 bit (which is consumed too)"""
+        data, pos = self.data, self.pos
+        index = pos >> 3
+        value = data[index] & (0xff >> (pos & 7)) if index < len(data) else 0
+        while not value:
+            index += 1
+            if index >= len(data):
+                raise EOFError('FLAC stream ends inside a frame')
+            value = data[index]
+        one = (index << 3) + 8 - value.bit_length()
+        self.pos = one + 1
+        return one - pos
+
+    def align(self):
+        self.pos = (self.pos + 7) & ~7
+
+
+def _flac_residual(bits, block_size, order):
+    method = bits.read(2)
+    if method > 1:
+        raise ValueError('reserved FLAC residual coding method')
+    param_bits, escape = (4, 15) if method == 0 else (5, 31)
+    partition_order = bits.read(4)
+    size = block_size >> partition_order
+    if size << partition_order != block_size or size < order:
+        raise ValueError('invalid FLAC residual partitioning')
+    residual = []
+    for partition in range(1 << partition_order):
+        count = size - order if partition == 0 else size
+        param = bits.read(param_bits)
+        if param == escape:
+            # Unencoded partition: samples of a fixed width (0 means all zero)
+            width = bits.read(5)
+            residual.extend(bits.signed(width) if width else 0 for _ in range(count))
+        else:
+            _rice_partition(bits, count, param, residual)
+    return residual
+
+
+def _rice_partition(bits, count, param, residual):
+    # The bytes ahead are turned into a string of '0'/'1' so that finding
+    # each quotient's stop bit and reading its remainder happen in C
+    data = bits.data
+    append = residual.append
+    window = count * (param + 3) // 8 + 16  # bytes; doubled if it runs short
+    while count:
+        pos = bits.pos
+        start = pos >> 3
+        chunk = data[start:start + window]
+        text = format(int.from_bytes(chunk, 'big'), f'0{len(chunk) * 8}b')
+        find = text.find
+        limit = len(text) - param  # a stop bit at or past this lacks its remainder
+        i = pos & 7
+        while count:
+            one = find('1', i)
+            if one < 0 or one >= limit:
+                break
+            value = ((one - i) << param) | int(text[one + 1:one + 1 + param], 2) if param else one - i
+            append((value >> 1) ^ -(value & 1))
+            i = one + 1 + param
+            count -= 1
+        bits.pos = (start << 3) + i
+        if count:
+            if start + len(chunk) >= len(data):
+                raise EOFError('FLAC stream ends inside a frame')
+            window *= 2
+
+
+def _predict(samples, residual, coeffs, shift):
+    # `samples` holds the warm-up samples and is extended in place
+    order = len(coeffs)
+    if not order:
+        samples.extend(residual)
+        return
+    oldest_first = tuple(reversed(coeffs))
+    append = samples.append
+    for value in residual:
+        append(value + (sum(map(operator.mul, oldest_first, samples[-order:])) >> shift))
+
+
+def _flac_subframe(bits, block_size, sample_bits):
+    header = bits.read(8)
+    if header & 0x80:
+        raise ValueError('invalid FLAC subframe header')
+    kind = (header >> 1) & 0x3f
+    wasted = 0
+    if header & 1:
+        # Low bits that are zero in every sample of the subframe
+        wasted = bits.unary() + 1
+        sample_bits -= wasted
+    if kind == 0:
+        samples = [bits.signed(sample_bits)] * block_size
+    elif kind == 1:
+        samples = [bits.signed(sample_bits) for _ in range(block_size)]
+    elif 8 <= kind <= 12:
+        order = kind - 8
+        samples = [bits.signed(sample_bits) for _ in range(order)]
+        _predict(samples, _flac_residual(bits, block_size, order), _FIXED_PREDICTORS[order], 0)
+    elif kind >= 32:
+        order = kind - 31
+        samples = [bits.signed(sample_bits) for _ in range(order)]
+        precision = bits.read(4) + 1
+        shift = bits.signed(5)
+        if precision == 16 or shift < 0:
+            raise ValueError('invalid FLAC LPC parameters')
+        coeffs = [bits.signed(precision) for _ in range(order)]
+        _predict(samples, _flac_residual(bits, block_size, order), coeffs, shift)
+    else:
+        raise ValueError(f'reserved FLAC subframe type {kind}')
+    if wasted:
+        samples = [sample << wasted for sample in samples]
+    return samples
+
+
+def _flac_frame(bits, sample_bits, channels):
+    """Decode the frame at the (byte-aligned) reader position into per-channel sample lists"""
+    bits.read(16)  # sync code and blocking strategy, checked by the caller
+    size_code = bits.read(4)
+    rate_code = bits.read(4)
+    assignment = bits.read(4)
+    size_bits_code = bits.read(3)
+    bits.read(1)
+    # Frame or sample number, coded like UTF-8 in one to seven bytes
+    ones = 8 - (~bits.read(8) & 0xff).bit_length()
+    if ones == 1 or ones == 8:
+        raise ValueError('invalid FLAC frame number')
+    bits.read(8 * max(0, ones - 1))
+    if size_code == 0:
+        raise ValueError('reserved FLAC block size')
+    elif size_code == 1:
+        block_size = 192
+    elif size_code <= 5:
+        block_size = 576 << (size_code - 2)
+    elif size_code == 6:
+        block_size = bits.read(8) + 1
+    elif size_code == 7:
+        block_size = bits.read(16) + 1
+    else:
+        block_size = 256 << (size_code - 8)
+    if rate_code == 12:
+        bits.read(8)
+    elif rate_code in (13, 14):
+        bits.read(16)
+    elif rate_code == 15:
+        raise ValueError('invalid FLAC sample rate')
+    if size_bits_code:
+        if size_bits_code not in _SAMPLE_SIZES:
+            raise ValueError('reserved FLAC sample size')
+        sample_bits = _SAMPLE_SIZES[size_bits_code]
+    bits.read(8)  # CRC-8 of the header
+    if assignment < 8:
+        if assignment + 1 != channels:
+            raise ValueError('FLAC frame channel count differs from the stream')
+        decoded = [_flac_subframe(bits, block_size, sample_bits) for _ in range(channels)]
+    elif assignment <= 10 and channels == 2:
+        # Stereo decorrelation: the side channel has one extra bit
+        side = 0 if assignment == 9 else 1
+        first, second = (_flac_subframe(bits, block_size, sample_bits + (channel == side)) for channel in range(2))
+        if assignment == 8:  # left, side
+            decoded = [first, [left - diff for left, diff in zip(first, second)]]
+        elif assignment == 9:  # side, right
+            decoded = [[diff + right for diff, right in zip(first, second)], second]
+        else:  # mid, side
+            mids = [(mid << 1) | (diff & 1) for mid, diff in zip(first, second)]
+            decoded = [[(mid + diff) >> 1 for mid, diff in zip(mids, second)],
+                       [(mid - diff) >> 1 for mid, diff in zip(mids, second)]]
+    else:
+        raise ValueError('reserved FLAC channel assignment')
+    bits.align()
+    bits.read(16)  # CRC-16 of the frame
+    return decoded
+
+
+def _flac_stream_info(data):
+    """(offset of the first frame, sample rate, channels, bits per sample,
+    total samples or 0 if unknown) from a FLAC file's header"""
+    pos = 0
+    while data[pos:pos + 3] == b'ID3' and len(data) >= pos + 10:
+        # ID3v2 tags some taggers put in front of the stream
+        size = (data[pos + 6] & 0x7f) << 21 | (data[pos + 7] & 0x7f) << 14 | (data[pos + 8] & 0x7f) << 7 | data[pos + 9] & 0x7f
+        pos += 10 + size + (10 if data[pos + 5] & 0x10 else 0)
+    if data[pos:pos + 4] != b'fLaC':
+        raise ValueError('not a FLAC file')
+    pos += 4
+    info = None
+    while True:
+        if pos + 4 > len(data):
+            raise EOFError('FLAC metadata ends early')
+        header = data[pos]
+        length = int.from_bytes(data[pos + 1:pos + 4], 'big')
+        if header & 0x7f == 0:
+            info = data[pos + 4:pos + 4 + length]
+        pos += 4 + length
+        if header & 0x80:
+            break
+    if info is None or len(info) < 18:
+        raise ValueError('FLAC file without stream info')
+    packed = int.from_bytes(info[10:18], 'big')
+    rate = packed >> 44
+    if not rate:
+        raise ValueError('FLAC stream without a sample rate')
+    return pos, rate, ((packed >> 41) & 7) + 1, ((packed >> 36) & 0x1f) + 1, packed & ((1 << 36) - 1)
+
+
+def decode_flac(data):
+    """(sample rate, channels, bits per sample, iterator of decoded frames as
+    per-channel sample lists) for the bytes of a FLAC file.
+
+    Decoding stops at a truncated last frame or anything after the frames
+    (e.g. an ID3v1 tag). Raises ValueError for streams it cannot decode.
+    """
+    pos, rate, channels, sample_bits, total = _flac_stream_info(data)
+
+    def frames():
+        bits = _BitReader(data, pos * 8)
+        decoded = 0
+        while not total or decoded < total:
+            at = bits.pos >> 3
+            if at + 2 > len(data) or data[at] != 0xff or data[at + 1] & 0xfe != 0xf8:
+                return
+            try:
+                block = _flac_frame(bits, sample_bits, channels)
+            except EOFError:
+                return
+            decoded += len(block[0])
+            yield block
+
+    return rate, channels, sample_bits, frames()
+
+
+def flac_loudness(filepath):
+    """Return (integrated loudness in LUFS, sample peak) of a FLAC file.
+
+    Decoded in Python, so it takes a while per track; analysis runs in idle
+    priority worker processes. Raises ValueError for files it cannot decode.
+    """
+    with open(filepath, 'rb') as f:
+        data = f.read()
+    rate, channels, sample_bits, frames = decode_flac(data)
+    return _integrated_loudness(frames, channels, rate, 1 << (sample_bits - 1))
+
+
+def analyze_file(filepath):
+    """Return (ReplayGain track gain in dB, peak) for a file, or None if it cannot be analyzed"""
+    measure = flac_loudness if filepath.lower().endswith('.flac') else wav_loudness
+    try:
+        loudness, peak = measure(filepath)
+    except (OSError, EOFError, ValueError, wave.Error):
+        return None
+    if loudness is None:
+        return None
+    return REFERENCE_LUFS - loudness, peak
+
+
+def _lower_priority():
+    # Runs in every worker: analysis must never compete with playback
+    try:
+        if hasattr(os, 'nice'):
+            os.nice(19)
+        elif sys.platform == 'win32':
+            import ctypes
+            IDLE_PRIORITY_CLASS = 0x40
+            kernel32 = ctypes.windll.kernel32
+            kernel32.SetPriorityClass(kernel32.GetCurrentProcess(), IDLE_PRIORITY_CLASS)
+    except OSError:
+        pass
+
+
+class LoudnessAnalyzer(QObject):
+    """Measures track loudness in a pool of low-priority worker processes.
+
+    Tracks queued with `analyze` are handed to the pool a few at a time and
+    each result is reported through `analyzed` on the GUI thread. The pool
+    is started on first use and processes run at idle priority, so analysis
+    only uses otherwise spare CPU time.
+    """
+
+    analyzed = pyqtSignal(int, float, float)  # track id, gain in dB, peak
+
+    # Results arrive on the pool's result thread tagged with the queue
+    # generation, so results for a cleared queue can be dropped
+    _result = pyqtSignal(int, int, object)
+
+    def __init__(self, workers=None, parent=None):
+        super().__init__(parent)
+        self.workers = workers or max(1, (os.cpu_count() or 2) // 2)
+        self._pool = None
+        self._queue = deque()
+        self._in_flight = 0
+        self._generation = 0
+        self._result.connect(self._on_result)
+
+    def pending(self):
+        return len(self._queue) + self._in_flight
+
+    def analyze(self, items):
+        """Queue (track id, path) pairs for analysis"""
+        self._queue.extend(items)
+        self._submit()
+
+    def clear(self):
+        """Forget queued tracks; results still being computed are discarded"""
+        self._queue.clear()
+        self._generation += 1
+
+    def shutdown(self):
+        self.clear()
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool = None
+            self._in_flight = 0  # terminated with the pool
+
+    def _submit(self):
+        while self._queue and self._in_flight < self.workers * 2:
+            if self._pool is None:
+                # spawn: forking a process that runs Qt threads is not safe
+                context = multiprocessing.get_context('spawn')
+                self._pool = context.Pool(self.workers, initializer=_lower_priority)
+            track, filepath = self._queue.popleft()
+            generation = self._generation
+            self._in_flight += 1
+            self._pool.apply_async(
+                analyze_file, (filepath,),
+                callback=lambda result, track=track: self._result.emit(generation, track, result),
+                error_callback=lambda error, track=track: self._result.emit(generation, track, None),
+            )
+
+    def _on_result(self, generation, track, result):
+        # A stale result still frees its slot in the pool
+        self._in_flight -= 1
+        if result is not None and generation == self._generation:
+            self.analyzed.emit(track, *result)
+        self._submit()
@@ -0,0 +1,99 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Metrics:
+    """Timers and counters for the player's hot paths.
+
+    `timer(name)` times a block (or every call, used as a decorator) and
+    `record(name, seconds)` adds a duration measured elsewhere; both keep
+    count, total, max and last per name.
+    `count(name)` bumps a counter. Recording is a dict update under a lock,
+    cheap enough to stay on all the time, and safe from worker threads.
+    `snapshot()` returns everything as plain data for the debug panel and
+    for JSON dumps.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._timers = {}  # name -> [count, total, max, last] in seconds
+        self._counters = {}
+        self._started = time.time()
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name, seconds):
+        with self._lock:
+            entry = self._timers.get(name)
+            if entry is None:
+                self._timers[name] = [1, seconds, seconds, seconds]
+            else:
+                entry[0] += 1
+                entry[1] += seconds
+                entry[2] = max(entry[2], seconds)
+                entry[3] = seconds
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def reset(self):
+        with self._lock:
+            self._timers.clear()
+            self._counters.clear()
+            self._started = time.time()
+
+    def snapshot(self):
+        """Timers (in ms) and counters recorded since the start or the last reset"""
+        with self._lock:
+            timers = {
+                name: {'count': count, 'total_ms': total * 1000, 'mean_ms': total / count * 1000,
+                       'max_ms': peak * 1000, 'last_ms': last * 1000}
+                for name, (count, total, peak, last) in sorted(self._timers.items())
+            }
+            counters = dict(sorted(self._counters.items()))
+            started = self._started
+        return {'since': started, 'duration_s': time.time() - started, 'timers': timers, 'counters': counters}
+
+    def dump(self, filepath):
+        """Write a snapshot as JSON"""
+        with open(filepath, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, indent=2)
+
+
+class Profiler:
+    """Opt-in cProfile run around the whole event loop (--cprofile FILE),
+    or started and stopped from the debug panel"""
+
+    def __init__(self):
+        self._profile = None
+
+    @property
+    def running(self):
+        return self._profile is not None
+
+    def start(self):
+        if self._profile is None:
+            import cProfile
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    def stop(self, filepath):
+        """Stop and write pstats data (view with `python -m pstats FILE` or snakeviz)"""
+        if self._profile is not None:
+            self._profile.disable()
+            self._profile.dump_stats(filepath)
+            self._profile = None
+
+
+# Shared by every module, like startup.profile
+metrics = Metrics()
+profiler = Profiler()
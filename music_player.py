@@ -1,18 +1,26 @@
 import sys
-from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QPushButton, QFileDialog, QLabel, QHBoxLayout, QSlider, QComboBox, QTreeWidget, QTreeWidgetItem, QLineEdit, QMessageBox
-import webbrowser
-from PyQt5.QtCore import Qt, QTimer
-import vlc
+from bisect import bisect_left
+from startup import profile
+from metrics import metrics, profiler
+from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QPushButton, QFileDialog, QLabel, QHBoxLayout, QSlider, QComboBox, QTreeView, QLineEdit, QMessageBox, QProgressBar, QSpinBox, QCheckBox, QShortcut
+from PyQt5.QtCore import Qt, QTimer, QEvent
 import os
-from PyQt5.QtGui import QPixmap, QIcon
-from mutagen import File as MutagenFile
-from mutagen.id3 import ID3, APIC, TIT2, TPE1, TALB
-from mutagen.flac import Picture
-from PIL import Image, ImageQt
-from io import BytesIO
-
-# Replace with your actual VLC install path
-os.add_dll_directory(r"D:\VLC")
+from PyQt5.QtGui import QIcon, QKeySequence
+profile.mark('import Qt')
+from library import LibraryCache
+from session import PLAYLIST_EXTENSIONS, NATIVE_EXTENSION, session_path, is_playlist, read_native, read_playlist, write_native, write_playlist
+from playback import PlaybackEngine
+from streaming import StreamSession
+from art_cache import ArtCache
+from dedupe import DuplicateFinder
+from loudness import LoudnessAnalyzer, ANALYZABLE_EXTENSIONS, gain_adjustment
+from tags import read_tags, read_art
+from playlist_model import PlaylistModel
+from play_queue import PlayQueue, REPEAT_OFF, REPEAT_ONE
+from playlist import Playlist
+from scanner import MetadataScanner, AUDIO_EXTENSIONS, iter_audio_files
+from watcher import FolderWatcher
+profile.mark('import player modules')
 
 class MusicPlayer(QWidget):
     def __init__(self):
@@ -36,17 +44,36 @@ class MusicPlayer(QWidget):
         self.sort_mode.setStyleSheet('QComboBox { background-color: white; color: #333; border: 1px solid #ccc; padding: 4px 8px; font-size: 13px; } QComboBox QAbstractItemView { background-color: white; color: #333; }')
         left_layout.addWidget(self.sort_mode)
         
-        # Playlist (QTreeWidget for grouping)
-        self.playlist = []
-        self.metadata_list = []  # Store metadata for sorting
+        # Filter-as-you-type search over title, artist and album
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText('Search title, artist or album')
+        self.search_input.setClearButtonEnabled(True)
+        self.search_input.textChanged.connect(self.filter_playlist)
+        self.search_input.setStyleSheet('QLineEdit { background-color: white; color: #333; border: 1px solid #ccc; padding: 4px 8px; font-size: 13px; }')
+        left_layout.addWidget(self.search_input)
+        
+        # Playlist (model/view tree; rows are built lazily by PlaylistModel)
+        self.playlist = Playlist()  # Tracks plus the sort-mode and search indexes
+        self.queue = PlayQueue(self.visible_tracks)  # Play order of the shown view
         self.current_index = -1
-        self.tree_widget = QTreeWidget()
-        self.tree_widget.setHeaderHidden(True)
-        self.tree_widget.itemClicked.connect(self.select_track)
-        self.tree_widget.setStyleSheet('QTreeWidget { background-color: white; color: #333; border: 1px solid #ddd; font-size: 13px; } QTreeWidget::item { padding: 4px 8px; } QTreeWidget::item:selected { background: #e3f2fd; color: #333; }')
-        left_layout.addWidget(self.tree_widget)
+        self.resume = None  # (track, ms) to continue a restored session from
+        self.library = LibraryCache()
+        # Indexing left over after a fast restore, run a chunk at a time when idle
+        self.index_timer = QTimer(self)
+        self.index_timer.timeout.connect(self.index_step)
+        self.playlist_model = PlaylistModel(self)
+        self.tree_view = QTreeView()
+        self.tree_view.setModel(self.playlist_model)
+        self.tree_view.setHeaderHidden(True)
+        self.tree_view.setUniformRowHeights(True)
+        self.tree_view.clicked.connect(self.select_track)
+        self.tree_view.setStyleSheet('QTreeView { background-color: white; color: #333; border: 1px solid #ddd; font-size: 13px; } QTreeView::item { padding: 4px 8px; } QTreeView::item:selected { background: #e3f2fd; color: #333; }')
+        left_layout.addWidget(self.tree_view)
+        mode = self.sort_mode.currentText()
+        self.playlist_model.set_view(mode, self.playlist.views[mode], self.tracks)
         
         main_layout.addLayout(left_layout, 1)  # 1 = stretch factor
+        profile.mark('build playlist view')
         
         # Right side - Player controls
         right_layout = QVBoxLayout()
@@ -56,6 +83,7 @@ class MusicPlayer(QWidget):
         self.album_art_label.setFixedSize(180, 180)
         self.album_art_label.setStyleSheet('background-color: #f0f0f0; border: 1px solid #ddd;')
         self.album_art_label.setAlignment(Qt.AlignCenter)
+        self.art_cache = ArtCache()
         right_layout.addWidget(self.album_art_label, alignment=Qt.AlignCenter)
 
         # Song metadata
@@ -80,18 +108,94 @@ class MusicPlayer(QWidget):
         self.stream_url_input.setStyleSheet('QLineEdit { background-color: white; color: #333; border: 1px solid #ccc; padding: 6px 8px; font-size: 12px; }')
         stream_layout.addWidget(self.stream_url_input)
         
+        self.stream_buffer = QSpinBox()
+        self.stream_buffer.setRange(1, 60)
+        self.stream_buffer.setValue(3)
+        self.stream_buffer.setSuffix(' s')
+        self.stream_buffer.setToolTip('Network buffer (read-ahead) for streams')
+        self.stream_buffer.setStyleSheet('QSpinBox { background-color: white; color: #333; border: 1px solid #ccc; padding: 5px 4px; font-size: 12px; }')
+        stream_layout.addWidget(self.stream_buffer)
+        
         self.connect_button = QPushButton('Connect')
         self.connect_button.setStyleSheet('QPushButton { background-color: #4a90e2; color: white; border: none; padding: 6px 12px; font-size: 12px; } QPushButton:hover { background-color: #357abd; }')
         self.connect_button.clicked.connect(self.connect_to_stream)
         stream_layout.addWidget(self.connect_button)
         
+        # Serve this playlist's files to other players (they Connect to the shown URL)
+        self.share_button = QPushButton('Share')
+        self.share_button.setCheckable(True)
+        self.share_button.setToolTip('Share the library with other players on the network')
+        self.share_button.setStyleSheet('QPushButton { background-color: #6c757d; color: white; border: none; padding: 6px 12px; font-size: 12px; } QPushButton:hover { background-color: #5a6268; } QPushButton:checked { background-color: #28a745; }')
+        self.share_button.toggled.connect(self.set_sharing)
+        stream_layout.addWidget(self.share_button)
+        self.server = None  # LibraryServer, created when sharing is first turned on
+        self.share_port = None  # --serve PORT, else library_server.DEFAULT_PORT
+        
         right_layout.addLayout(stream_layout)
         
         # Local file button (optional)
         self.open_button = QPushButton('Open Local Files')
         self.open_button.setStyleSheet('QPushButton { background-color: #6c757d; color: white; border: none; padding: 6px 12px; font-size: 12px; margin-top: 8px; } QPushButton:hover { background-color: #5a6268; }')
         self.open_button.clicked.connect(self.open_files)
-        right_layout.addWidget(self.open_button, alignment=Qt.AlignCenter)
+        
+        self.add_folder_button = QPushButton('Add Folder')
+        self.add_folder_button.setStyleSheet('QPushButton { background-color: #6c757d; color: white; border: none; padding: 6px 12px; font-size: 12px; margin-top: 8px; } QPushButton:hover { background-color: #5a6268; }')
+        self.add_folder_button.clicked.connect(self.add_folder)
+        
+        self.save_playlist_button = QPushButton('Save Playlist')
+        self.save_playlist_button.setStyleSheet('QPushButton { background-color: #6c757d; color: white; border: none; padding: 6px 12px; font-size: 12px; margin-top: 8px; } QPushButton:hover { background-color: #5a6268; }')
+        self.save_playlist_button.clicked.connect(self.save_playlist)
+        
+        import_layout = QHBoxLayout()
+        import_layout.addWidget(self.open_button)
+        import_layout.addWidget(self.add_folder_button)
+        import_layout.addWidget(self.save_playlist_button)
+        right_layout.addLayout(import_layout)
+        
+        # Duplicate detection; copies can be hidden from the playlist views
+        self.find_duplicates_button = QPushButton('Find Duplicates')
+        self.find_duplicates_button.setStyleSheet('QPushButton { background-color: #6c757d; color: white; border: none; padding: 6px 12px; font-size: 12px; } QPushButton:hover { background-color: #5a6268; }')
+        self.find_duplicates_button.clicked.connect(self.find_duplicates)
+        
+        self.hide_duplicates = QCheckBox('Hide duplicates')
+        self.hide_duplicates.setToolTip('Show one copy of each song found by Find Duplicates')
+        self.hide_duplicates.setStyleSheet('QCheckBox { color: #333; font-size: 12px; }')
+        self.hide_duplicates.toggled.connect(self.apply_filter)
+        
+        dedupe_layout = QHBoxLayout()
+        dedupe_layout.addWidget(self.find_duplicates_button)
+        dedupe_layout.addWidget(self.hide_duplicates)
+        right_layout.addLayout(dedupe_layout)
+        
+        self.duplicates = DuplicateFinder(self.library, parent=self)
+        self.duplicates.finished.connect(self.duplicates_found)
+        self.duplicates.progress.connect(self.label.setText)
+        
+        # Background scan progress (hidden while idle)
+        scan_layout = QHBoxLayout()
+        
+        self.scan_progress = QProgressBar()
+        self.scan_progress.setTextVisible(True)
+        self.scan_progress.setStyleSheet('QProgressBar { background-color: #e9ecef; color: #333; border: none; height: 14px; font-size: 11px; text-align: center; } QProgressBar::chunk { background-color: #4a90e2; }')
+        scan_layout.addWidget(self.scan_progress)
+        
+        self.cancel_scan_button = QPushButton('Cancel')
+        self.cancel_scan_button.setStyleSheet('QPushButton { background-color: #6c757d; color: white; border: none; padding: 2px 8px; font-size: 11px; } QPushButton:hover { background-color: #5a6268; }')
+        scan_layout.addWidget(self.cancel_scan_button)
+        
+        self.scan_progress.hide()
+        self.cancel_scan_button.hide()
+        right_layout.addLayout(scan_layout)
+        
+        self.scanner = MetadataScanner(self.library, read_tags, parent=self)
+        self.scanner.batch_ready.connect(self.add_scanned_tracks)
+        self.scanner.progress.connect(self.update_scan_progress)
+        self.scanner.finished.connect(self.scan_finished)
+        self.cancel_scan_button.clicked.connect(self.scanner.cancel)
+        
+        # Files on disk are watched; changes update only the affected tracks
+        self.watcher = FolderWatcher(self.library, read_tags, parent=self)
+        self.watcher.changed.connect(self.files_changed)
         
         # GitHub integration buttons
         github_layout = QHBoxLayout()
@@ -111,6 +215,7 @@ class MusicPlayer(QWidget):
         main_layout.addLayout(right_layout, 1)  # 1 = stretch factor
         
         self.layout.addLayout(main_layout)
+        profile.mark('build library and stream controls')
 
         # Controls layout
         controls_layout = QHBoxLayout()
@@ -151,6 +256,22 @@ class MusicPlayer(QWidget):
         self.forward_button.setEnabled(False)
         controls_layout.addWidget(self.forward_button)
 
+        toggle_style = btn_style + ' QPushButton:checked { background: #d0e2f7; border-color: #4a90e2; }'
+
+        self.shuffle_button = QPushButton('🔀')
+        self.shuffle_button.setToolTip('Shuffle')
+        self.shuffle_button.setCheckable(True)
+        self.shuffle_button.setStyleSheet(toggle_style)
+        self.shuffle_button.toggled.connect(self.set_shuffle)
+        controls_layout.addWidget(self.shuffle_button)
+
+        self.repeat_button = QPushButton('🔁')
+        self.repeat_button.setToolTip('Repeat: off')
+        self.repeat_button.setCheckable(True)
+        self.repeat_button.setStyleSheet(toggle_style)
+        self.repeat_button.clicked.connect(self.cycle_repeat)
+        controls_layout.addWidget(self.repeat_button)
+
         self.layout.addLayout(controls_layout)
 
         # Progress slider
@@ -182,344 +303,711 @@ class MusicPlayer(QWidget):
         self.volume_slider.valueChanged.connect(self.set_volume)
         self.volume_slider.setStyleSheet('QSlider::groove:horizontal { height: 6px; background: #e9ecef; border-radius: 3px; } QSlider::handle:horizontal { background: #4a90e2; border: 1px solid #ccc; width: 12px; margin: -3px 0; border-radius: 6px; } QSlider::sub-page:horizontal { background: #4a90e2; border-radius: 3px; }')
         volume_layout.addWidget(self.volume_slider)
+        self.normalization = QComboBox()
+        self.normalization.addItems(['No Normalization', 'Track Gain', 'Album Gain'])
+        self.normalization.setToolTip('Even out loudness between tracks (ReplayGain)')
+        self.normalization.currentIndexChanged.connect(self.set_volume)
+        self.normalization.setStyleSheet('QComboBox { background-color: white; color: #333; border: 1px solid #ccc; padding: 2px 6px; font-size: 12px; } QComboBox QAbstractItemView { background-color: white; color: #333; }')
+        volume_layout.addWidget(self.normalization)
         self.layout.addLayout(volume_layout)
 
-        # Timer for updating progress
-        self.timer = QTimer(self)
-        self.timer.setInterval(500)
-        self.timer.timeout.connect(self.update_progress)
+        # Progress is pushed by the playback engine; repaints are coalesced to
+        # at most one per display frame
+        self.position = (0, -1)
+        self.progress_refresh = QTimer(self)
+        self.progress_refresh.setSingleShot(True)
+        self.progress_refresh.timeout.connect(self.update_progress)
 
         self.setLayout(self.layout)
-        self.media_player = None
+        profile.mark('build playback controls')
+        # One VLC instance for the whole session; the engine prepares the next
+        # track while the current one plays and advances at end of track
+        self.engine = PlaybackEngine(self)
+        self.engine.next_track = self.next_queue_item
+        self.engine.gain_for = self.track_gain
+        self.engine.track_started.connect(self.track_auto_started)
+        self.engine.queue_finished.connect(self.queue_finished)
+        self.engine.error.connect(self.label.setText)
+        self.engine.position_changed.connect(self.playback_position_changed)
+        self.engine.buffering.connect(self.playback_buffering)
+        # The next track is prepared again once the view stops changing
+        # (typing in the search box, scanned batches), not on every change
+        self.preload_timer = QTimer(self)
+        self.preload_timer.setSingleShot(True)
+        self.preload_timer.setInterval(300)
+        self.preload_timer.timeout.connect(self.engine.refresh_preload)
+        
+        # Stream connections are probed off the GUI thread and reconnect on drops
+        self.stream_session = StreamSession(self.engine, parent=self)
+        self.stream_session.connected.connect(self.stream_connected)
+        self.stream_session.failed.connect(self.stream_failed)
+        self.stream_session.status.connect(self.label.setText)
+        self.stream_session.title_changed.connect(self.stream_title_changed)
         self.is_streaming = False
         self.stream_url = None
+        
+        # Tracks without ReplayGain tags are measured by low-priority worker processes
+        self.loudness = LoudnessAnalyzer(parent=self)
+        self.loudness.analyzed.connect(self.loudness_analyzed)
+        
+        # Timers and counters of the hot paths; the panel is created when first opened
+        self.debug_panel = None
+        QShortcut(QKeySequence('Ctrl+Shift+D'), self, self.show_debug_panel)
         self.setStyleSheet('background-color: #fafafa;')
+        profile.mark('create playback engine')
+
+    @property
+    def tracks(self):
+        return self.playlist.tracks
 
     def connect_to_stream(self):
         url = self.stream_url_input.text().strip()
         if not url:
-            QMessageBox.warning(self, 'Error', 'Please enter a stream URL')
+            self.label.setText('Please enter a stream URL')
             return
         
-        try:
-            # Test the URL by creating a media object
-            media = vlc.Media(url)
-            if media:
-                self.stream_url = url
-                self.is_streaming = True
-                self.playlist = [url]
-                self.metadata_list = [{'title': 'Streaming Audio', 'artist': 'Live Stream', 'album': 'Network Stream', 'tracknumber': '1'}]
-                self.current_index = 0
-                self.label.setText(f'Connected to: {url}')
-                self.update_playlist_view()
-                self.play_button.setEnabled(True)
-                self.stop_button.setEnabled(False)
-                self.forward_button.setEnabled(False)  # No forward/backward for streams
-                self.backward_button.setEnabled(False)
-                self.progress_slider.setValue(0)
-                self.update_metadata_and_art()
-                QMessageBox.information(self, 'Success', f'Connected to stream: {url}')
-            else:
-                QMessageBox.warning(self, 'Error', 'Could not connect to the stream URL')
-        except Exception as e:
-            QMessageBox.warning(self, 'Error', f'Failed to connect to stream: {str(e)}')
+        # The probe runs in the background; stream_connected/stream_failed report back
+        self.connect_button.setEnabled(False)
+        self.label.setText(f'Connecting to: {url}')
+        self.stream_session.open(url, buffer_ms=self.stream_buffer.value() * 1000)
+
+    def stream_connected(self, info, reconnect):
+        self.connect_button.setEnabled(True)
+        url = self.stream_session.url
+        if 'library' in info:
+            self.open_remote_library(url, info)
+            return
+        if reconnect:
+            self.label.setText(f'Reconnected to: {url}')
+            self.play_music()
+            return
+        # The stream replaces the playlist, including an import still running
+        self.reset_playlist(close_stream=False)
+        self.stream_url = url
+        self.is_streaming = True
+        self.playlist.add(url, {'title': info['title'] or 'Streaming Audio', 'artist': info['name'] or 'Live Stream',
+                                'album': info['genre'] or 'Network Stream', 'tracknumber': '1',
+                                'duration': 0.0, 'bitrate': 0, 'art_hash': '',
+                                'track_gain': None, 'track_peak': None, 'album_gain': None, 'album_peak': None})
+        self.engine.refresh_preload()
+        self.current_index = 0
+        self.label.setText(f'Connected to: {url}')
+        self.update_playlist_view()
+        self.play_button.setEnabled(True)
+        self.stop_button.setEnabled(False)
+        self.forward_button.setEnabled(False)  # No forward/backward for streams
+        self.backward_button.setEnabled(False)
+        self.progress_slider.setValue(0)
+        self.update_metadata_and_art()
+
+    def open_remote_library(self, url, info):
+        # Another player's shared library: its tracks become the playlist and
+        # play over HTTP like local files (seekable, no reconnect handling)
+        self.reset_playlist()
+        self.add_scanned_tracks(info['library'])
+        if self.tracks:
+            self.label.setText(f"Connected to {info['name'] or url}: {len(self.tracks)} tracks")
+        else:
+            self.label.setText(f"{info['name'] or url} is not sharing any tracks")
+
+    def set_sharing(self, enabled):
+        if enabled:
+            if self.server is None:
+                from library_server import LibraryServer
+                self.server = LibraryServer(self.playlist, parent=self)
+                self.server.started.connect(self.sharing_started)
+                self.server.failed.connect(self.sharing_failed)
+            from library_server import DEFAULT_PORT
+            self.server.start(port=self.share_port or DEFAULT_PORT)
+        elif self.server is not None and self.server.running:
+            self.server.stop()
+            self.share_button.setToolTip('Share the library with other players on the network')
+            self.label.setText('Stopped sharing the library')
+
+    def sharing_started(self, url):
+        self.share_button.setToolTip(f'Sharing at {url}')
+        self.label.setText(f'Sharing library at {url}')
+
+    def sharing_failed(self, message):
+        self.share_button.setChecked(False)
+        self.label.setText(message)
+
+    def stream_failed(self, message):
+        self.connect_button.setEnabled(True)
+        self.label.setText(message)
+
+    def stream_title_changed(self, title):
+        if not self.is_streaming or not self.tracks:
+            return
+        with self.playlist_model.updating():
+            self.playlist.update(0, {'title': title})
+        self.title_label.setText(f'Title: {title}')
 
     def open_files(self):
-        files, _ = QFileDialog.getOpenFileNames(self, 'Open Music Files', '', 'Audio Files (*.mp3 *.flac *.wav *.ogg *.m4a)')
-        if files:
-            self.is_streaming = False
-            self.stream_url = None
-            self.playlist = files
-            self.metadata_list = [self.extract_metadata(f) for f in files]
+        audio = ' '.join('*' + ext for ext in AUDIO_EXTENSIONS)
+        playlists = ' '.join('*' + ext for ext in PLAYLIST_EXTENSIONS)
+        files, _ = QFileDialog.getOpenFileNames(self, 'Open Music Files', '',
+                                                f'Audio Files and Playlists ({audio} {playlists});;Audio Files ({audio});;Playlists ({playlists})')
+        if not files:
+            return
+        if len(files) == 1 and files[0].lower().endswith(NATIVE_EXTENSION):
+            # Native playlists carry their metadata: no scan needed
+            try:
+                store, _ = read_native(files[0])
+            except (OSError, ValueError) as e:
+                self.label.setText(f'Could not read playlist: {e}')
+                return
+            self.load_tracks(store)
+            return
+        paths = []
+        for filepath in files:
+            if is_playlist(filepath):
+                try:
+                    paths.extend(read_playlist(filepath))
+                except (OSError, ValueError) as e:
+                    self.label.setText(f'Could not read playlist: {e}')
+            else:
+                paths.append(filepath)
+        if paths:
+            self.import_paths(paths)
+
+    def save_playlist(self):
+        filepath, selected = QFileDialog.getSaveFileName(
+            self, 'Save Playlist', '', 'M3U8 Playlist (*.m3u8);;M3U Playlist (*.m3u);;Music Player Playlist (*.mpl)')
+        if not filepath:
+            return
+        if not is_playlist(filepath):
+            filepath += selected[selected.rindex('*') + 1:-1]
+        try:
+            write_playlist(filepath, self.tracks, self.visible_tracks())
+        except OSError as e:
+            self.label.setText(f'Could not save playlist: {e}')
+            return
+        self.label.setText(f'Saved playlist: {filepath}')
+
+    def visible_tracks(self):
+        # Tracks in the order shown, limited to the current search results
+        return self.playlist.ordered(self.sort_mode.currentText(), self.search_input.text(),
+                                     self.hide_duplicates.isChecked())
+
+    @metrics.timer('session.restore')
+    def restore_session(self):
+        try:
+            store, state = read_native(session_path())
+        except (OSError, ValueError):
+            return
+        self.load_tracks(store, state)
+
+    @metrics.timer('session.save')
+    def save_session(self):
+        if self.is_streaming:
+            return
+        tracks = list(self.tracks)
+        current = bisect_left(tracks, self.current_index)
+        if self.engine.current_track is not None:
+            position = self.position[0]
+        else:
+            position = self.resume[1] if self.resume else 0
+        state = {
+            'current': current if current < len(tracks) and tracks[current] == self.current_index else -1,
+            'position': max(0, position),
+            'volume': self.volume_slider.value(),
+            'normalization': self.normalization.currentIndex(),
+            'sort_mode': self.sort_mode.currentText(),
+            'shuffle': self.queue.shuffle,
+            'repeat': self.queue.repeat,
+            'watch_roots': self.watcher.roots,
+        }
+        try:
+            write_native(session_path(), self.tracks, tracks, state)
+        except OSError:
+            pass
+
+    def load_tracks(self, store, state=None):
+        # Replace the playlist with a ready TrackStore (restored session or
+        # native playlist). Only the shown sort mode is indexed before the
+        # first paint; other modes and search are filled in when idle.
+        state = state or {}
+        self.reset_playlist()
+        if state.get('sort_mode') in self.playlist.views.modes:
+            self.sort_mode.setCurrentText(state['sort_mode'])
+        if isinstance(state.get('volume'), int):
+            self.volume_slider.setValue(state['volume'])
+        if state.get('normalization') in range(self.normalization.count()):
+            self.normalization.setCurrentIndex(state['normalization'])
+        if state.get('repeat') in (0, 1, 2):
+            self.set_repeat(state['repeat'])
+        self.shuffle_button.setChecked(state.get('shuffle') is True)
+        mode = self.sort_mode.currentText()
+        records = self.playlist.load(store, mode)
+        self.playlist_model.set_view(mode, self.playlist.views[mode], self.tracks)
+        self.queue.invalidate()
+        self.index_timer.start(0)
+        self.queue_loudness((track, meta) for track, meta, _ in records)
+        self.watcher.watch_files(store.path(track) for track, _, _ in records)
+        roots = state.get('watch_roots')
+        if isinstance(roots, list):
+            self.watcher.add_roots(root for root in roots if isinstance(root, str))
+        if not self.tracks:
+            return
+        current = state.get('current', 0)
+        if not isinstance(current, int) or current not in self.tracks:
+            current = 0
+        self.current_index = current
+        position = state.get('position', 0)
+        if isinstance(position, int) and position > 0:
+            self.resume = (current, position)
+            self.elapsed_label.setText(self.format_time(position))
+        self.label.setText(self.tracks.path(self.current_index))
+        self.play_button.setEnabled(True)
+        self.forward_button.setEnabled(len(self.tracks) > 1)
+        self.backward_button.setEnabled(len(self.tracks) > 1)
+        self.update_metadata_and_art()
+        self.highlight_current_song()
+
+    def index_step(self):
+        if not self.playlist.index_step():
+            self.index_timer.stop()
+
+    def finish_indexing(self):
+        # Needed before anything reads another sort mode or the search index
+        self.playlist.finish_indexing()
+        self.index_timer.stop()
+
+    def add_folder(self):
+        folder = QFileDialog.getExistingDirectory(self, 'Add Music Folder')
+        if folder:
+            self.import_paths(iter_audio_files([folder]), append=True)
+            self.watcher.add_roots([folder])
+
+    def import_paths(self, paths, append=False):
+        # paths may be a list or a lazy generator (folder walks); either way
+        # tags are parsed off the GUI thread and arrive via add_scanned_tracks
+        if self.is_streaming or not append:
+            self.reset_playlist()
+        if not self.tracks:
+            self.label.setText('Scanning...')
+        if hasattr(paths, '__len__'):
+            self.scan_progress.setRange(0, len(paths))
+        else:
+            self.scan_progress.setRange(0, 0)
+        self.scan_progress.setValue(0)
+        self.scan_progress.show()
+        self.cancel_scan_button.show()
+        self.scanner.scan(paths)
+
+    def reset_playlist(self, close_stream=True):
+        # Batches from a running import must not land in the new playlist.
+        # close_stream=False keeps the stream session that is replacing it.
+        self.scanner.cancel()
+        if close_stream:
+            self.stream_session.close()
+        self.index_timer.stop()
+        self.loudness.clear()
+        self.duplicates.cancel()
+        self.watcher.clear()
+        self.find_duplicates_button.setEnabled(True)
+        self.is_streaming = False
+        self.stream_url = None
+        self.playlist.clear()
+        self.engine.forget_queue()
+        self.current_index = -1
+        self.resume = None
+        self.update_playlist_view()
+        self.play_button.setEnabled(False)
+        self.stop_button.setEnabled(False)
+        self.forward_button.setEnabled(False)
+        self.backward_button.setEnabled(False)
+        self.progress_slider.setValue(0)
+        self.update_metadata_and_art()
+
+    @metrics.timer('playlist.add_batch')
+    def add_scanned_tracks(self, batch):
+        # Tracks are inserted into the prebuilt indexes; the view keeps its
+        # expanded groups and selection
+        with self.playlist_model.updating():
+            records = self.playlist.add_many(batch)
+        self.queue.invalidate()
+        self.watcher.watch_files(path for path, _ in batch)
+        self.queue_loudness(records)
+        if self.search_input.text() or self.hide_duplicates.isChecked():
+            # Newly scanned tracks join the current search results
+            self.apply_filter()
+        if self.current_index == -1 and self.tracks:
+            # First batch: make the queue playable right away
             self.current_index = 0
-            self.label.setText(self.playlist[self.current_index])
-            self.update_playlist_view()
+            self.label.setText(self.tracks.path(self.current_index))
             self.play_button.setEnabled(True)
-            self.stop_button.setEnabled(False)
-            self.forward_button.setEnabled(len(self.playlist) > 1)
-            self.backward_button.setEnabled(len(self.playlist) > 1)
-            self.progress_slider.setValue(0)
             self.update_metadata_and_art()
+            self.highlight_current_song()
+        self.forward_button.setEnabled(len(self.tracks) > 1)
+        self.backward_button.setEnabled(len(self.tracks) > 1)
+        self.preload_timer.start()
 
-    def update_playlist_view(self):
-        mode = self.sort_mode.currentText()
-        self.tree_widget.clear()
-        self.tree_widget.setColumnCount(1)
-        
-        # Prepare data for grouping
+    @metrics.timer('playlist.apply_file_changes')
+    def files_changed(self, updated, removed, moved):
+        # Reported by the folder watcher after the library was updated; the
+        # indexes are patched in place so the views keep their state
+        if self.is_streaming:
+            return
+        self.finish_indexing()
+        by_path = self.playlist.track_for_path()
+        removed = [by_path.pop(filepath) for filepath in removed if filepath in by_path]
+        if self.current_index in removed:
+            # Continue with whatever would have played next
+            successor = self.queue.next(self.current_index)
+            while successor in removed and successor != self.current_index:
+                successor = self.queue.next(successor)
+            self.current_index = -1 if successor in removed or successor is None else successor
+        added = []
+        with self.playlist_model.updating():
+            for old, filepath in moved:
+                track = by_path.pop(old, None)
+                if track is not None:
+                    self.playlist.move(track, filepath)
+                    by_path[filepath] = track
+            for track in removed:
+                self.playlist.remove(track)
+            for filepath, meta in updated:
+                track = by_path.get(filepath)
+                if track is None:
+                    added.append((filepath, meta))
+                    continue
+                self.playlist.update(track, dict(meta))
+        self.queue.invalidate()
+        if added and not self.scanner.is_running():
+            # New files found while an import is running are left to the
+            # import; the watcher reports any it missed on its next check
+            self.add_scanned_tracks(added)
+        else:
+            self.apply_filter()
+        if self.current_index != -1:
+            self.label.setText(self.tracks.path(self.current_index))
+        self.play_button.setEnabled(self.current_index != -1)
+        self.forward_button.setEnabled(len(self.tracks) > 1)
+        self.backward_button.setEnabled(len(self.tracks) > 1)
+        self.update_metadata_and_art()
+        self.engine.refresh_preload()
+
+    def queue_loudness(self, records):
+        # Only files without ReplayGain tags that can be decoded locally
         items = []
-        for i, meta in enumerate(self.metadata_list):
-            item = dict(meta)
-            item['index'] = i
-            items.append(item)
-        
-        # Helper: sort by track number then title
-        def sort_key(x):
-            try:
-                track = int(x.get('tracknumber', '0').split('/')[0])
-            except Exception:
-                track = 0
-            return (x.get('album', ''), track, x.get('title', ''))
-        
-        if mode == 'All Songs':
-            # Show as flat list with file icons
-            for item in sorted(items, key=sort_key):
-                node = QTreeWidgetItem([f"📄 {item['title']}"])
-                node.setData(0, Qt.UserRole, item['index'])
-                self.tree_widget.addTopLevelItem(node)
-                
-        elif mode == 'By Artist & Album':
-            # File system structure: Artist/Album/Song
-            artists = {}
-            for item in items:
-                artist = item['artist']
-                album = item['album']
-                if artist not in artists:
-                    artists[artist] = {}
-                if album not in artists[artist]:
-                    artists[artist][album] = []
-                artists[artist][album].append(item)
-            
-            for artist in sorted(artists):
-                artist_node = QTreeWidgetItem([f"📁 {artist}"])
-                artist_node.setFlags(artist_node.flags() & ~Qt.ItemIsSelectable)
-                self.tree_widget.addTopLevelItem(artist_node)
-                
-                for album in sorted(artists[artist]):
-                    album_node = QTreeWidgetItem([f"📁 {album}"])
-                    album_node.setFlags(album_node.flags() & ~Qt.ItemIsSelectable)
-                    artist_node.addChild(album_node)
-                    
-                    for song in sorted(artists[artist][album], key=sort_key):
-                        song_node = QTreeWidgetItem([f"🎵 {song['title']}"])
-                        song_node.setData(0, Qt.UserRole, song['index'])
-                        album_node.addChild(song_node)
-                        
-        elif mode == 'By Album':
-            # File system structure: Album/Song
-            albums = {}
-            for item in items:
-                album = item['album']
-                if album not in albums:
-                    albums[album] = []
-                albums[album].append(item)
-            
-            for album in sorted(albums):
-                album_node = QTreeWidgetItem([f"📁 {album}"])
-                album_node.setFlags(album_node.flags() & ~Qt.ItemIsSelectable)
-                self.tree_widget.addTopLevelItem(album_node)
-                
-                for song in sorted(albums[album], key=sort_key):
-                    song_node = QTreeWidgetItem([f"🎵 {song['title']} - {song['artist']}"])
-                    song_node.setData(0, Qt.UserRole, song['index'])
-                    album_node.addChild(song_node)
-                    
-        elif mode == 'By Artist':
-            # File system structure: Artist/Song
-            artists = {}
-            for item in items:
-                artist = item['artist']
-                if artist not in artists:
-                    artists[artist] = []
-                artists[artist].append(item)
-            
-            for artist in sorted(artists):
-                artist_node = QTreeWidgetItem([f"📁 {artist}"])
-                artist_node.setFlags(artist_node.flags() & ~Qt.ItemIsSelectable)
-                self.tree_widget.addTopLevelItem(artist_node)
-                
-                for song in sorted(artists[artist], key=sort_key):
-                    song_node = QTreeWidgetItem([f"🎵 {song['title']} - {song['album']}"])
-                    song_node.setData(0, Qt.UserRole, song['index'])
-                    artist_node.addChild(song_node)
-        
-        self.tree_widget.expandAll()
-        # Highlight current song
+        for track, meta in records:
+            if meta['track_gain'] is None:
+                filepath = self.tracks.path(track)
+                if filepath.lower().endswith(ANALYZABLE_EXTENSIONS) and '://' not in filepath:
+                    items.append((track, filepath))
+        if items:
+            self.loudness.analyze(items)
+
+    def loudness_analyzed(self, track, gain, peak):
+        # Takes effect the next time the track starts, never mid-track
+        metrics.count('loudness.analyzed')
+        if track in self.tracks:
+            self.playlist.set_loudness(track, gain, peak)
+            self.library.set_loudness(self.tracks.path(track), gain, peak)
+
+    def find_duplicates(self):
+        if self.is_streaming or not self.tracks:
+            return
+        self.find_duplicates_button.setEnabled(False)
+        self.label.setText('Looking for duplicates...')
+        # Only local files: tracks from a shared library are URLs
+        self.duplicates.find((track, self.tracks.path(track), self.tracks[track]['duration'])
+                             for track in self.tracks if '://' not in self.tracks.path(track))
+
+    def duplicates_found(self, groups):
+        self.find_duplicates_button.setEnabled(True)
+        groups = [[track for track in group if track in self.tracks] for group in groups]
+        groups = [group for group in groups if len(group) > 1]
+        copies = set()
+        lines = []
+        for group in groups:
+            # Keep the highest bitrate copy, then the one added first
+            keep = max(group, key=lambda track: (self.tracks[track]['bitrate'], -track))
+            copies.update(track for track in group if track != keep)
+            meta = self.tracks[keep]
+            lines.append(f"{meta['artist']} - {meta['title']}")
+            lines.extend(('  * ' if track == keep else '    ') + self.tracks.path(track) for track in group)
+        self.playlist.hidden = copies
+        self.apply_filter()
+        if not groups:
+            self.label.setText('No duplicates found')
+            return
+        summary = f'Found duplicates of {len(groups)} song(s): {len(copies)} extra copies'
+        self.label.setText(summary)
+        report = QMessageBox(QMessageBox.Information, 'Duplicates', summary, QMessageBox.Ok, self)
+        report.setInformativeText('Check "Hide duplicates" to show one copy of each (marked *).')
+        report.setDetailedText('\n'.join(lines))
+        report.setAttribute(Qt.WA_DeleteOnClose)
+        report.show()
+
+    def track_gain(self, track):
+        mode = self.normalization.currentIndex()
+        if mode == 0 or self.is_streaming or track not in self.tracks:
+            return 0.0
+        return gain_adjustment(self.tracks[track], album=mode == 2)
+
+    def update_scan_progress(self, done, total):
+        if total < 0:
+            # Unknown total (folder walk in progress): show a busy indicator
+            self.scan_progress.setRange(0, 0)
+            if self.current_index == -1:
+                self.label.setText(f'Scanning... {done} files')
+        else:
+            self.scan_progress.setRange(0, total)
+            self.scan_progress.setValue(done)
+
+    def scan_finished(self, cancelled):
+        self.scan_progress.hide()
+        self.cancel_scan_button.hide()
+        if not self.tracks:
+            self.label.setText('Scan cancelled' if cancelled else 'No playable files found')
+
+    def update_playlist_view(self):
+        # Every sort mode is kept indexed, so switching is just a model reset
+        # (not a decorator: Qt would pass the combo box index through it)
+        with metrics.timer('view.switch_mode'):
+            self.finish_indexing()
+            mode = self.sort_mode.currentText()
+            self.playlist_model.set_view(mode, self.playlist.views[mode], self.tracks)
+            self.queue.invalidate()
+            self.preload_timer.start()
+            self.highlight_current_song()
+
+    def shown_tracks(self):
+        # Current search results without hidden duplicate copies (None: every track)
+        return self.playlist.matches(self.search_input.text(), self.hide_duplicates.isChecked())
+
+    def apply_filter(self):
+        self.filter_playlist(self.search_input.text())
+
+    @metrics.timer('view.filter')
+    def filter_playlist(self, text):
+        # The search index answers in well under a frame; the model then
+        # hides non-matching rows with a layout change instead of a rebuild
+        self.finish_indexing()
+        results = self.shown_tracks()
+        self.playlist_model.set_filter(results)
+        self.queue.invalidate()
+        self.preload_timer.start()
+        if results is not None and len(results) <= 200:
+            self.tree_view.expandAll()
         self.highlight_current_song()
 
-    def select_track(self, item, column):
-        index = item.data(0, Qt.UserRole)
-        if index is not None:
-            self.current_index = index
-            self.label.setText(self.playlist[self.current_index])
+    def select_track(self, index):
+        track = index.data(Qt.UserRole)
+        if track is not None:
+            self.current_index = track
+            self.label.setText(self.tracks.path(self.current_index))
             self.play_music()
             self.progress_slider.setValue(0)
-            self.update_metadata_and_art()
 
     def play_music(self):
-        if self.playlist and self.current_index != -1:
-            if self.media_player:
-                self.media_player.stop()
-            self.media_player = vlc.MediaPlayer(self.playlist[self.current_index])
-            self.media_player.play()
+        if self.tracks and self.current_index != -1:
+            options = self.stream_session.media_options() if self.is_streaming else ()
+            if self.resume is not None and self.resume[0] == self.current_index:
+                # Continue a restored session where it was left
+                options = (f':start-time={self.resume[1] / 1000:.3f}',)
+            self.resume = None
+            self.engine.play(self.current_index, self.tracks.path(self.current_index), options)
+            if self.is_streaming:
+                self.stream_session.started()
             self.set_volume()  # Set initial volume
             self.stop_button.setEnabled(True)
-            self.timer.start()
             self.update_metadata_and_art()
 
+    def next_queue_item(self, track):
+        # Item after `track` in the play queue, used for preloading and auto-advance
+        if self.is_streaming or track is None:
+            return None
+        if track not in self.tracks:
+            # The playing file was deleted: its successor is already current
+            return (self.current_index, self.tracks.path(self.current_index)) if self.current_index != -1 else None
+        upcoming = self.queue.next(track, auto=True)
+        if upcoming is None:
+            return None
+        return upcoming, self.tracks.path(upcoming)
+
+    def set_shuffle(self, enabled):
+        self.queue.set_shuffle(enabled, self.current_index)
+        self.engine.refresh_preload()
+
+    def cycle_repeat(self):
+        self.set_repeat((self.queue.repeat + 1) % 3)
+
+    def set_repeat(self, mode):
+        self.queue.repeat = mode
+        self.repeat_button.setChecked(mode != REPEAT_OFF)
+        self.repeat_button.setText('🔂' if mode == REPEAT_ONE else '🔁')
+        self.repeat_button.setToolTip(('Repeat: off', 'Repeat: all', 'Repeat: one')[mode])
+        self.engine.refresh_preload()
+
+    def track_auto_started(self, track):
+        self.current_index = track
+        self.label.setText(self.tracks.path(self.current_index))
+        self.progress_slider.setValue(0)
+        self.update_metadata_and_art()
+        self.highlight_current_song()
+
+    def queue_finished(self):
+        self.stop_button.setEnabled(False)
+        self.reset_progress()
+
     def stop_music(self):
-        if self.media_player:
-            self.media_player.stop()
+        self.stream_session.stop()
+        if self.engine.player:
+            self.engine.stop()
             self.stop_button.setEnabled(False)
-            self.timer.stop()
-            self.progress_slider.setValue(0)
+            self.reset_progress()
+
+    def playback_position_changed(self, time, length):
+        self.position = (time, length)
+        if not self.progress_refresh.isActive():
+            screen = self.screen() if self.isVisible() else None
+            rate = screen.refreshRate() if screen is not None else 60
+            self.progress_refresh.start(max(1, int(1000 / (rate or 60))))
 
+    def playback_buffering(self, percent):
+        if percent < 100:
+            self.remaining_label.setText(f'Buffering {int(percent)}%')
+
+    def reset_progress(self):
+        self.progress_refresh.stop()
+        self.position = (0, -1)
+        self.progress_slider.setValue(0)
+        self.elapsed_label.setText('0:00')
+        self.remaining_label.setText('-0:00')
+
+    @metrics.timer('progress.repaint')
     def update_progress(self):
-        if self.media_player:
-            try:
-                if self.is_streaming:
-                    # For streams, just show elapsed time
-                    pos = self.media_player.get_time()
-                    if pos >= 0:
-                        self.elapsed_label.setText(self.format_time(pos))
-                        self.remaining_label.setText('--:--')  # Unknown duration for streams
-                else:
-                    # For local files, show progress and remaining time
-                    length = self.media_player.get_length()
-                    pos = self.media_player.get_time()
-                    if length > 0:
-                        value = int((pos / length) * 1000)
-                        self.progress_slider.blockSignals(True)
-                        self.progress_slider.setValue(value)
-                        self.progress_slider.blockSignals(False)
-                        # Update time labels
-                        self.elapsed_label.setText(self.format_time(pos))
-                        self.remaining_label.setText('-' + self.format_time(length - pos))
-            except Exception:
-                pass
+        pos, length = self.position
+        if self.is_streaming:
+            # For streams, just show elapsed time
+            if pos >= 0:
+                self.elapsed_label.setText(self.format_time(pos))
+                self.remaining_label.setText('--:--')  # Unknown duration for streams
+        elif length > 0:
+            # For local files, show progress and remaining time
+            value = int((pos / length) * 1000)
+            self.progress_slider.blockSignals(True)
+            self.progress_slider.setValue(value)
+            self.progress_slider.blockSignals(False)
+            # Update time labels
+            self.elapsed_label.setText(self.format_time(pos))
+            self.remaining_label.setText('-' + self.format_time(length - pos))
+
+    def closeEvent(self, event):
+        self.save_session()
+        self.loudness.shutdown()
+        self.duplicates.cancel()
+        if self.server is not None:
+            self.server.stop()
+        super().closeEvent(event)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.engine.set_progress_events(True)
+
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self.engine.set_progress_events(False)
+
+    def changeEvent(self, event):
+        super().changeEvent(event)
+        if event.type() == QEvent.WindowStateChange:
+            # No progress updates while minimized
+            self.engine.set_progress_events(not self.isMinimized())
 
     def seek_position(self, value):
-        if self.media_player and not self.is_streaming:
+        if self.engine.player and not self.is_streaming:
             # Only allow seeking for local files, not streams
-            length = self.media_player.get_length()
+            length = self.position[1]
             if length > 0:
                 new_time = int((value / 1000) * length)
-                self.media_player.set_time(new_time)
+                self.engine.set_time(new_time)
 
     def set_volume(self):
-        if self.media_player:
-            self.media_player.audio_set_volume(self.volume_slider.value())
+        self.engine.set_volume(self.volume_slider.value())
 
     def forward(self):
-        if self.playlist and self.current_index < len(self.playlist) - 1 and not self.is_streaming:
-            self.current_index += 1
-            self.tree_widget.setCurrentItem(self.tree_widget.topLevelItem(self.current_index))
-            self.label.setText(self.playlist[self.current_index])
-            self.play_music()
-            self.progress_slider.setValue(0)
-            self.update_metadata_and_art()
+        self.skip_to(self.queue.next(self.current_index))
 
     def backward(self):
-        if self.playlist and self.current_index > 0 and not self.is_streaming:
-            self.current_index -= 1
-            self.tree_widget.setCurrentItem(self.tree_widget.topLevelItem(self.current_index))
-            self.label.setText(self.playlist[self.current_index])
+        self.skip_to(self.queue.previous(self.current_index))
+
+    def skip_to(self, track):
+        if track is not None and not self.is_streaming:
+            self.current_index = track
+            self.highlight_current_song()
+            self.label.setText(self.tracks.path(self.current_index))
             self.play_music()
             self.progress_slider.setValue(0)
-            self.update_metadata_and_art()
-
-    def get_display_name(self, filepath):
-        # Try to get title from metadata, else filename
-        try:
-            audio = MutagenFile(filepath, easy=True)
-            if audio and 'title' in audio:
-                return audio['title'][0]
-        except Exception:
-            pass
-        return os.path.basename(filepath)
-
-    def extract_metadata(self, filepath):
-        # Returns a dict with title, artist, album, tracknumber
-        title, artist, album, tracknumber = '-', '-', '-', '0'
-        try:
-            audio = MutagenFile(filepath, easy=True)
-            if audio:
-                title = audio.get('title', [os.path.basename(filepath)])[0]
-                artist = audio.get('artist', ['-'])[0]
-                album = audio.get('album', ['-'])[0]
-                tracknumber = audio.get('tracknumber', ['0'])[0]
-        except Exception:
-            pass
-        return {'title': title, 'artist': artist, 'album': album, 'tracknumber': tracknumber}
 
+    @metrics.timer('now_playing.update')
     def update_metadata_and_art(self):
-        if not self.playlist or self.current_index == -1:
+        if not self.tracks or self.current_index == -1:
             self.title_label.setText('Title: -')
             self.artist_label.setText('Artist: -')
             self.album_label.setText('Album: -')
             self.album_art_label.clear()
             return
         
+        # Labels come from the library record; the file is only opened again
+        # when its picture is not in the art cache yet
+        metadata = self.tracks[self.current_index]
+        self.title_label.setText(f'Title: {metadata["title"]}')
+        self.artist_label.setText(f'Artist: {metadata["artist"]}')
+        self.album_label.setText(f'Album: {metadata["album"]}')
         if self.is_streaming:
-            # For streams, use the metadata we set
-            metadata = self.metadata_list[self.current_index]
-            self.title_label.setText(f'Title: {metadata["title"]}')
-            self.artist_label.setText(f'Artist: {metadata["artist"]}')
-            self.album_label.setText(f'Album: {metadata["album"]}')
             self.album_art_label.clear()
             return
-            
-        filepath = self.playlist[self.current_index]
-        title, artist, album = '-', '-', '-'
-        art = None
-        try:
-            audio = MutagenFile(filepath)
-            if audio is not None:
-                if audio.tags:
-                    if 'TIT2' in audio.tags:
-                        title = str(audio.tags['TIT2'])
-                    if 'TPE1' in audio.tags:
-                        artist = str(audio.tags['TPE1'])
-                    if 'TALB' in audio.tags:
-                        album = str(audio.tags['TALB'])
-                # FLAC
-                if hasattr(audio, 'pictures') and audio.pictures:
-                    art = audio.pictures[0].data
-                # MP3
-                elif 'APIC:' in audio.tags:
-                    art = audio.tags['APIC:'].data
-        except Exception:
-            pass
-        self.title_label.setText(f'Title: {title}')
-        self.artist_label.setText(f'Artist: {artist}')
-        self.album_label.setText(f'Album: {album}')
-        if art:
-            image = Image.open(BytesIO(art))
-            image = image.resize((200, 200))
-            qt_image = QPixmap.fromImage(ImageQt(image))
-            self.album_art_label.setPixmap(qt_image)
+        
+        filepath = self.tracks.path(self.current_index)
+        known_hash = metadata['art_hash']
+        pixmap = self.art_cache.get(known_hash)
+        if pixmap is None and known_hash != '':
+            metrics.count('art.cache_misses')
+            with metrics.timer('art.read_and_decode'):
+                art = read_art(filepath)
+                if art:
+                    art_hash, pixmap = self.art_cache.put(art)
+                else:
+                    art_hash = ''
+            if art_hash != known_hash:
+                self.library.set_art_hash(filepath, art_hash)
+        if pixmap is not None:
+            self.album_art_label.setPixmap(pixmap)
         else:
             self.album_art_label.clear()
 
+    def show_debug_panel(self):
+        if self.debug_panel is None:
+            from debug_panel import DebugPanel
+            self.debug_panel = DebugPanel()
+        self.debug_panel.show()
+        self.debug_panel.raise_()
+
     def format_time(self, ms):
         seconds = int(ms / 1000)
         m, s = divmod(seconds, 60)
         return f'{m}:{s:02d}'
 
     def highlight_current_song(self):
-        # Recursively search for the item with current_index and select it
-        def search_items(parent):
-            for i in range(parent.childCount()):
-                child = parent.child(i)
-                idx = child.data(0, Qt.UserRole)
-                if idx == self.current_index:
-                    self.tree_widget.setCurrentItem(child)
-                    return True
-                if search_items(child):
-                    return True
-            return False
-        # Top-level
-        for i in range(self.tree_widget.topLevelItemCount()):
-            item = self.tree_widget.topLevelItem(i)
-            idx = item.data(0, Qt.UserRole)
-            if idx == self.current_index:
-                self.tree_widget.setCurrentItem(item)
-                return
-            if search_items(item):
-                return
+        index = self.playlist_model.index_for_track(self.current_index)
+        if not index.isValid():
+            return
+        # Expand only the groups leading to the current song
+        parent = index.parent()
+        while parent.isValid():
+            self.tree_view.expand(parent)
+            parent = parent.parent()
+        self.tree_view.setCurrentIndex(index)
+        self.tree_view.scrollTo(index)
 
     def open_github(self):
         """Open the GitHub repository in the default browser"""
+        import webbrowser
         github_url = "https://github.com/yourusername/music-player"
         try:
             webbrowser.open(github_url)
@@ -528,6 +1016,7 @@ class MusicPlayer(QWidget):
 
     def report_issue(self):
         """Open GitHub issues page in the default browser"""
+        import webbrowser
         issues_url = "https://github.com/yourusername/music-player/issues/new"
         try:
             webbrowser.open(issues_url)
@@ -535,7 +1024,47 @@ class MusicPlayer(QWidget):
             QMessageBox.warning(self, 'Error', f'Could not open issues page: {str(e)}')
 
 if __name__ == '__main__':
+    # --profile-startup prints how long each import and init step took
+    profile.enabled = '--profile-startup' in sys.argv
     app = QApplication(sys.argv)
+    profile.mark('create QApplication')
+    # --metrics-log FILE writes the metrics as JSON on exit; --cprofile FILE
+    # profiles the GUI thread for the whole run (pstats format); --serve PORT
+    # shares the library on the network from the start
+    args = app.arguments()[1:]
+    options = {}
+    for name in ('--metrics-log', '--cprofile', '--serve'):
+        if name in args[:-1]:
+            position = args.index(name)
+            options[name] = args[position + 1]
+            del args[position:position + 2]
+    if '--cprofile' in options:
+        profiler.start()
     player = MusicPlayer()
     player.show()
-    sys.exit(app.exec_()) 
\ No newline at end of file
+    profile.mark('show window')
+    if options.get('--serve', '').isdigit():
+        player.share_port = int(options['--serve'])
+        player.share_button.setChecked(True)
+    # Files and folders given on the command line are imported like "Add Folder"
+    args = [arg for arg in args if arg != '--profile-startup']
+    if args:
+        player.import_paths(iter_audio_files(args))
+        player.watcher.add_roots([arg for arg in args if os.path.isdir(arg)])
+
+    def startup_done():
+        # Runs once the window has been painted
+        profile.mark('first paint')
+        if not args:
+            # Reopen the last session
+            player.restore_session()
+            profile.mark('restore session')
+        profile.report()
+
+    QTimer.singleShot(0, startup_done)
+    status = app.exec_()
+    if '--cprofile' in options:
+        profiler.stop(options['--cprofile'])
+    if '--metrics-log' in options:
+        metrics.dump(options['--metrics-log'])
+    sys.exit(status) 
\ No newline at end of file
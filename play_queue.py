@@ -0,0 +1,111 @@
+import random
+
+
+REPEAT_OFF = 0
+REPEAT_ALL = 1
+REPEAT_ONE = 2
+
+
+class PlayQueue:
+    """Play order of the playlist, following what the view shows.
+
+    `source()` returns the visible track ids in display order (current sort
+    mode and filter). The order is rebuilt from it lazily, the first time
+    it is needed after `invalidate()`, and a track id -> position map makes
+    next/previous constant-time lookups.
+
+    With shuffle on, the order is a random permutation that starts at the
+    track playing when shuffle was turned on; tracks played so far keep
+    their place when the view changes and only the upcoming ones are
+    reshuffled. Repeat all wraps around at either end, repeat one replays
+    the current track when it ends on its own.
+    """
+
+    def __init__(self, source, seed=None):
+        self.source = source
+        self.shuffle = False
+        self.repeat = REPEAT_OFF
+        self._random = random.Random(seed)
+        self._order = []
+        self._position = {}  # track id -> index in _order
+        self._current = None  # last track asked about, where shuffle history ends
+        self._stale = True
+
+    def invalidate(self):
+        """Mark the order out of date after the view or the playlist changed"""
+        self._stale = True
+
+    def set_shuffle(self, enabled, current):
+        if enabled != self.shuffle:
+            self.shuffle = enabled
+            # A new shuffle starts from the current track with no history
+            self._order = []
+            self._position = {}
+            self._current = current
+            self._stale = True
+
+    def __len__(self):
+        self._refresh(None)
+        return len(self._order)
+
+    def __iter__(self):
+        self._refresh(None)
+        return iter(self._order)
+
+    def position(self, track):
+        """Index of a track in the play order, or -1 if it is not queued"""
+        self._refresh(track)
+        return self._position.get(track, -1)
+
+    def next(self, track, auto=False):
+        """Track after `track`, or None at the end of the queue.
+
+        `auto` is set when the current track finished by itself, which is
+        when repeat one plays it again; skipping always moves on.
+        """
+        self._refresh(track)
+        if not self._order:
+            return None
+        if auto and self.repeat == REPEAT_ONE and track in self._position:
+            return track
+        position = self._position.get(track, -1) + 1
+        if position == len(self._order):
+            if self.repeat == REPEAT_OFF:
+                return None
+            position = 0
+        return self._order[position]
+
+    def previous(self, track):
+        """Track before `track`, or None at the start of the queue"""
+        self._refresh(track)
+        if not self._order:
+            return None
+        position = self._position.get(track, len(self._order)) - 1
+        if position < 0:
+            if self.repeat == REPEAT_OFF:
+                return None
+            position = len(self._order) - 1
+        return self._order[position]
+
+    def _refresh(self, current):
+        if current is not None:
+            self._current = current
+        if not self._stale:
+            return
+        order = list(self.source())
+        if self.shuffle:
+            current = self._current
+            visible = set(order)
+            played = self._position.get(current, -1) + 1
+            history = [track for track in self._order[:played] if track in visible]
+            seen = set(history)
+            upcoming = [track for track in order if track not in seen]
+            self._random.shuffle(upcoming)
+            if not history and current in visible:
+                # Start the shuffle from the current track
+                upcoming.remove(current)
+                upcoming.insert(0, current)
+            order = history + upcoming
+        self._order = order
+        self._position = {track: position for position, track in enumerate(order)}
+        self._stale = False
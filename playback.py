@@ -0,0 +1,315 @@
+import os
+import time
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from metrics import metrics
+from startup import profile
+
+# Replace with your actual VLC install path
+VLC_PATH = r"D:\VLC"
+
+# 'stub' plays nothing (stub_vlc), for running headless without libvlc
+BACKEND = os.environ.get('MUSIC_PLAYER_BACKEND', 'vlc')
+
+# python-vlc (and libvlc behind it) is only loaded when playback first starts
+vlc = None
+
+
+def load_vlc():
+    global vlc
+    if vlc is None:
+        if BACKEND == 'stub':
+            import stub_vlc as module
+        else:
+            with profile.step('load libvlc'):
+                if hasattr(os, 'add_dll_directory') and os.path.isdir(VLC_PATH):
+                    os.add_dll_directory(VLC_PATH)
+                import vlc as module
+        vlc = module
+    return vlc
+
+
+# Player slot states
+IDLE, PREROLLING, READY, ACTIVE = range(4)
+
+# Event kinds forwarded from VLC's event thread
+_PLAYING, _END_REACHED, _ERROR, _POSITION, _BUFFERING, _META = range(6)
+
+
+class PlaybackEngine(QObject):
+    """Owns the single VLC instance and plays a queue of tracks.
+
+    Two media players are used in turns: while one plays, the next queue
+    item is opened, decoded and paused at its start on the other (muted), so
+    an end-of-track switch is an unpause instead of a fresh demuxer start.
+    `next_track` is a callable returning (track, mrl) for the item after a
+    given track, or None at the end of the queue. `gain_for` returns the
+    loudness adjustment in dB for a track, applied on top of the volume
+    whenever that track starts playing.
+
+    Playback state comes from VLC's event manager rather than polling. Time
+    and length changes are coalesced: at most one position_changed is queued
+    to the GUI thread at a time, and none while `progress_events` is off.
+    """
+
+    track_started = pyqtSignal(int)  # emitted on auto-advance
+    queue_finished = pyqtSignal()
+    error = pyqtSignal(str)
+    position_changed = pyqtSignal(int, int)  # time, length in ms (length <= 0 if unknown)
+    buffering = pyqtSignal(float)  # percent
+    now_playing = pyqtSignal(str)  # live title from stream (ICY) metadata
+
+    # VLC calls back on its own thread; this signal queues events to the GUI thread
+    _vlc_event = pyqtSignal(int, int, float)
+
+    def __init__(self, parent=None, options=()):
+        super().__init__(parent)
+        self.options = options
+        self.instance = None
+        self.next_track = lambda track: None
+        self.gain_for = lambda track: 0.0
+        self.latency = None  # seconds from the last play request to audio
+        self._players = []
+        self._state = [IDLE, IDLE]
+        self._tracks = [None, None]
+        self._mrls = [None, None]
+        self._kept_gain = 0.0  # gain of a song still playing from a forgotten queue
+        self._active = 0
+        self._volume = 80
+        self._requested_at = None
+        self.progress_events = True
+        self._time = 0
+        self._length = -1
+        self._position_pending = False
+        self._vlc_event.connect(self._handle_event)
+
+    def _ensure_instance(self):
+        # Created on first playback so the window does not wait on libvlc
+        if self.instance is None:
+            load_vlc()
+            with profile.step('create VLC instance'):
+                self.instance = vlc.Instance(*self.options)
+            for slot in range(2):
+                player = self.instance.media_player_new()
+                events = player.event_manager()
+                events.event_attach(vlc.EventType.MediaPlayerPlaying, self._on_vlc_event, slot, _PLAYING)
+                events.event_attach(vlc.EventType.MediaPlayerEndReached, self._on_vlc_event, slot, _END_REACHED)
+                events.event_attach(vlc.EventType.MediaPlayerEncounteredError, self._on_vlc_event, slot, _ERROR)
+                events.event_attach(vlc.EventType.MediaPlayerTimeChanged, self._on_time_changed, slot)
+                events.event_attach(vlc.EventType.MediaPlayerLengthChanged, self._on_length_changed, slot)
+                events.event_attach(vlc.EventType.MediaPlayerBuffering, self._on_buffering, slot)
+                self._players.append(player)
+        return self.instance
+
+    def media(self, mrl, *options):
+        return self._ensure_instance().media_new(mrl, *options)
+
+    @property
+    def player(self):
+        """The media player currently producing audio (None before first playback)"""
+        return self._players[self._active] if self._players else None
+
+    @property
+    def current_track(self):
+        return self._tracks[self._active]
+
+    def play(self, track, mrl, options=()):
+        self._ensure_instance()
+        self._requested_at = time.perf_counter()
+        standby = 1 - self._active
+        self.player.stop()
+        self._state[self._active] = IDLE
+        if (self._tracks[standby], self._mrls[standby]) == (track, mrl) and self._state[standby] in (PREROLLING, READY):
+            self._switch_to_standby()
+        else:
+            self._release(standby)
+            self._reset_position()
+            player = self.player
+            media = self.media(mrl, *options)
+            media.event_manager().event_attach(
+                vlc.EventType.MediaMetaChanged, self._on_vlc_event, self._active, _META)
+            self._tracks[self._active] = track
+            self._mrls[self._active] = mrl
+            player.set_media(media)
+            player.audio_set_mute(False)
+            player.play()
+            player.audio_set_volume(self._slot_volume(self._active))
+            self._state[self._active] = ACTIVE
+        self._preload_next()
+
+    def stop(self):
+        for slot in range(len(self._players)):
+            self._release(slot)
+
+    def forget_queue(self):
+        """The playlist was replaced: its track ids may now name other tracks.
+
+        The current song keeps playing, but nothing is prepared after it and
+        it does not advance when it ends.
+        """
+        self._release(1 - self._active)
+        track = self._tracks[self._active]
+        if track is not None:
+            self._kept_gain = self.gain_for(track)
+        self._tracks[self._active] = None
+        self._mrls[self._active] = None
+
+    def _slot_volume(self, slot):
+        # VLC volume is a percentage; above 100 amplifies (up to 200)
+        track = self._tracks[slot]
+        gain = self.gain_for(track) if track is not None else self._kept_gain
+        return max(0, min(200, round(self._volume * 10 ** (gain / 20))))
+
+    def _release(self, slot):
+        if self._players and self._state[slot] != IDLE:
+            self._players[slot].stop()
+        self._state[slot] = IDLE
+        self._tracks[slot] = None
+        self._mrls[slot] = None
+
+    def _reset_position(self):
+        self._time = 0
+        self._length = -1
+
+    def _switch_to_standby(self):
+        standby = 1 - self._active
+        player = self._players[standby]
+        self._reset_position()
+        prerolled = self._state[standby] == READY
+        self._active = standby
+        self._state[standby] = ACTIVE
+        player.audio_set_volume(self._slot_volume(standby))
+        player.audio_set_mute(False)
+        if prerolled:
+            player.set_pause(0)
+        # Still opening: _handle_event resumes it when it reports Playing
+
+    def _preload_next(self):
+        standby = 1 - self._active
+        upcoming = self.next_track(self.current_track)
+        if upcoming is None:
+            self._release(standby)
+            return
+        track, mrl = upcoming
+        if self._state[standby] != IDLE and (self._tracks[standby], self._mrls[standby]) == upcoming:
+            return
+        self._release(standby)
+        media = self.media(mrl)
+        # Parse tags/duration ahead of time, then open and decode the start
+        # of the file muted; _handle_event pauses it once it is playing
+        media.parse_with_options(vlc.MediaParseFlag.local, 0)
+        player = self._players[standby]
+        player.set_media(media)
+        player.audio_set_mute(True)
+        self._tracks[standby] = track
+        self._mrls[standby] = mrl
+        self._state[standby] = PREROLLING
+        player.play()
+
+    def refresh_preload(self):
+        """Re-check the prepared next item after the queue changed"""
+        if self._players and self._state[self._active] == ACTIVE:
+            self._preload_next()
+
+    def _on_vlc_event(self, event, slot, kind):
+        # Runs on a VLC thread: never call back into libvlc here
+        self._vlc_event.emit(slot, kind, 0.0)
+
+    def _on_time_changed(self, event, slot):
+        if slot == self._active:
+            self._time = event.u.new_time
+            self._queue_position(slot)
+
+    def _on_length_changed(self, event, slot):
+        if slot == self._active:
+            self._length = event.u.new_length
+            self._queue_position(slot)
+
+    def _queue_position(self, slot):
+        # Only one position update is in flight; it carries the latest values
+        if self.progress_events and not self._position_pending:
+            self._position_pending = True
+            self._vlc_event.emit(slot, _POSITION, 0.0)
+
+    def _on_buffering(self, event, slot):
+        if slot == self._active:
+            self._vlc_event.emit(slot, _BUFFERING, event.u.new_cache)
+
+    def _handle_event(self, slot, kind, value):
+        player = self._players[slot]
+        if kind == _POSITION:
+            self._position_pending = False
+            if slot == self._active:
+                self.position_changed.emit(self._time, self._length)
+        elif kind == _BUFFERING:
+            if slot == self._active and self._state[slot] == ACTIVE:
+                self.buffering.emit(value)
+        elif kind == _META:
+            media = player.get_media()
+            if slot == self._active and media is not None:
+                title = media.get_meta(vlc.Meta.NowPlaying)
+                if title:
+                    self.now_playing.emit(title)
+        elif kind == _PLAYING:
+            if self._state[slot] == PREROLLING:
+                player.set_pause(1)
+                player.set_time(0)
+                self._state[slot] = READY
+            elif self._state[slot] == ACTIVE:
+                player.audio_set_mute(False)
+                if self._requested_at is not None:
+                    self.latency = time.perf_counter() - self._requested_at
+                    self._requested_at = None
+                    metrics.record('playback.latency', self.latency)
+        elif kind == _END_REACHED:
+            if slot == self._active and self._state[slot] == ACTIVE:
+                self._advance()
+        elif kind == _ERROR:
+            if self._state[slot] == ACTIVE:
+                media = player.get_media()
+                self.error.emit(f'Could not play {media.get_mrl() if media else "track"}')
+                self._advance()
+            else:
+                self._release(slot)
+
+    def _advance(self):
+        self._requested_at = time.perf_counter()
+        self._state[self._active] = IDLE
+        standby = 1 - self._active
+        if self._state[standby] in (PREROLLING, READY):
+            self._switch_to_standby()
+            self.track_started.emit(self.current_track)
+            self._preload_next()
+            return
+        upcoming = self.next_track(self.current_track)
+        if upcoming is None:
+            self._tracks[self._active] = None
+            self._requested_at = None
+            self.queue_finished.emit()
+            return
+        track, mrl = upcoming
+        self.play(track, mrl)
+        self.track_started.emit(track)
+
+    # Passthroughs for the current player
+
+    def set_volume(self, volume):
+        self._volume = volume
+        if self._players:
+            self.player.audio_set_volume(self._slot_volume(self._active))
+
+    def set_progress_events(self, enabled):
+        """Turn position updates off (e.g. while the window is hidden)"""
+        self.progress_events = enabled
+        if enabled and self._players:
+            # Times keep being recorded while off, so catch up immediately
+            self.position_changed.emit(self._time, self._length)
+
+    def position(self):
+        """Latest (time, length) reported by VLC for the current track"""
+        return self._time, self._length
+
+    def set_time(self, ms):
+        if self._players:
+            self.player.set_time(ms)
@@ -0,0 +1,149 @@
+from search import SearchIndex
+from track_store import TrackStore
+from view_index import ViewIndexes, track_sort_key
+
+
+class Playlist:
+    """The player's tracks and every index over them, with no GUI attached.
+
+    Keeps the TrackStore, the per-sort-mode ViewIndexes and the SearchIndex
+    consistent on every change, and answers what a view shows for a search
+    query (`matches`) and in which order (`ordered`). `hidden` holds tracks
+    left out of the views when hiding is asked for (duplicate copies).
+
+    `load` indexes a ready store for one sort mode only; the other modes
+    and search are built by `index_step` (a chunk per call, for idle time)
+    or all at once by `finish_indexing`, which every reader of those indexes
+    calls first. `version` goes up with every change to the tracks, for
+    readers that keep a copy (the library server).
+    """
+
+    def __init__(self):
+        self.tracks = TrackStore()
+        self.views = ViewIndexes()
+        self.search = SearchIndex()
+        self.hidden = set()
+        self._backlog = None
+        self._ready_mode = None  # the only sort mode indexed while a backlog is pending
+        self.version = 0
+
+    def __len__(self):
+        return len(self.tracks)
+
+    def clear(self):
+        self.version += 1
+        self.tracks = TrackStore()
+        self.views.clear()
+        self.search.clear()
+        self.hidden = set()
+        self._backlog = None
+
+    def add(self, filepath, meta):
+        """Add a track and index it; return its id"""
+        self.version += 1
+        track = self.tracks.add(filepath, meta)
+        # Index the stored record so the indexes share its strings
+        record = self.tracks[track]
+        self.views.add(track, record)
+        self.search.add(track, record)
+        return track
+
+    def add_many(self, batch):
+        """Add (path, metadata) pairs; return the (track, stored record) pairs"""
+        records = []
+        for filepath, meta in batch:
+            track = self.add(filepath, meta)
+            records.append((track, self.tracks[track]))
+        return records
+
+    def update(self, track, meta):
+        """Replace a track's metadata and re-index it; return the stored record"""
+        self.version += 1
+        self.finish_indexing()
+        self.tracks.update(track, meta)
+        record = self.tracks[track]
+        self.views.add(track, record)
+        self.search.add(track, record)
+        return record
+
+    def set_loudness(self, track, track_gain, track_peak):
+        # No index depends on ReplayGain, so nothing is re-indexed
+        self.version += 1
+        self.tracks.update(track, {'track_gain': track_gain, 'track_peak': track_peak})
+
+    def remove(self, track):
+        self.version += 1
+        self.finish_indexing()
+        self.tracks.remove(track)
+        self.views.remove(track)
+        self.search.remove(track)
+        self.hidden.discard(track)
+
+    def move(self, track, filepath):
+        self.version += 1
+        self.tracks.set_path(track, filepath)
+
+    def track_for_path(self):
+        """Map of path -> track id (built on demand, O(tracks))"""
+        tracks = self.tracks
+        return {tracks.path(track): track for track in tracks}
+
+    def load(self, store, mode):
+        """Replace every track with a ready TrackStore, indexing only `mode`
+        now; return the (track, record, sort key) triples"""
+        self.clear()
+        self.tracks = store
+        records = []
+        for track in store:
+            meta = store[track]
+            records.append((track, meta, track_sort_key(track, meta)))
+        self.views[mode].add_many(records)
+        self._ready_mode = mode
+        self._backlog = self._index_remaining(records, [m for m in self.views.modes if m != mode])
+        return records
+
+    def _index_remaining(self, records, modes):
+        for mode in modes:
+            self.views[mode].add_many(records)
+            yield
+        for start in range(0, len(records), 1000):
+            for track, meta, _ in records[start:start + 1000]:
+                self.search.add(track, meta)
+            yield
+
+    @property
+    def indexing(self):
+        return self._backlog is not None
+
+    def index_step(self):
+        """Do one chunk of deferred indexing; return False once none is left"""
+        if self._backlog is None:
+            return False
+        try:
+            next(self._backlog)
+        except StopIteration:
+            self._backlog = None
+        return self._backlog is not None
+
+    def finish_indexing(self):
+        if self._backlog is not None:
+            for _ in self._backlog:
+                pass
+            self._backlog = None
+
+    def matches(self, query, hide=False):
+        """Tracks a view shows for a search query, without the hidden ones
+        if `hide` is set; None means every track"""
+        if query:
+            self.finish_indexing()
+        results = self.search.search(query)
+        if hide and self.hidden:
+            results = (set(self.tracks) if results is None else results) - self.hidden
+        return results
+
+    def ordered(self, mode, query='', hide=False):
+        """Track ids shown in a sort mode, in display order"""
+        if mode != self._ready_mode:
+            self.finish_indexing()
+        results = self.matches(query, hide)
+        return [track for track in self.views[mode] if results is None or track in results]
@@ -0,0 +1,246 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from PyQt5.QtCore import Qt, QAbstractItemModel, QModelIndex
+
+from view_index import IndexGroup
+
+
+# Sort mode -> label for a track row
+TRACK_LABELS = {
+    'All Songs': lambda m: f"📄 {m['title']}",
+    'By Artist & Album': lambda m: f"🎵 {m['title']}",
+    'By Album': lambda m: f"🎵 {m['title']} - {m['artist']}",
+    'By Artist': lambda m: f"🎵 {m['title']} - {m['album']}",
+}
+
+
+_TRACK_FLAGS = Qt.ItemIsEnabled | Qt.ItemIsSelectable
+
+
+class PlaylistModel(QAbstractItemModel):
+    """Tree model presenting one ViewIndex of the playlist.
+
+    Rows are read straight from the index's sorted groups, so nothing is
+    built per row and Qt only materializes what is visible. Each index stores
+    its parent IndexGroup as the internal pointer. Switching sort mode is a
+    model reset onto another prebuilt index; library changes made inside
+    `updating()` are published as a layout change that keeps selection and
+    expanded groups.
+
+    An optional filter (a set of track ids, e.g. search results) hides every
+    other track and any group left empty. The visible rows are derived from
+    the matching tracks' positions in the index, so the cost follows the
+    number of matches rather than the library size.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._metadata = []
+        self._index = None
+        self._track_label = TRACK_LABELS['All Songs']
+        self._filter = None
+        self._visible_rows = {}  # leaf group -> sorted rows of matching tracks
+        self._visible_labels = {}  # inner group -> sorted labels of groups with matches
+        self._lazy_filter = False
+        self._has_match = {}
+
+    def set_view(self, mode, view_index, metadata):
+        self.beginResetModel()
+        self._metadata = metadata
+        self._index = view_index
+        self._track_label = TRACK_LABELS[mode]
+        self._apply_filter()
+        self.endResetModel()
+
+    def set_filter(self, tracks):
+        """Show only the given track ids (None shows everything)"""
+        with self.updating():
+            self._filter = tracks
+
+    def _apply_filter(self):
+        self._visible_rows = {}
+        self._visible_labels = {}
+        self._lazy_filter = False
+        if self._filter is None or self._index is None:
+            return
+        if len(self._filter) * 16 >= len(self._index):
+            # Broad match: groups are checked on demand as the view reaches
+            # them, which stops at the first match in each group
+            self._lazy_filter = True
+            self._has_match = {}
+            return
+        labels = {}
+        for track in self._filter:
+            leaf, row = self._index.locate(track)
+            if leaf is None:
+                continue
+            self._visible_rows.setdefault(leaf, []).append(row)
+            group = leaf
+            while group.parent is not None:
+                siblings = labels.setdefault(group.parent, set())
+                if group.label in siblings:
+                    break
+                siblings.add(group.label)
+                group = group.parent
+        for rows in self._visible_rows.values():
+            rows.sort()
+        self._visible_labels = {group: sorted(names) for group, names in labels.items()}
+
+    def _group_has_match(self, group):
+        found = self._has_match.get(group)
+        if found is None:
+            tracks = self._filter
+            if group.is_leaf():
+                found = any(key[-1] in tracks for key in group.keys)
+            else:
+                found = any(self._group_has_match(child) for child in group.children.values())
+            self._has_match[group] = found
+        return found
+
+    def _rows(self, leaf):
+        rows = self._visible_rows.get(leaf)
+        if rows is None:
+            rows = []
+            if self._lazy_filter:
+                tracks = self._filter
+                rows = [row for row, key in enumerate(leaf.keys) if key[-1] in tracks]
+                self._visible_rows[leaf] = rows
+        return rows
+
+    def _labels(self, group):
+        labels = self._visible_labels.get(group)
+        if labels is None:
+            labels = []
+            if self._lazy_filter:
+                labels = [label for label in group.labels if self._group_has_match(group.children[label])]
+                self._visible_labels[group] = labels
+        return labels
+
+    @contextmanager
+    def updating(self):
+        """Wrap changes to the shown ViewIndex so attached views stay in sync"""
+        self.layoutAboutToBeChanged.emit()
+        saved = [(index, self._identity(index)) for index in self.persistentIndexList()]
+        try:
+            yield
+        finally:
+            self._apply_filter()
+            self.changePersistentIndexList(
+                [index for index, _ in saved],
+                [self._index_for_identity(identity) for _, identity in saved],
+            )
+            self.layoutChanged.emit()
+
+    def _identity(self, index):
+        # A stable handle for a row that survives inserts and removals
+        return self._item(index) if index.isValid() else None
+
+    def _index_for_identity(self, item):
+        if item is None:
+            return QModelIndex()
+        if isinstance(item, IndexGroup):
+            parent = item.parent
+            row = self._row_of(parent, item) if parent is not None else -1
+            return self.createIndex(row, 0, parent) if row >= 0 else QModelIndex()
+        return self.index_for_track(item)
+
+    # Group access, through the filter when one is set
+
+    def _len(self, group):
+        if self._filter is None:
+            return len(group)
+        if group.is_leaf():
+            return len(self._rows(group))
+        return len(self._labels(group))
+
+    def _child(self, group, row):
+        if self._filter is None:
+            return group.child(row)
+        if group.is_leaf():
+            return group.keys[self._rows(group)[row]][-1]
+        return group.children[self._labels(group)[row]]
+
+    def _row_of(self, parent, group):
+        if self._filter is None:
+            return parent.row_of(group)
+        labels = self._labels(parent)
+        row = bisect_left(labels, group.label)
+        if row < len(labels) and labels[row] == group.label and parent.children.get(group.label) is group:
+            return row
+        return -1
+
+    def _group(self, index):
+        if not index.isValid():
+            return self._index.root if self._index is not None else None
+        item = self._item(index)
+        return item if isinstance(item, IndexGroup) else None
+
+    def _item(self, index):
+        return self._child(index.internalPointer(), index.row())
+
+    def index(self, row, column, parent=QModelIndex()):
+        group = self._group(parent)
+        if group is None or column != 0 or not 0 <= row < self._len(group):
+            return QModelIndex()
+        return self.createIndex(row, column, group)
+
+    def parent(self, index):
+        if not index.isValid():
+            return QModelIndex()
+        group = index.internalPointer()
+        if group.parent is None:
+            return QModelIndex()
+        return self.createIndex(self._row_of(group.parent, group), 0, group.parent)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.column() > 0:
+            return 0
+        group = self._group(parent)
+        return self._len(group) if group is not None else 0
+
+    def columnCount(self, parent=QModelIndex()):
+        return 1
+
+    def hasChildren(self, parent=QModelIndex()):
+        # QTreeView asks this for every top-level row; empty groups are pruned
+        # from the index, so any row under a non-leaf group has children
+        if not parent.isValid():
+            return self._index is not None and self._len(self._index.root) > 0
+        return not parent.internalPointer().is_leaf()
+
+    def flags(self, index):
+        # Called for every top-level row on layout; rows under a non-leaf
+        # group are folders, so the row itself never needs to be resolved
+        if not index.isValid():
+            return Qt.NoItemFlags
+        if index.internalPointer().is_leaf():
+            return _TRACK_FLAGS
+        return Qt.ItemIsEnabled
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        item = self._item(index)
+        if role == Qt.DisplayRole:
+            if isinstance(item, IndexGroup):
+                return f"📁 {item.label}"
+            return self._track_label(self._metadata[item])
+        if role == Qt.UserRole:
+            return None if isinstance(item, IndexGroup) else item
+        return None
+
+    def index_for_track(self, track):
+        """Return the QModelIndex showing playlist index `track`, or an invalid index"""
+        if self._index is None:
+            return QModelIndex()
+        group, row = self._index.locate(track)
+        if group is None:
+            return QModelIndex()
+        if self._filter is not None:
+            rows = self._rows(group)
+            position = bisect_left(rows, row)
+            if position == len(rows) or rows[position] != row:
+                return QModelIndex()
+            row = position
+        return self.createIndex(row, 0, group)
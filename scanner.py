@@ -0,0 +1,192 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from library import file_fingerprint
+from metrics import metrics
+
+
+AUDIO_EXTENSIONS = ('.mp3', '.flac', '.wav', '.ogg', '.m4a')
+
+
+def iter_audio_files(roots, extensions=AUDIO_EXTENSIONS):
+    """Lazily yield audio file paths found under roots.
+
+    Directories are walked with os.scandir one at a time, so paths are
+    produced as they are discovered instead of after a full listing. Each
+    directory is visited once by (device, inode), which also breaks symlink
+    loops. Plain file paths in roots are passed through if their extension
+    matches.
+    """
+    visited = set()
+    for root in roots:
+        if not os.path.isdir(root):
+            if root.lower().endswith(extensions) and os.path.isfile(root):
+                yield root
+            continue
+        stack = [root]
+        while stack:
+            directory = stack.pop()
+            try:
+                st = os.stat(directory)
+            except OSError:
+                continue
+            key = (st.st_dev, st.st_ino)
+            if key in visited:
+                continue
+            visited.add(key)
+            subdirs = []
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        try:
+                            if entry.is_dir():
+                                subdirs.append(entry.path)
+                            elif entry.name.lower().endswith(extensions) and entry.is_file():
+                                yield entry.path
+                        except OSError:
+                            continue
+            except OSError:
+                continue
+            # Reversed so subdirectories are visited in listing order
+            stack.extend(reversed(subdirs))
+
+
+class MetadataScanner(QObject):
+    """Parses track metadata in a worker pool off the GUI thread.
+
+    Results are delivered in batches through `batch_ready` as (path, metadata)
+    pairs, with cache hits from the library emitted before any parsing work so
+    the playlist can be populated (and played) while the scan continues.
+    """
+
+    batch_ready = pyqtSignal(list)
+    progress = pyqtSignal(int, int)  # done, total
+    finished = pyqtSignal(bool)  # True if the scan was cancelled
+
+    # Internal signals carry the scan generation so results from a cancelled
+    # scan that are still queued for the GUI thread can be dropped
+    _batch = pyqtSignal(int, list)
+    _progress = pyqtSignal(int, int, int)
+    _finished = pyqtSignal(int, bool)
+
+    def __init__(self, library, parse, workers=None, flush_interval=0.5, parent=None):
+        super().__init__(parent)
+        self.library = library
+        self.parse = parse
+        self.workers = workers or min(8, (os.cpu_count() or 1) + 2)
+        self.flush_interval = flush_interval
+        self._generation = 0
+        self._cancel = None
+        self._thread = None
+        self._active = False  # a scan was started and has not reported finished yet
+        self._batch.connect(self._on_batch)
+        self._progress.connect(self._on_progress)
+        self._finished.connect(self._on_finished)
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def scan(self, paths):
+        """Start scanning paths, cancelling any scan already in progress"""
+        if self._cancel is not None:
+            self._cancel.set()
+        self._generation += 1
+        self._active = True
+        self._cancel = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, args=(self._generation, paths, self._cancel), daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        """Stop the scan; batches it already queued for the GUI thread are
+        dropped and `finished` is reported right away"""
+        if self._cancel is not None:
+            self._cancel.set()
+        self._generation += 1
+        if self._active:
+            self._active = False
+            self.finished.emit(True)
+
+    def _run(self, generation, paths, cancel):
+        total = len(paths) if hasattr(paths, '__len__') else -1
+        done = 0
+        batch = []
+        parsed = []
+        pending = {}
+        last_flush = 0.0
+
+        def collect(futures):
+            nonlocal done
+            for future in futures:
+                path, fingerprint = pending.pop(future)
+                try:
+                    meta = future.result()
+                except Exception:
+                    metrics.count('scan.failed')
+                    continue
+                parsed.append((path, fingerprint, meta))
+                batch.append((path, meta))
+                done += 1
+
+        def parse(path):
+            with metrics.timer('scan.parse'):
+                return self.parse(path)
+
+        def flush():
+            nonlocal batch, parsed, last_flush
+            if parsed:
+                with metrics.timer('scan.library_write'):
+                    self.library.put_many(parsed)
+                metrics.count('scan.parsed', len(parsed))
+                parsed = []
+            if batch:
+                self._batch.emit(generation, batch)
+                batch = []
+            self._progress.emit(generation, done, total)
+            last_flush = time.monotonic()
+
+        pool = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            for path in paths:
+                if cancel.is_set():
+                    break
+                fingerprint = file_fingerprint(path)
+                row = self.library.get(path, fingerprint)
+                if row is not None:
+                    batch.append((path, row))
+                    done += 1
+                    metrics.count('scan.cache_hits')
+                else:
+                    pending[pool.submit(parse, path)] = (path, fingerprint)
+                # Bound the number of in-flight parses so huge imports stay flat in memory
+                if len(pending) >= self.workers * 4:
+                    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(finished)
+                if batch and time.monotonic() - last_flush >= self.flush_interval:
+                    flush()
+            while pending and not cancel.is_set():
+                finished, _ = wait(pending, timeout=self.flush_interval, return_when=FIRST_COMPLETED)
+                collect(finished)
+                if time.monotonic() - last_flush >= self.flush_interval:
+                    flush()
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+            flush()
+            self._finished.emit(generation, cancel.is_set())
+
+    def _on_batch(self, generation, batch):
+        if generation == self._generation:
+            self.batch_ready.emit(batch)
+
+    def _on_progress(self, generation, done, total):
+        if generation == self._generation:
+            self.progress.emit(done, total)
+
+    def _on_finished(self, generation, cancelled):
+        if generation == self._generation:
+            self._active = False
+            self.finished.emit(cancelled)
@@ -0,0 +1,91 @@
+import unicodedata
+from array import array
+
+
+def normalize(text):
+    """Lower-case, accent-free text with punctuation collapsed to single spaces"""
+    text = unicodedata.normalize('NFKD', str(text or '')).casefold()
+    chars = [c if c.isalnum() else ' ' for c in text if not unicodedata.combining(c)]
+    return ' '.join(''.join(chars).split())
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SearchIndex:
+    """Substring search over title, artist and album.
+
+    Each track's normalized text is indexed by its trigrams; posting lists are
+    compact arrays of track ids. A query term of three or more characters
+    only verifies the tracks in its rarest trigram's posting list, so the
+    cost follows the number of candidates rather than the library size.
+    When a query extends the previous one (typing), the previous results are
+    refined instead of going back to the index.
+    """
+
+    FIELDS = ('title', 'artist', 'album')
+
+    def __init__(self):
+        self._texts = {}  # track id -> normalized text
+        self._postings = {}  # trigram -> array of track ids (may hold removed ids)
+        self._last_terms = None
+        self._last_results = None
+
+    def __len__(self):
+        return len(self._texts)
+
+    def add(self, track, meta):
+        text = ' '.join(normalize(meta[field]) for field in self.FIELDS)
+        self._texts[track] = text
+        for gram in trigrams(text):
+            postings = self._postings.get(gram)
+            if postings is None:
+                postings = self._postings[gram] = array('i')
+            postings.append(track)
+        self._last_terms = None
+
+    def remove(self, track):
+        # Postings are left in place and skipped during verification
+        self._texts.pop(track, None)
+        self._last_terms = None
+
+    def clear(self):
+        self._texts.clear()
+        self._postings.clear()
+        self._last_terms = None
+
+    def search(self, query):
+        """Return the set of track ids matching every term, or None for an empty query"""
+        terms = normalize(query).split()
+        if not terms:
+            self._last_terms = None
+            return None
+        texts = self._texts
+        last = self._last_terms
+        if last is not None and len(terms) >= len(last) and all(
+                term.startswith(prev) for term, prev in zip(terms, last)):
+            # Every previous term is a prefix of a new one: narrow the last results
+            candidates = self._last_results
+        else:
+            candidates = None
+            for term in terms:
+                for gram in trigrams(term):
+                    postings = self._postings.get(gram)
+                    if postings is None:
+                        # A trigram nobody has: no track can match
+                        postings = ()
+                    if candidates is None or len(postings) < len(candidates):
+                        candidates = postings
+        first = terms[0]
+        if candidates is None:
+            # Only short terms: a plain scan of the normalized texts
+            matches = [track for track, text in texts.items() if first in text]
+        else:
+            matches = [track for track in candidates if first in texts.get(track, '')]
+        for term in terms[1:]:
+            matches = [track for track in matches if term in texts[track]]
+        results = set(matches)
+        self._last_terms = terms
+        self._last_results = results
+        return results
@@ -0,0 +1,96 @@
+import json
+import os
+
+from library import user_data_dir
+from track_store import TrackStore
+
+
+NATIVE_EXTENSION = '.mpl'
+PLAYLIST_EXTENSIONS = ('.m3u', '.m3u8', NATIVE_EXTENSION)
+FORMAT_VERSION = 1
+
+
+def session_path():
+    return os.path.join(user_data_dir(), 'session' + NATIVE_EXTENSION)
+
+
+def is_playlist(filepath):
+    return os.path.splitext(filepath)[1].lower() in PLAYLIST_EXTENSIONS
+
+
+def read_m3u(filepath):
+    """Return the entries of an M3U/M3U8 playlist; relative paths are resolved
+    against the playlist's folder and URLs are kept as they are"""
+    with open(filepath, 'rb') as f:
+        data = f.read()
+    try:
+        text = data.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        # Legacy .m3u files are usually in a single-byte encoding
+        text = data.decode('latin-1')
+    folder = os.path.dirname(os.path.abspath(filepath))
+    entries = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if '://' not in line and not os.path.isabs(line):
+            line = os.path.normpath(os.path.join(folder, line))
+        entries.append(line)
+    return entries
+
+
+def write_m3u(filepath, store, tracks):
+    """Write extended M3U with absolute paths (UTF-8, which players accept for .m3u too)"""
+    lines = ['#EXTM3U']
+    for track in tracks:
+        meta = store[track]
+        duration = int(meta['duration']) or -1
+        lines.append(f"#EXTINF:{duration},{meta['artist']} - {meta['title']}")
+        lines.append(store.path(track))
+    _write_text(filepath, '\n'.join(lines) + '\n')
+
+
+def write_native(filepath, store, tracks, state=None):
+    """Write tracks (with their metadata) and optional player state as compact JSON.
+
+    Loading this format needs neither the audio files nor the library cache.
+    """
+    document = {'version': FORMAT_VERSION, 'state': state or {}, 'tracks': store.dump(tracks)}
+    _write_text(filepath, json.dumps(document, ensure_ascii=False, separators=(',', ':')))
+
+
+def read_native(filepath):
+    """Return (TrackStore, state dict); raises ValueError for an unreadable file"""
+    with open(filepath, 'rb') as f:
+        try:
+            document = json.loads(f.read())
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            raise ValueError(f'Not a playlist file: {e}') from None
+    if not isinstance(document, dict) or document.get('version') != FORMAT_VERSION:
+        raise ValueError('Unsupported playlist version')
+    state = document.get('state')
+    return TrackStore.load(document.get('tracks') or {}), state if isinstance(state, dict) else {}
+
+
+def read_playlist(filepath):
+    """Return the track paths of any supported playlist file"""
+    if filepath.lower().endswith(NATIVE_EXTENSION):
+        store, _ = read_native(filepath)
+        return [store.path(track) for track in store]
+    return read_m3u(filepath)
+
+
+def write_playlist(filepath, store, tracks):
+    """Save tracks in the format given by the file extension"""
+    if filepath.lower().endswith(NATIVE_EXTENSION):
+        write_native(filepath, store, tracks)
+    else:
+        write_m3u(filepath, store, tracks)
+
+
+def _write_text(filepath, text):
+    # Write next to the target and swap, so a crash never leaves half a file
+    with open(filepath + '.tmp', 'w', encoding='utf-8', newline='\n') as f:
+        f.write(text)
+    os.replace(filepath + '.tmp', filepath)
@@ -0,0 +1,53 @@
+import sys
+import time
+from contextlib import contextmanager
+
+
+class StartupProfile:
+    """Timeline of startup work, reported with --profile-startup.
+
+    `mark(name)` ends a step that began at the previous mark, for code that
+    runs in sequence (imports, building the window). `step(name)` times a
+    block wherever it runs, for components loaded lazily on first use;
+    those that only load after the report are printed as they happen.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.steps = []
+        self._started = self._last = time.perf_counter()
+        self._reported = False
+
+    def mark(self, name):
+        now = time.perf_counter()
+        self._record(name, now - self._last)
+        self._last = now
+
+    @contextmanager
+    def step(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record(name, time.perf_counter() - start)
+
+    def _record(self, name, seconds):
+        self.steps.append((name, seconds))
+        if self.enabled and self._reported:
+            print(f'startup: {name}: {seconds * 1000:.1f} ms', file=sys.stderr)
+
+    def report(self):
+        """Print every step so far and the total time since the profile was created"""
+        self._reported = True
+        if not self.enabled:
+            return
+        width = max((len(name) for name, _ in self.steps), default=0)
+        print('startup profile:', file=sys.stderr)
+        for name, seconds in self.steps:
+            print(f'  {name:<{width}}  {seconds * 1000:8.1f} ms', file=sys.stderr)
+        total = time.perf_counter() - self._started
+        print(f'  {"total":<{width}}  {total * 1000:8.1f} ms', file=sys.stderr)
+
+
+# Shared by every module so lazy loads show up in the same timeline
+profile = StartupProfile()
@@ -0,0 +1,206 @@
+import re
+import threading
+
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+
+_ICY_FIELD = re.compile(rb"(\w+)='(.*?)';", re.S)
+
+
+def parse_icy_metadata(block):
+    """Parse an ICY metadata block (e.g. b"StreamTitle='A - B';") into a dict"""
+    fields = {}
+    for key, value in _ICY_FIELD.findall(block.rstrip(b'\0')):
+        try:
+            text = value.decode('utf-8')
+        except UnicodeDecodeError:
+            text = value.decode('latin-1')
+        fields[key.decode('ascii', 'replace')] = text
+    return fields
+
+
+def probe_stream(url, timeout=5.0):
+    """Open a stream, check it answers with audio and read its ICY details.
+
+    Returns a dict with name, genre, bitrate, content_type and, when the
+    server interleaves ICY metadata, the current title. For another player's
+    library server (a JSON listing) it also has `library`, the (url,
+    metadata) pairs of its tracks. Raises OSError (or ValueError for a
+    non-audio response) if the stream cannot be used.
+    """
+    import urllib.request  # Pulls in http.client and ssl: not needed until the first stream
+
+    request = urllib.request.Request(url, headers={'Icy-MetaData': '1', 'User-Agent': 'MusicPlayer'})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        headers = response.headers
+        content_type = (headers.get('Content-Type') or '').split(';')[0].strip().lower()
+        if content_type.startswith('text/html'):
+            raise ValueError('URL returned a web page, not an audio stream')
+        if content_type == 'application/json':
+            import json
+            from library_server import parse_library
+
+            data = json.loads(response.read().decode('utf-8'))
+            tracks = parse_library(data, response.geturl())
+            return {'name': str(data.get('name') or ''), 'genre': '', 'bitrate': '', 'content_type': content_type,
+                    'title': '', 'library': tracks}
+        info = {
+            'name': headers.get('icy-name') or '',
+            'genre': headers.get('icy-genre') or '',
+            'bitrate': headers.get('icy-br') or '',
+            'content_type': content_type,
+            'title': '',
+        }
+        metaint = headers.get('icy-metaint')
+        if metaint and metaint.isdigit():
+            # Skip one audio interval to reach the first metadata block
+            remaining = int(metaint)
+            while remaining > 0:
+                chunk = response.read(min(remaining, 65536))
+                if not chunk:
+                    return info
+                remaining -= len(chunk)
+            length = response.read(1)
+            if length:
+                info['title'] = parse_icy_metadata(response.read(length[0] * 16)).get('StreamTitle', '')
+        else:
+            # No metadata: at least make sure audio data actually arrives
+            if not response.read(1):
+                raise OSError('Stream closed without sending audio')
+        return info
+
+
+class StreamSession(QObject):
+    """Connection to one network stream, managed off the GUI thread.
+
+    The URL is probed in a worker thread with a timeout before VLC is handed
+    the stream. While playing, errors, an unexpected end of stream or a stall
+    (no playback progress for `stall_timeout` seconds) trigger a reconnect
+    with exponential backoff. Live ICY titles from VLC are forwarded through
+    `title_changed`.
+    """
+
+    connected = pyqtSignal(dict, bool)  # probe info, True if this was a reconnect
+    failed = pyqtSignal(str)
+    status = pyqtSignal(str)
+    title_changed = pyqtSignal(str)
+
+    _probed = pyqtSignal(int, object)  # generation, info dict or exception
+
+    def __init__(self, engine, timeout=5.0, stall_timeout=15.0, max_backoff=30.0, parent=None):
+        super().__init__(parent)
+        self.engine = engine
+        self.timeout = timeout
+        self.stall_timeout = stall_timeout
+        self.max_backoff = max_backoff
+        self.buffer_ms = 3000
+        self.url = None
+        self.active = False
+        self._generation = 0
+        self._attempt = 0
+        self._last_time = None
+        self._stalled_for = 0.0
+        self._retry = QTimer(self)
+        self._retry.setSingleShot(True)
+        self._retry.timeout.connect(self._probe)
+        self._watchdog = QTimer(self)
+        self._watchdog.setInterval(1000)
+        self._watchdog.timeout.connect(self._check_progress)
+        self._probed.connect(self._on_probed)
+        engine.error.connect(self._on_engine_error)
+        engine.queue_finished.connect(self._on_stream_ended)
+        engine.now_playing.connect(self._on_now_playing)
+
+    def media_options(self):
+        """VLC options applied to the stream media"""
+        return (f':network-caching={int(self.buffer_ms)}',)
+
+    def open(self, url, buffer_ms=None):
+        self.close()
+        self.url = url
+        if buffer_ms is not None:
+            self.buffer_ms = buffer_ms
+        self.active = True
+        self._attempt = 0
+        self._probe()
+
+    def close(self):
+        """Forget the stream and stop any pending probe or reconnect"""
+        self.active = False
+        self.url = None
+        self._generation += 1
+        self._retry.stop()
+        self._watchdog.stop()
+
+    def stop(self):
+        """Playback was stopped by the user: keep the URL but do not reconnect"""
+        self._retry.stop()
+        self._watchdog.stop()
+        self._generation += 1
+
+    def started(self):
+        """Playback of the stream (re)started"""
+        self._last_time = None
+        self._stalled_for = 0.0
+        self._watchdog.start()
+
+    def _probe(self):
+        self._generation += 1
+        generation = self._generation
+        url, timeout = self.url, self.timeout
+
+        def run():
+            try:
+                result = probe_stream(url, timeout)
+            except Exception as e:
+                result = e
+            self._probed.emit(generation, result)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def _on_probed(self, generation, result):
+        if generation != self._generation or not self.active:
+            return
+        if isinstance(result, Exception):
+            if self._attempt == 0:
+                self.active = False
+                self.failed.emit(f'Failed to connect to stream: {result}')
+            else:
+                self._schedule_reconnect(str(result))
+            return
+        reconnect = self._attempt > 0
+        self.connected.emit(result, reconnect)
+
+    def _schedule_reconnect(self, reason):
+        self._watchdog.stop()
+        self._attempt += 1
+        delay = min(self.max_backoff, 2 ** (self._attempt - 1))
+        self.status.emit(f'Stream lost ({reason}), reconnecting in {delay:g}s...')
+        self._generation += 1
+        self._retry.start(int(delay * 1000))
+
+    def _check_progress(self):
+        time, _ = self.engine.position()
+        if time != self._last_time:
+            self._last_time = time
+            self._stalled_for = 0.0
+            if time > 0:
+                # Audio is flowing again: the next failure starts a fresh backoff
+                self._attempt = 0
+            return
+        self._stalled_for += self._watchdog.interval() / 1000
+        if self._stalled_for >= self.stall_timeout:
+            self._schedule_reconnect('stalled')
+
+    def _on_engine_error(self, message):
+        if self.active and self._watchdog.isActive():
+            self._schedule_reconnect(message)
+
+    def _on_stream_ended(self):
+        # Live streams do not end on their own
+        if self.active and self._watchdog.isActive():
+            self._schedule_reconnect('connection closed')
+
+    def _on_now_playing(self, title):
+        if self.active and title:
+            self.title_changed.emit(title)
@@ -0,0 +1,205 @@
+"""Silent stand-in for the part of python-vlc the player uses.
+
+Selected with MUSIC_PLAYER_BACKEND=stub, for running the player headless
+(benchmarks, CI without libvlc or a sound card). Nothing is decoded: a
+media "plays" for `TRACK_LENGTH` ms of wall-clock time. Events are fired
+from a worker thread like libvlc's, so PlaybackEngine goes through the
+same queued-signal path as with the real library.
+"""
+import threading
+import time
+
+# Delay before MediaPlayerPlaying, standing in for opening and decoding
+START_DELAY = 0.0
+# Length in ms reported for every media
+TRACK_LENGTH = 180000
+# Interval in ms between MediaPlayerTimeChanged events
+TICK = 250
+
+
+class EventType:
+    MediaPlayerPlaying = 'MediaPlayerPlaying'
+    MediaPlayerEndReached = 'MediaPlayerEndReached'
+    MediaPlayerEncounteredError = 'MediaPlayerEncounteredError'
+    MediaPlayerTimeChanged = 'MediaPlayerTimeChanged'
+    MediaPlayerLengthChanged = 'MediaPlayerLengthChanged'
+    MediaPlayerBuffering = 'MediaPlayerBuffering'
+    MediaMetaChanged = 'MediaMetaChanged'
+
+
+class Meta:
+    Title = 0
+    NowPlaying = 12
+
+
+class MediaParseFlag:
+    local = 0
+    network = 1
+
+
+class _Payload:
+    pass
+
+
+class Event:
+    def __init__(self, kind, **values):
+        self.type = kind
+        self.u = _Payload()
+        self.u.__dict__.update(values)
+
+
+class EventManager:
+    def __init__(self):
+        self._callbacks = {}
+        self._lock = threading.Lock()
+
+    def event_attach(self, kind, callback, *args):
+        with self._lock:
+            self._callbacks[kind] = (callback, args)
+
+    def event_detach(self, kind):
+        with self._lock:
+            self._callbacks.pop(kind, None)
+
+    def fire(self, kind, **values):
+        with self._lock:
+            entry = self._callbacks.get(kind)
+        if entry is not None:
+            callback, args = entry
+            callback(Event(kind, **values), *args)
+
+
+class Media:
+    def __init__(self, mrl, *options):
+        self._mrl = mrl
+        self._options = list(options)
+        self._events = EventManager()
+
+    def add_option(self, option):
+        self._options.append(option)
+
+    def event_manager(self):
+        return self._events
+
+    def get_mrl(self):
+        return self._mrl
+
+    def get_meta(self, key):
+        return None
+
+    def parse_with_options(self, flags, timeout):
+        return 0
+
+
+class MediaPlayer:
+    def __init__(self):
+        self._events = EventManager()
+        self._media = None
+        self._muted = False
+        self._volume = 100
+        self._lock = threading.Lock()
+        self._run = 0  # bumped on every play/pause/stop; stale clocks exit
+        self._offset = 0  # ms played before the clock was last started
+        self._started = None  # perf_counter when the clock was started, None while stopped
+
+    def event_manager(self):
+        return self._events
+
+    def set_media(self, media):
+        self.stop()
+        self._media = media
+
+    def get_media(self):
+        return self._media
+
+    def play(self):
+        if self._media is None:
+            return -1
+        with self._lock:
+            self._run += 1
+            run = self._run
+        threading.Thread(target=self._clock, args=(run,), daemon=True).start()
+        return 0
+
+    def set_pause(self, paused):
+        if paused:
+            with self._lock:
+                self._offset = self._elapsed()
+                self._started = None
+                self._run += 1
+        else:
+            self.play()
+
+    def stop(self):
+        with self._lock:
+            self._run += 1
+            self._offset = 0
+            self._started = None
+
+    def get_time(self):
+        with self._lock:
+            return int(self._elapsed())
+
+    def set_time(self, ms):
+        with self._lock:
+            self._offset = max(0, min(ms, TRACK_LENGTH))
+            if self._started is not None:
+                self._started = time.perf_counter()
+
+    def get_length(self):
+        return TRACK_LENGTH if self._media is not None else -1
+
+    def audio_set_mute(self, muted):
+        self._muted = bool(muted)
+
+    def audio_get_mute(self):
+        return self._muted
+
+    def audio_set_volume(self, volume):
+        self._volume = volume
+        return 0
+
+    def audio_get_volume(self):
+        return self._volume
+
+    def _elapsed(self):
+        # Caller holds the lock
+        if self._started is None:
+            return self._offset
+        return self._offset + (time.perf_counter() - self._started) * 1000
+
+    def _clock(self, run):
+        if START_DELAY:
+            time.sleep(START_DELAY)
+        with self._lock:
+            if run != self._run:
+                return
+            self._started = time.perf_counter()
+        self._events.fire(EventType.MediaPlayerPlaying)
+        self._events.fire(EventType.MediaPlayerLengthChanged, new_length=TRACK_LENGTH)
+        while True:
+            time.sleep(TICK / 1000)
+            with self._lock:
+                if run != self._run:
+                    return
+                now = self._elapsed()
+            if now >= TRACK_LENGTH:
+                break
+            self._events.fire(EventType.MediaPlayerTimeChanged, new_time=int(now))
+        with self._lock:
+            if run != self._run:
+                return
+            self._offset = TRACK_LENGTH
+            self._started = None
+        self._events.fire(EventType.MediaPlayerEndReached)
+
+
+class Instance:
+    def __init__(self, *options):
+        self.options = options
+
+    def media_player_new(self):
+        return MediaPlayer()
+
+    def media_new(self, mrl, *options):
+        return Media(mrl, *options)
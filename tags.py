@@ -0,0 +1,182 @@
+import base64
+import hashlib
+import os
+
+from startup import profile
+
+
+# mutagen is imported by the first parse rather than at startup; the
+# helpers below import the classes they need from the loaded modules
+_formats = None
+
+# Tag family -> our field name -> native key
+ID3_KEYS = {'title': 'TIT2', 'artist': 'TPE1', 'album': 'TALB', 'tracknumber': 'TRCK'}
+MP4_KEYS = {'title': '\xa9nam', 'artist': '\xa9ART', 'album': '\xa9alb', 'tracknumber': 'trkn'}
+VORBIS_KEYS = {'title': 'title', 'artist': 'artist', 'album': 'album', 'tracknumber': 'tracknumber'}
+
+# Stored as replaygain_<field> in TXXX frames (ID3), iTunes freeform atoms (MP4)
+# or plain comments (Vorbis, FLAC)
+REPLAYGAIN_FIELDS = ('track_gain', 'track_peak', 'album_gain', 'album_peak')
+
+
+def art_hash(data):
+    """Content hash used to dedupe embedded pictures (one album = one image)"""
+    return hashlib.sha1(data).hexdigest()
+
+
+def _load_formats():
+    # Concrete mutagen class per extension, so files are not probed against every format
+    global _formats
+    if _formats is None:
+        with profile.step('load mutagen'):
+            from mutagen.flac import FLAC
+            from mutagen.mp3 import MP3
+            from mutagen.mp4 import MP4
+            from mutagen.oggvorbis import OggVorbis
+            from mutagen.wave import WAVE
+        _formats = {'.mp3': MP3, '.flac': FLAC, '.ogg': OggVorbis, '.m4a': MP4, '.wav': WAVE}
+    return _formats
+
+
+def _open(filepath):
+    from mutagen import File as MutagenFile
+
+    cls = _load_formats().get(os.path.splitext(filepath)[1].lower())
+    if cls is not None:
+        try:
+            return cls(filepath)
+        except Exception:
+            pass
+    # Wrong extension or an unusual container (e.g. Opus in .ogg): let mutagen guess
+    return MutagenFile(filepath)
+
+
+def _text(tags, key):
+    from mutagen.id3 import ID3
+
+    if isinstance(tags, ID3):
+        frame = tags.get(key)
+        return str(frame.text[0]) if frame is not None and frame.text else None
+    values = tags.get(key)
+    if not values:
+        return None
+    value = values[0]
+    if isinstance(value, tuple):
+        # MP4 track numbers are (number, total) pairs
+        number, total = value
+        return f'{number}/{total}' if total else str(number)
+    return str(value)
+
+
+def _replaygain(tags):
+    """Return the ReplayGain fields present in the tags as floats (dB for gains)"""
+    from mutagen.id3 import ID3
+    from mutagen.mp4 import MP4Tags
+
+    if isinstance(tags, ID3):
+        texts = {frame.desc.lower(): str(frame.text[0]) for frame in tags.getall('TXXX') if frame.text}
+    elif isinstance(tags, MP4Tags):
+        prefix = '----:com.apple.itunes:'
+        texts = {key[len(prefix):].lower(): bytes(values[0]).decode('utf-8', 'replace')
+                 for key, values in tags.items() if key.lower().startswith(prefix) and values}
+    else:
+        texts = {}
+        for field in REPLAYGAIN_FIELDS:
+            value = _text(tags, 'replaygain_' + field)
+            if value:
+                texts['replaygain_' + field] = value
+    values = {}
+    for field in REPLAYGAIN_FIELDS:
+        text = texts.get('replaygain_' + field)
+        try:
+            # e.g. "-6.54 dB" or "0.988547"
+            values[field] = float(text.split()[0])
+        except (AttributeError, IndexError, ValueError):
+            pass
+    return values
+
+
+def _picture(audio):
+    """Return the raw bytes of the first embedded picture, front cover preferred"""
+    from mutagen.flac import Picture
+    from mutagen.id3 import ID3
+    from mutagen.mp4 import MP4Tags
+
+    tags = audio.tags
+    if getattr(audio, 'pictures', None):
+        return audio.pictures[0].data
+    if tags is None:
+        return None
+    if isinstance(tags, ID3):
+        frames = tags.getall('APIC')
+        if not frames:
+            return None
+        front = [f for f in frames if f.type == 3]
+        return (front or frames)[0].data
+    if isinstance(tags, MP4Tags):
+        covers = tags.get('covr')
+        return bytes(covers[0]) if covers else None
+    blocks = tags.get('metadata_block_picture')
+    if blocks:
+        try:
+            return Picture(base64.b64decode(blocks[0])).data
+        except Exception:
+            return None
+    return None
+
+
+def read_tags(filepath):
+    """Read a track's tags, duration, bitrate, art hash and ReplayGain values in one parse.
+
+    Works the same for every supported format; missing values fall back to
+    the same defaults the playlist has always shown. art_hash is '' when the
+    file has no embedded picture; ReplayGain fields are None when not tagged.
+    """
+    record = {
+        'title': os.path.basename(filepath), 'artist': '-', 'album': '-', 'tracknumber': '0',
+        'duration': 0.0, 'bitrate': 0, 'art_hash': '',
+        'track_gain': None, 'track_peak': None, 'album_gain': None, 'album_peak': None,
+    }
+    try:
+        audio = _open(filepath)
+    except Exception:
+        return record
+    if audio is None:
+        return record
+    from mutagen.id3 import ID3
+    from mutagen.mp4 import MP4Tags
+
+    info = audio.info
+    if info is not None:
+        record['duration'] = float(getattr(info, 'length', 0.0) or 0.0)
+        record['bitrate'] = int(getattr(info, 'bitrate', 0) or 0)
+    tags = audio.tags
+    if tags is not None:
+        keys = ID3_KEYS if isinstance(tags, ID3) else MP4_KEYS if isinstance(tags, MP4Tags) else VORBIS_KEYS
+        for field, key in keys.items():
+            try:
+                value = _text(tags, key)
+            except Exception:
+                value = None
+            if value:
+                record[field] = value
+        try:
+            record.update(_replaygain(tags))
+        except Exception:
+            pass
+    try:
+        art = _picture(audio)
+    except Exception:
+        art = None
+    if art:
+        record['art_hash'] = art_hash(art)
+    return record
+
+
+def read_art(filepath):
+    """Return the embedded picture bytes for a file, or None"""
+    try:
+        audio = _open(filepath)
+        return _picture(audio) if audio is not None else None
+    except Exception:
+        return None
@@ -0,0 +1,76 @@
+"""DuplicateFinder on small WAV files, with a throwaway library cache."""
+import os
+import struct
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt5.QtCore import QCoreApplication, QEventLoop
+
+from dedupe import DuplicateFinder
+from library import LibraryCache
+
+
+def write_wav(filepath, samples):
+    data = struct.pack(f'<{len(samples)}h', *samples)
+    fmt = struct.pack('<HHIIHH', 1, 1, 8000, 16000, 2, 16)
+    body = b'WAVE' + b'fmt ' + struct.pack('<I', len(fmt)) + fmt + b'data' + struct.pack('<I', len(data)) + data
+    with open(filepath, 'wb') as f:
+        f.write(b'RIFF' + struct.pack('<I', len(body)) + body)
+
+
+@pytest.fixture(scope='module')
+def app():
+    return QCoreApplication.instance() or QCoreApplication([])
+
+
+@pytest.fixture
+def tracks(tmp_path):
+    # Tracks 0 and 2 are copies; 1 has the same length but other audio
+    paths = [str(tmp_path / f'{name}.wav') for name in ('a', 'b', 'c')]
+    write_wav(paths[0], range(4000))
+    write_wav(paths[1], range(1, 4001))
+    write_wav(paths[2], range(4000))
+    return [(track, filepath, 3.0) for track, filepath in enumerate(paths)]
+
+
+@pytest.fixture
+def finder(tmp_path):
+    library = LibraryCache(str(tmp_path / 'library.db'))
+    yield DuplicateFinder(library)
+    library.close()
+
+
+def run_workers(started):
+    # Let the search threads finish without delivering their queued signals
+    for thread in set(threading.enumerate()) - started:
+        thread.join(10)
+
+
+def test_finds_identical_audio(app, finder, tracks):
+    found = []
+    finder.finished.connect(found.append)
+    finder.find(tracks)
+    deadline = time.perf_counter() + 10
+    while not found:
+        assert time.perf_counter() < deadline, 'timed out'
+        app.processEvents(QEventLoop.AllEvents, 10)
+    assert found == [[[0, 2]]]
+
+
+def test_cancel_drops_queued_result(app, finder, tracks):
+    found = []
+    finder.finished.connect(found.append)
+    started = set(threading.enumerate())
+    finder.find(tracks)
+    run_workers(started)
+    # The playlist was replaced after the result was queued: ids 0 and 2
+    # may be other tracks now
+    finder.cancel()
+    app.processEvents()
+    assert found == []
@@ -0,0 +1,117 @@
+"""LibraryServer on a local port, serving a playlist of temporary files."""
+import json
+import os
+import socket
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt5.QtCore import QCoreApplication, QEventLoop
+
+from library_server import LibraryServer, parse_range
+from playlist import Playlist
+
+META = {'title': 'Song', 'artist': 'Artist', 'album': 'Album', 'tracknumber': '1', 'duration': 3.0, 'bitrate': 128,
+        'art_hash': '', 'track_gain': None, 'track_peak': None, 'album_gain': None, 'album_peak': None}
+
+
+@pytest.fixture(scope='module')
+def app():
+    return QCoreApplication.instance() or QCoreApplication([])
+
+
+def wait_for(app, condition, timeout=5.0):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        assert time.perf_counter() < deadline, 'timed out'
+        app.processEvents(QEventLoop.AllEvents, 10)
+
+
+@pytest.fixture
+def server(app, tmp_path):
+    data = os.urandom(8 << 20)
+    filepath = tmp_path / 'song.mp3'
+    filepath.write_bytes(data)
+    playlist = Playlist()
+    playlist.add(str(filepath), META)
+    playlist.add('http://example.invalid/live', META)
+    server = LibraryServer(playlist)
+    urls = []
+    server.started.connect(urls.append)
+    server.start('127.0.0.1', 0)
+    wait_for(app, lambda: urls)
+    server.port = int(urls[0].rstrip('/').rsplit(':', 1)[1])
+    server.data = data
+    yield server
+    server.stop()
+
+
+def request(port, target, headers=''):
+    client = socket.create_connection(('127.0.0.1', port), timeout=5)
+    client.sendall(f'GET {target} HTTP/1.1\r\nHost: test\r\n{headers}\r\n'.encode())
+    return client
+
+
+def read_response(client):
+    # (status, headers, body) of one response on a kept-alive connection
+    head = b''
+    while b'\r\n\r\n' not in head:
+        head += client.recv(1)
+    lines = head.decode('latin-1').split('\r\n')
+    headers = {name.lower(): value for name, _, value in (line.partition(': ') for line in lines[1:] if line)}
+    body = b''
+    while len(body) < int(headers['content-length']):
+        body += client.recv(65536)
+    return int(lines[0].split()[1]), headers, body
+
+
+def test_parse_range():
+    assert parse_range('bytes=0-99', 1000) == (0, 99)
+    assert parse_range('bytes=900-', 1000) == (900, 999)
+    assert parse_range('bytes=-100', 1000) == (900, 999)
+    assert parse_range('bytes=0-5000', 1000) == (0, 999)
+    assert parse_range('bytes=1000-', 1000) is False
+    assert parse_range('bytes=0-1,5-6', 1000) is None
+    assert parse_range(None, 1000) is None
+
+
+def test_lists_local_tracks_only(server):
+    with request(server.port, '/') as client:
+        status, headers, body = read_response(client)
+    assert status == 200
+    listing = json.loads(body)
+    assert [item['url'] for item in listing['tracks']] == ['/tracks/0.mp3']
+    assert listing['tracks'][0]['title'] == 'Song'
+
+
+def test_serves_ranges(server):
+    with request(server.port, '/tracks/0.mp3', 'Range: bytes=100-199\r\n') as client:
+        status, headers, body = read_response(client)
+        assert status == 206
+        assert headers['content-range'] == f'bytes 100-199/{len(server.data)}'
+        assert body == server.data[100:200]
+        # Same connection, next request
+        client.sendall(b'GET /tracks/1.mp3 HTTP/1.1\r\nHost: test\r\n\r\n')
+        assert read_response(client)[0] == 404
+
+
+def test_stop_closes_open_connections(app, server):
+    idle = request(server.port, '/')
+    read_response(idle)
+    streaming = request(server.port, '/tracks/0.mp3')
+    streaming.recv(1000)
+    server.stop()
+    for client in (idle, streaming):
+        received = 0
+        while True:
+            chunk = client.recv(1 << 20)
+            if not chunk:
+                break
+            received += len(chunk)
+        # Only what was already in the socket buffers, not the rest of the file
+        assert received < len(server.data)
+        client.close()
@@ -0,0 +1,208 @@
+"""Loudness measurement of WAV and FLAC files.
+
+There is no FLAC encoder among the dependencies, so the FLAC files are
+written here: every subframe type, stereo decorrelation mode and residual
+coding the decoder handles, with real PCM behind them. Frame CRCs are left
+zero; the decoder does not check them.
+"""
+import math
+import os
+import struct
+import sys
+import wave
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loudness import REFERENCE_LUFS, analyze_file, decode_flac
+
+RATE = 8000
+BLOCK = 1152
+
+
+class BitWriter:
+    def __init__(self):
+        self.value = 0
+        self.length = 0
+
+    def write(self, value, n):
+        self.value = (self.value << n) | (value & ((1 << n) - 1))
+        self.length += n
+
+    def unary(self, zeros):
+        self.write(1, zeros + 1)
+
+    def align(self):
+        self.write(0, -self.length % 8)
+
+    def getvalue(self):
+        return self.value.to_bytes(self.length // 8, 'big')
+
+
+def write_residual(w, residual, order, method):
+    # Two partitions: the first Rice coded, the second an escaped (raw) one
+    param_bits, escape = (4, 15) if method == 0 else (5, 31)
+    w.write(method, 2)
+    w.write(1, 4)
+    half = BLOCK // 2
+    rice, raw = residual[:half - order], residual[half - order:]
+    folded = [value << 1 if value >= 0 else (-value << 1) - 1 for value in rice]
+    # Rice parameter near log2 of the mean, as encoders pick it
+    param = min(escape - 1, max(0, (sum(folded) // len(folded)).bit_length() - 1))
+    w.write(param, param_bits)
+    for value in folded:
+        w.unary(value >> param)
+        w.write(value, param)
+    width = max(value.bit_length() for value in raw) + 1
+    w.write(escape, param_bits)
+    w.write(width, 5)
+    for value in raw:
+        w.write(value, width)
+
+
+def write_subframe(w, samples, bits, kind, wasted=0):
+    w.write(0, 1)
+    code = {'constant': 0, 'verbatim': 1, 'fixed': 8 + 2, 'lpc': 31 + 2}[kind]
+    w.write(code, 6)
+    if wasted:
+        w.write(1, 1)
+        w.unary(wasted - 1)
+        samples = [sample >> wasted for sample in samples]
+        bits -= wasted
+    else:
+        w.write(0, 1)
+    if kind == 'constant':
+        w.write(samples[0], bits)
+    elif kind == 'verbatim':
+        for sample in samples:
+            w.write(sample, bits)
+    elif kind == 'fixed':
+        w.write(samples[0], bits)
+        w.write(samples[1], bits)
+        residual = [samples[i] - (2 * samples[i - 1] - samples[i - 2]) for i in range(2, len(samples))]
+        write_residual(w, residual, 2, 0)
+    else:
+        coeffs, precision, shift = (7, -3), 5, 2
+        w.write(samples[0], bits)
+        w.write(samples[1], bits)
+        w.write(precision - 1, 4)
+        w.write(shift, 5)
+        for coeff in coeffs:
+            w.write(coeff, precision)
+        residual = [samples[i] - ((coeffs[0] * samples[i - 1] + coeffs[1] * samples[i - 2]) >> shift)
+                    for i in range(2, len(samples))]
+        write_residual(w, residual, 2, 1)
+
+
+def encode_flac(channels, bits=16, kinds=('lpc', 'fixed'), stereo='independent', wasted=0):
+    """FLAC bytes for per-channel sample lists (a multiple of BLOCK long)"""
+    count = len(channels[0])
+    packed = (RATE << 44) | ((len(channels) - 1) << 41) | ((bits - 1) << 36) | count
+    info = struct.pack('>HH3s3s', BLOCK, BLOCK, bytes(3), bytes(3)) + packed.to_bytes(8, 'big') + bytes(16)
+    out = [b'fLaC', bytes([0x80, 0, 0, len(info)]), info]
+    assignment = {'independent': len(channels) - 1, 'left_side': 8, 'side_right': 9, 'mid_side': 10}[stereo]
+    for number, start in enumerate(range(0, count, BLOCK)):
+        block = [channel[start:start + BLOCK] for channel in channels]
+        coded, extra = block, [0] * len(block)
+        if stereo != 'independent':
+            left, right = block
+            side = [l - r for l, r in zip(left, right)]
+            if stereo == 'left_side':
+                coded, extra = [left, side], [0, 1]
+            elif stereo == 'side_right':
+                coded, extra = [side, right], [1, 0]
+            else:
+                coded, extra = [[(l + r) >> 1 for l, r in zip(left, right)], side], [0, 1]
+        w = BitWriter()
+        w.write(0xfff8, 16)
+        w.write(7, 4)  # 16-bit block size after the frame number
+        w.write(0, 4)  # sample rate from the stream info
+        w.write(assignment, 4)
+        w.write(4 if bits == 16 else 0, 3)
+        w.write(0, 1)
+        for byte in chr(number + 300).encode('utf-8'):
+            w.write(byte, 8)
+        w.write(BLOCK - 1, 16)
+        w.write(0, 8)
+        for index, samples in enumerate(coded):
+            kind = kinds[index % len(kinds)]
+            if len(set(samples)) == 1:
+                kind = 'constant'
+            write_subframe(w, samples, bits + extra[index], kind, wasted)
+        w.align()
+        w.write(0, 16)
+        out.append(w.getvalue())
+    return b''.join(out)
+
+
+def tone(seconds, amplitude, bits=16, frequency=997, phase=0.0):
+    full = (1 << (bits - 1)) - 1
+    count = int(seconds * RATE) // BLOCK * BLOCK
+    return [round(full * amplitude * math.sin(2 * math.pi * frequency * i / RATE + phase)) for i in range(count)]
+
+
+def write_wav(filepath, channels):
+    with wave.open(filepath, 'wb') as wav:
+        wav.setnchannels(len(channels))
+        wav.setsampwidth(2)
+        wav.setframerate(RATE)
+        frames = [sample for frame in zip(*channels) for sample in frame]
+        wav.writeframes(struct.pack(f'<{len(frames)}h', *frames))
+
+
+def decoded(data):
+    rate, count, bits, frames = decode_flac(data)
+    channels = [[] for _ in range(count)]
+    for frame in frames:
+        for channel, samples in zip(channels, frame):
+            channel.extend(samples)
+    return rate, bits, channels
+
+
+@pytest.mark.parametrize('stereo', ['independent', 'left_side', 'side_right', 'mid_side'])
+def test_decodes_stereo_modes(stereo):
+    left, right = tone(0.5, 0.5), tone(0.5, 0.3, phase=1.0)
+    data = encode_flac([left, right], kinds=('lpc', 'fixed', 'verbatim'), stereo=stereo)
+    assert decoded(data) == (RATE, 16, [left, right])
+
+
+def test_decodes_constant_verbatim_and_wasted_bits():
+    quiet = [0] * (2 * BLOCK)
+    coarse = [sample & ~7 for sample in tone(2 * BLOCK / RATE, 0.8, bits=24)]
+    data = encode_flac([quiet, coarse], bits=24, kinds=('verbatim', 'lpc'), wasted=3)
+    assert decoded(data) == (RATE, 24, [quiet, coarse])
+
+
+def test_flac_and_wav_measure_the_same(tmp_path):
+    # A 997 Hz tone at -20 dBFS in both channels measures -20 LUFS
+    channels = [tone(2.0, 0.1), tone(2.0, 0.1)]
+    flac, wav = str(tmp_path / 'tone.flac'), str(tmp_path / 'tone.wav')
+    with open(flac, 'wb') as f:
+        f.write(encode_flac(channels))
+    write_wav(wav, channels)
+    gain, peak = analyze_file(flac)
+    assert (gain, peak) == analyze_file(wav)
+    assert gain == pytest.approx(REFERENCE_LUFS + 20, abs=0.1)
+    assert peak == pytest.approx(0.1, abs=0.001)
+
+
+def test_truncated_flac_keeps_complete_frames(tmp_path):
+    channels = [tone(1.0, 0.25)]
+    data = encode_flac(channels, kinds=('verbatim',))
+    # Cut the last frame in half
+    frame = len(data) - len(encode_flac([channels[0][:-BLOCK]], kinds=('verbatim',)))
+    _, _, [samples] = decoded(data[:-frame // 2])
+    assert samples == channels[0][:-BLOCK]
+    filepath = str(tmp_path / 'cut.flac')
+    with open(filepath, 'wb') as f:
+        f.write(data[:-frame // 2] + b'TAG' + bytes(125))
+    assert analyze_file(filepath) is not None
+
+
+def test_unreadable_files(tmp_path):
+    filepath = str(tmp_path / 'bad.flac')
+    with open(filepath, 'wb') as f:
+        f.write(b'fLaC' + bytes(40))
+    assert analyze_file(filepath) is None
+    assert analyze_file(str(tmp_path / 'missing.wav')) is None
@@ -0,0 +1,59 @@
+"""PlaybackEngine on the silent stub backend, with tracks a few ticks long."""
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+os.environ['MUSIC_PLAYER_BACKEND'] = 'stub'
+
+from PyQt5.QtCore import QCoreApplication, QEventLoop
+
+import stub_vlc
+from playback import PlaybackEngine, READY
+
+
+@pytest.fixture(scope='module')
+def app():
+    return QCoreApplication.instance() or QCoreApplication([])
+
+
+@pytest.fixture
+def engine(app, monkeypatch):
+    monkeypatch.setattr(stub_vlc, 'TRACK_LENGTH', 300)
+    monkeypatch.setattr(stub_vlc, 'TICK', 20)
+    engine = PlaybackEngine()
+    engine.next_track = lambda track: (track + 1, f'/music/{track + 1}.mp3') if track is not None and track < 9 else None
+    engine.started, engine.finished = [], []
+    engine.track_started.connect(engine.started.append)
+    engine.queue_finished.connect(lambda: engine.finished.append(True))
+    yield engine
+    engine.stop()
+
+
+def wait_for(app, condition, timeout=5.0):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        assert time.perf_counter() < deadline, 'timed out'
+        app.processEvents(QEventLoop.AllEvents, 10)
+
+
+def test_advances_to_preloaded_track(app, engine):
+    engine.play(3, '/music/3.mp3')
+    wait_for(app, lambda: engine._state[1 - engine._active] == READY)
+    wait_for(app, lambda: engine.started)
+    assert engine.started == [4]
+    assert engine.current_track == 4
+
+
+def test_forgotten_queue_does_not_advance(app, engine):
+    engine.play(3, '/music/3.mp3')
+    wait_for(app, lambda: engine._state[1 - engine._active] == READY)
+    # The playlist is replaced while track 3 plays: id 4 is another song now
+    engine.forget_queue()
+    engine.refresh_preload()
+    assert engine.current_track is None
+    wait_for(app, lambda: engine.finished)
+    assert engine.started == []
@@ -0,0 +1,235 @@
+"""StreamSession and probe_stream against a local stand-in for a radio server.
+
+The stand-in answers by path and can be switched to stall (send headers,
+then nothing) or drop the connection, so the reconnect path runs without
+a network. Run with: python -m pytest tests
+"""
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt5.QtCore import QCoreApplication, QEventLoop, QObject, pyqtSignal
+
+from streaming import StreamSession, parse_icy_metadata, probe_stream
+
+METAINT = 32
+AUDIO = b'\xff\xfb\x90\xc0' * (METAINT // 4)
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.0'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.requests += 1
+        mode = server.mode if self.path == '/live' else self.path.strip('/')
+        if mode == 'drop':
+            # Accept the request, then hang up without a response
+            return
+        if mode == 'html':
+            self._head(200, 'text/html; charset=utf-8')
+            self.wfile.write(b'<html><body>Not a stream</body></html>')
+            return
+        if mode == 'library':
+            body = json.dumps({'name': 'Den', 'tracks': [
+                {'url': '/tracks/0.mp3', 'title': 'One', 'duration': 3, 'bitrate': 'bad'}]}).encode()
+            self._head(200, 'application/json')
+            self.wfile.write(body)
+            return
+        if mode == 'empty':
+            # Audio headers without ICY metadata, then the body ends at once
+            self._head(200, 'audio/mpeg')
+            return
+        self._head(200, 'audio/mpeg', {'icy-name': 'Stand-in FM', 'icy-br': '128', 'icy-metaint': str(METAINT)})
+        if mode == 'stall':
+            server.release.wait(10)
+            return
+        block = b"StreamTitle='Artist - Song';"
+        block += bytes(-len(block) % 16)
+        self.wfile.write(AUDIO + bytes([len(block) // 16]) + block + AUDIO)
+
+    def _head(self, status, content_type, fields=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        for name, value in (fields or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    httpd.daemon_threads = True
+    httpd.mode = 'ok'
+    httpd.requests = 0
+    httpd.release = threading.Event()
+    httpd.url = f'http://127.0.0.1:{httpd.server_address[1]}/'
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd
+    httpd.release.set()
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture(scope='module')
+def app():
+    return QCoreApplication.instance() or QCoreApplication([])
+
+
+def wait_for(app, condition, timeout=10.0):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        assert time.perf_counter() < deadline, 'timed out'
+        app.processEvents(QEventLoop.AllEvents, 10)
+
+
+class FakeEngine(QObject):
+    """The part of PlaybackEngine a StreamSession listens to"""
+
+    error = pyqtSignal(str)
+    queue_finished = pyqtSignal()
+    now_playing = pyqtSignal(str)
+
+    def __init__(self):
+        super().__init__()
+        self.time = 0
+
+    def position(self):
+        return self.time, 0
+
+
+class Recorder:
+    def __init__(self, session):
+        self.connected = []
+        self.failed = []
+        self.status = []
+        session.connected.connect(lambda info, reconnect: self.connected.append((info, reconnect)))
+        session.failed.connect(self.failed.append)
+        session.status.connect(self.status.append)
+
+
+def test_parse_icy_metadata():
+    assert parse_icy_metadata(b"StreamTitle='A - B';StreamUrl='';\0\0") == {'StreamTitle': 'A - B', 'StreamUrl': ''}
+    assert parse_icy_metadata("StreamTitle='Café';".encode('latin-1')) == {'StreamTitle': 'Café'}
+
+
+def test_probe_reads_icy_details(server):
+    info = probe_stream(server.url + 'ok', timeout=2)
+    assert info['name'] == 'Stand-in FM'
+    assert info['bitrate'] == '128'
+    assert info['content_type'] == 'audio/mpeg'
+    assert info['title'] == 'Artist - Song'
+
+
+def test_probe_rejects_web_page(server):
+    with pytest.raises(ValueError, match='web page'):
+        probe_stream(server.url + 'html', timeout=2)
+
+
+def test_probe_reads_shared_library(server):
+    info = probe_stream(server.url + 'library', timeout=2)
+    assert info['name'] == 'Den'
+    [(url, meta)] = info['library']
+    assert url == server.url + 'tracks/0.mp3'
+    assert (meta['title'], meta['duration'], meta['bitrate']) == ('One', 3.0, 0)
+
+
+def test_probe_fails_on_dropped_connection(server):
+    with pytest.raises(OSError):
+        probe_stream(server.url + 'drop', timeout=2)
+
+
+def test_probe_fails_on_stream_without_audio(server):
+    with pytest.raises(OSError, match='without sending audio'):
+        probe_stream(server.url + 'empty', timeout=2)
+
+
+def test_probe_times_out_on_stalled_server(server):
+    start = time.perf_counter()
+    with pytest.raises(OSError):
+        probe_stream(server.url + 'stall', timeout=0.3)
+    assert time.perf_counter() - start < 5
+
+
+def test_session_rejects_web_page(app, server):
+    session = StreamSession(FakeEngine(), timeout=2)
+    events = Recorder(session)
+    session.open(server.url + 'html')
+    wait_for(app, lambda: events.failed)
+    assert 'web page' in events.failed[0]
+    assert not session.active
+    assert not events.connected
+
+
+def test_session_reconnects_with_backoff(app, server):
+    engine = FakeEngine()
+    session = StreamSession(engine, timeout=0.3)
+    events = Recorder(session)
+    session.open(server.url + 'live')
+    wait_for(app, lambda: events.connected)
+    assert events.connected[0][1] is False
+    assert events.connected[0][0]['title'] == 'Artist - Song'
+    session.started()
+
+    # Playback fails; the first reconnect stalls, the second gets through
+    server.mode = 'stall'
+    engine.error.emit('Playback error')
+    assert events.status == ['Stream lost (Playback error), reconnecting in 1s...']
+    wait_for(app, lambda: len(events.status) == 2)
+    assert events.status[1].endswith('reconnecting in 2s...')
+    assert 'timed out' in events.status[1]
+    server.mode = 'ok'
+    wait_for(app, lambda: len(events.connected) == 2)
+    assert events.connected[1][1] is True
+    assert session.active and not events.failed
+
+
+def test_session_reconnects_when_playback_stalls(app, server):
+    engine = FakeEngine()
+    session = StreamSession(engine, timeout=2, stall_timeout=1)
+    events = Recorder(session)
+    session.open(server.url + 'live')
+    wait_for(app, lambda: events.connected)
+    session.started()
+    engine.time = 500
+    # No progress past 500 ms: the watchdog gives up and reconnects
+    wait_for(app, lambda: events.status)
+    assert events.status[0] == 'Stream lost (stalled), reconnecting in 1s...'
+    wait_for(app, lambda: len(events.connected) == 2)
+    assert events.connected[1][1] is True
+
+
+def test_session_reconnects_when_server_hangs_up(app, server):
+    engine = FakeEngine()
+    session = StreamSession(engine, timeout=2)
+    events = Recorder(session)
+    session.open(server.url + 'live')
+    wait_for(app, lambda: events.connected)
+    session.started()
+    requests = server.requests
+    engine.queue_finished.emit()
+    assert events.status == ['Stream lost (connection closed), reconnecting in 1s...']
+    wait_for(app, lambda: len(events.connected) == 2)
+    assert server.requests == requests + 1
+
+
+def test_closed_session_ignores_late_probe(app, server):
+    session = StreamSession(FakeEngine(), timeout=2)
+    events = Recorder(session)
+    session.open(server.url + 'stall')
+    session.close()
+    server.release.set()
+    time.sleep(0.2)
+    app.processEvents()
+    assert not events.connected and not events.failed
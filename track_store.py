@@ -0,0 +1,218 @@
+import os
+from array import array
+
+
+class StringTable:
+    """Interns repeated strings (artists, albums, folders) as small integer ids"""
+
+    def __init__(self, strings=()):
+        self._strings = list(strings)
+        self._ids = {text: sid for sid, text in enumerate(self._strings)}
+
+    def __len__(self):
+        return len(self._strings)
+
+    def id_for(self, text):
+        sid = self._ids.get(text)
+        if sid is None:
+            sid = self._ids[text] = len(self._strings)
+            self._strings.append(text)
+        return sid
+
+    def __getitem__(self, sid):
+        return self._strings[sid]
+
+    def clear(self):
+        self._ids.clear()
+        self._strings.clear()
+
+
+_UNKNOWN = float('nan')
+
+
+def _optional(value):
+    # Optional numbers are kept as NaN in the float columns
+    return _UNKNOWN if value is None else float(value)
+
+
+def _split_path(filepath):
+    # Split after the last separator so prefix + name gives back the exact path
+    cut = max(filepath.rfind('/'), filepath.rfind(os.sep)) + 1
+    return filepath[:cut], filepath[cut:]
+
+
+class TrackStore:
+    """Column-oriented store for the tracks of the playlist.
+
+    A track is an integer id (its row). Numbers live in typed arrays,
+    repeated strings (artist, album, track number, art hash and the folder
+    part of the path) are stored once in shared StringTables and referenced
+    by id, and only titles and file names are kept per track. Optional
+    numbers (ReplayGain values) are NaN when unknown. Removed tracks
+    leave a tombstone so ids stay stable for the indexes that refer to them.
+
+    `store[track]` returns the track's fields as a dict, the same shape the
+    tag reader and library cache produce.
+    """
+
+    FIELDS = ('title', 'artist', 'album', 'tracknumber', 'duration', 'bitrate', 'art_hash',
+              'track_gain', 'track_peak', 'album_gain', 'album_peak')
+    # Columns of the serialized form: interned string ids, plain values and
+    # optional numbers (None when unknown, may be missing from older files)
+    _STRING_COLUMNS = ('folder', 'artist', 'album', 'tracknumber', 'art_hash')
+    _PLAIN_COLUMNS = ('name', 'title', 'duration', 'bitrate')
+    _OPTIONAL_COLUMNS = ('track_gain', 'track_peak', 'album_gain', 'album_peak')
+
+    def __init__(self):
+        self.strings = StringTable()
+        self._folder = array('I')
+        self._name = []
+        self._title = []
+        self._artist = array('I')
+        self._album = array('I')
+        self._tracknumber = array('I')
+        self._art_hash = array('I')
+        self._duration = array('d')
+        self._bitrate = array('i')
+        self._track_gain = array('d')
+        self._track_peak = array('d')
+        self._album_gain = array('d')
+        self._album_peak = array('d')
+        self._alive = bytearray()
+        self._count = 0
+
+    def __len__(self):
+        """Number of live (not removed) tracks"""
+        return self._count
+
+    def __contains__(self, track):
+        return 0 <= track < len(self._alive) and self._alive[track] == 1
+
+    def __iter__(self):
+        """Live track ids in insertion order"""
+        alive = self._alive
+        return (track for track in range(len(alive)) if alive[track])
+
+    def add(self, filepath, meta):
+        """Append a track and return its id"""
+        intern = self.strings.id_for
+        folder, name = _split_path(filepath)
+        self._folder.append(intern(folder))
+        self._name.append(name)
+        self._title.append(str(meta['title'] or ''))
+        self._artist.append(intern(str(meta['artist'] or '')))
+        self._album.append(intern(str(meta['album'] or '')))
+        self._tracknumber.append(intern(str(meta['tracknumber'] or '')))
+        self._art_hash.append(intern(meta['art_hash'] or ''))
+        self._duration.append(float(meta['duration'] or 0.0))
+        self._bitrate.append(int(meta['bitrate'] or 0))
+        for column in self._OPTIONAL_COLUMNS:
+            getattr(self, '_' + column).append(_optional(meta[column]))
+        self._alive.append(1)
+        self._count += 1
+        return len(self._alive) - 1
+
+    def update(self, track, meta):
+        """Replace the fields given in meta for an existing track"""
+        intern = self.strings.id_for
+        for field in self.FIELDS:
+            if field not in meta:
+                continue
+            value = meta[field]
+            if field == 'title':
+                self._title[track] = str(value or '')
+            elif field == 'duration':
+                self._duration[track] = float(value or 0.0)
+            elif field == 'bitrate':
+                self._bitrate[track] = int(value or 0)
+            elif field in self._OPTIONAL_COLUMNS:
+                getattr(self, '_' + field)[track] = _optional(value)
+            else:
+                getattr(self, '_' + field)[track] = intern(str(value or ''))
+
+    def set_path(self, track, filepath):
+        """Point a track at its file's new location (a moved file)"""
+        folder, name = _split_path(filepath)
+        self._folder[track] = self.strings.id_for(folder)
+        self._name[track] = name
+
+    def remove(self, track):
+        if track in self:
+            self._alive[track] = 0
+            self._name[track] = ''
+            self._title[track] = ''
+            self._count -= 1
+
+    def clear(self):
+        self.__init__()
+
+    def dump(self, tracks=None):
+        """Return the given track ids (all live tracks by default) as plain
+        columns for serialization. Rows are renumbered from 0 in that order
+        and only the strings they use are kept."""
+        tracks = list(self) if tracks is None else list(tracks)
+        strings = StringTable()
+        intern = strings.id_for
+        table = self.strings
+        columns = {}
+        for column in self._STRING_COLUMNS:
+            values = getattr(self, '_' + column)
+            columns[column] = [intern(table[values[track]]) for track in tracks]
+        for column in self._PLAIN_COLUMNS:
+            values = getattr(self, '_' + column)
+            columns[column] = [values[track] for track in tracks]
+        for column in self._OPTIONAL_COLUMNS:
+            values = getattr(self, '_' + column)
+            columns[column] = [None if values[track] != values[track] else values[track] for track in tracks]
+        columns['strings'] = strings._strings
+        return columns
+
+    @classmethod
+    def load(cls, columns):
+        """Build a store from the output of dump(); raises ValueError if it is malformed"""
+        store = cls()
+        try:
+            store.strings = StringTable(columns['strings'])
+            for column in cls._STRING_COLUMNS:
+                setattr(store, '_' + column, array('I', columns[column]))
+            store._name = list(map(str, columns['name']))
+            store._title = list(map(str, columns['title']))
+            store._duration = array('d', columns['duration'])
+            store._bitrate = array('i', columns['bitrate'])
+            for column in cls._OPTIONAL_COLUMNS:
+                values = columns.get(column) or [None] * len(store._name)
+                setattr(store, '_' + column, array('d', map(_optional, values)))
+        except (KeyError, TypeError, OverflowError) as e:
+            raise ValueError(f'Invalid track columns: {e}') from None
+        count = len(store._name)
+        if any(len(getattr(store, '_' + column)) != count
+               for column in cls._STRING_COLUMNS + cls._PLAIN_COLUMNS + cls._OPTIONAL_COLUMNS):
+            raise ValueError('Track columns have different lengths')
+        if count and max(max(getattr(store, '_' + column)) for column in cls._STRING_COLUMNS) >= len(store.strings):
+            raise ValueError('Track columns refer to unknown strings')
+        store._alive = bytearray(b'\x01') * count
+        store._count = count
+        return store
+
+    def path(self, track):
+        return self.strings[self._folder[track]] + self._name[track]
+
+    def __getitem__(self, track):
+        strings = self.strings
+        return {
+            'title': self._title[track],
+            'artist': strings[self._artist[track]],
+            'album': strings[self._album[track]],
+            'tracknumber': strings[self._tracknumber[track]],
+            'duration': self._duration[track],
+            'bitrate': self._bitrate[track],
+            'art_hash': strings[self._art_hash[track]],
+            'track_gain': self._known(self._track_gain[track]),
+            'track_peak': self._known(self._track_peak[track]),
+            'album_gain': self._known(self._album_gain[track]),
+            'album_peak': self._known(self._album_peak[track]),
+        }
+
+    @staticmethod
+    def _known(value):
+        return None if value != value else value
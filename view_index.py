@@ -0,0 +1,197 @@
+from bisect import bisect_left, insort
+
+
+# Sort mode -> fields to group by, outermost first
+VIEW_GROUPINGS = {
+    'All Songs': (),
+    'By Artist & Album': ('artist', 'album'),
+    'By Album': ('album',),
+    'By Artist': ('artist',),
+}
+
+
+def track_number(value):
+    """Numeric track number from tags like '3' or '3/12' (0 if missing or invalid)"""
+    try:
+        return int((value or '0').split('/')[0])
+    except (TypeError, ValueError):
+        return 0
+
+
+def track_sort_key(track, meta):
+    # Sort by album, then track number, then title; the track id breaks ties
+    # and makes every key unique so it can be found again by bisection
+    return (meta['album'] or '', track_number(meta['tracknumber']), meta['title'] or '', track)
+
+
+class IndexGroup:
+    """A node of a ViewIndex: either named sub-groups or sorted track keys"""
+
+    __slots__ = ('label', 'parent', 'count', 'labels', 'children', 'keys')
+
+    def __init__(self, label, parent, leaf):
+        self.label = label
+        self.parent = parent
+        self.count = 0  # tracks below this group
+        self.labels = None if leaf else []  # sorted sub-group labels
+        self.children = None if leaf else {}  # label -> IndexGroup
+        self.keys = [] if leaf else None  # sorted track_sort_key tuples
+
+    def is_leaf(self):
+        return self.keys is not None
+
+    def __len__(self):
+        return len(self.keys) if self.keys is not None else len(self.labels)
+
+    def child(self, row):
+        """Sub-group or track id at row"""
+        if self.keys is not None:
+            return self.keys[row][-1]
+        return self.children[self.labels[row]]
+
+    def row_of(self, group):
+        """Row of a direct sub-group, or -1 if it has been removed"""
+        if self.children is None or self.children.get(group.label) is not group:
+            return -1
+        return bisect_left(self.labels, group.label)
+
+
+class ViewIndex:
+    """Grouped and sorted track ids for one sort mode.
+
+    Groups are kept as sorted label lists and each leaf as a sorted list of
+    precomputed sort keys, so inserting or removing a track is a couple of
+    bisections instead of a full regroup and re-sort.
+    """
+
+    def __init__(self, fields):
+        self.fields = fields
+        self.root = IndexGroup(None, None, leaf=not fields)
+        self._entries = {}  # track id -> (group labels, sort key)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, track):
+        return track in self._entries
+
+    def add(self, track, meta, key=None):
+        if track in self._entries:
+            self.remove(track)
+        if key is None:
+            key = track_sort_key(track, meta)
+        labels = tuple(meta[field] or '' for field in self.fields)
+        group = self.root
+        group.count += 1
+        for depth, label in enumerate(labels):
+            child = group.children.get(label)
+            if child is None:
+                child = IndexGroup(label, group, leaf=depth == len(labels) - 1)
+                group.children[label] = child
+                insort(group.labels, label)
+            group = child
+            group.count += 1
+        insort(group.keys, key)
+        self._entries[track] = (labels, key)
+
+    def add_many(self, items):
+        """Add (track, meta, key) triples, sorting each touched group once.
+
+        Much faster than repeated add() for large batches such as a restored
+        session; track ids must be unique within the batch.
+        """
+        for track, _, _ in items:
+            if track in self._entries:
+                self.remove(track)
+        touched = set()
+        for track, meta, key in items:
+            labels = tuple(meta[field] or '' for field in self.fields)
+            group = self.root
+            group.count += 1
+            for depth, label in enumerate(labels):
+                child = group.children.get(label)
+                if child is None:
+                    child = IndexGroup(label, group, leaf=depth == len(labels) - 1)
+                    group.children[label] = child
+                    group.labels.append(label)
+                    touched.add(group)
+                group = child
+                group.count += 1
+            group.keys.append(key)
+            touched.add(group)
+            self._entries[track] = (labels, key)
+        for group in touched:
+            if group.keys is not None:
+                group.keys.sort()
+            else:
+                group.labels.sort()
+
+    def remove(self, track):
+        entry = self._entries.pop(track, None)
+        if entry is None:
+            return
+        labels, key = entry
+        group = self.root
+        path = [group]
+        for label in labels:
+            group = group.children[label]
+            path.append(group)
+        del group.keys[bisect_left(group.keys, key)]
+        for group in path:
+            group.count -= 1
+        # Prune groups that became empty, innermost first
+        for group in reversed(path[1:]):
+            if group.count:
+                break
+            parent = group.parent
+            del parent.labels[bisect_left(parent.labels, group.label)]
+            del parent.children[group.label]
+
+    def clear(self):
+        self.root = IndexGroup(None, None, leaf=not self.fields)
+        self._entries.clear()
+
+    def locate(self, track):
+        """Return (leaf group, row) for a track id, or (None, -1) if not indexed"""
+        entry = self._entries.get(track)
+        if entry is None:
+            return None, -1
+        labels, key = entry
+        group = self.root
+        for label in labels:
+            group = group.children[label]
+        return group, bisect_left(group.keys, key)
+
+    def __iter__(self):
+        """Track ids in display order"""
+        stack = [self.root]
+        while stack:
+            group = stack.pop()
+            if group.keys is not None:
+                for key in group.keys:
+                    yield key[-1]
+            else:
+                stack.extend(group.children[label] for label in reversed(group.labels))
+
+
+class ViewIndexes:
+    """One ViewIndex per sort mode, all kept up to date on every change"""
+
+    def __init__(self):
+        self.modes = {mode: ViewIndex(fields) for mode, fields in VIEW_GROUPINGS.items()}
+
+    def __getitem__(self, mode):
+        return self.modes[mode]
+
+    def add(self, track, meta):
+        key = track_sort_key(track, meta)
+        for index in self.modes.values():
+            index.add(track, meta, key)
+
+    def remove(self, track):
+        for index in self.modes.values():
+            index.remove(track)
+
+    def clear(self):
+        for index in self.modes.values():
+            index.clear()
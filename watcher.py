@@ -0,0 +1,229 @@
+import os
+import threading
+
+from PyQt5.QtCore import QObject, QFileSystemWatcher, QTimer, pyqtSignal
+
+from library import file_fingerprint
+from metrics import metrics
+from scanner import AUDIO_EXTENSIONS
+
+
+class FolderWatcher(QObject):
+    """Keeps the playlist in step with the audio files on disk.
+
+    The folders holding playlist tracks are watched with QFileSystemWatcher
+    (inotify and friends). Change notifications are collected per folder
+    and debounced, so a burst (copying an album, a tagger rewriting files)
+    is handled as one update. Folder notifications do not cover files
+    rewritten in place and some file systems send none at all, so every
+    folder is also compared against disk every `poll_interval` ms.
+
+    Comparisons run in a background thread. Files are stat'ed and only
+    those whose (mtime, size) no longer match the library cache are parsed
+    again. A file that disappears while a file with the same fingerprint
+    appears elsewhere counts as moved and is not parsed at all. New files
+    are only picked up under root folders (those added with "Add Folder").
+    Results arrive through `changed` on the GUI thread; the library cache
+    is already updated by then.
+    """
+
+    changed = pyqtSignal(list, list, list)  # updated/new (path, metadata), removed paths, moved (old, new)
+
+    # Internal signal carrying the watch generation, so results computed
+    # for a playlist that has since been replaced can be dropped
+    _done = pyqtSignal(int, object)
+
+    def __init__(self, library, parse, debounce=1000, poll_interval=60000, parent=None):
+        super().__init__(parent)
+        self.library = library
+        self.parse = parse
+        self.roots = []
+        self._known = {}  # folder -> {path: fingerprint when last seen, or None}
+        self._dirty = set()
+        self._baseline = set()  # roots whose first check only looks for subfolders
+        self._busy = False
+        self._generation = 0
+        self._watcher = QFileSystemWatcher(self)
+        self._watcher.directoryChanged.connect(self._directory_changed)
+        self._debounce = QTimer(self)
+        self._debounce.setSingleShot(True)
+        self._debounce.setInterval(debounce)
+        self._debounce.timeout.connect(self._start)
+        self._poll = QTimer(self)
+        self._poll.setInterval(poll_interval)
+        self._poll.timeout.connect(self.check_all)
+        self._done.connect(self._on_done)
+
+    def watch_files(self, paths):
+        """Track changes to these playlist files (and new files next to them, under a root)"""
+        folders = set()
+        for filepath in paths:
+            if '://' in filepath:
+                continue
+            folder = os.path.dirname(filepath)
+            self._known.setdefault(folder, {}).setdefault(filepath, None)
+            folders.add(folder)
+        self._watch(folders)
+
+    def add_roots(self, roots):
+        """Pick up new files anywhere under these folders from now on"""
+        for root in roots:
+            root = os.path.normpath(root)
+            if os.path.isdir(root) and root not in self.roots:
+                self.roots.append(root)
+                # The first check only walks the root to watch its subfolders;
+                # the files already there are being imported
+                self._known.setdefault(root, {})
+                self._baseline.add(root)
+                self._dirty.add(root)
+        self._watch(self.roots)
+        if self._dirty:
+            self._debounce.start()
+
+    def check_all(self):
+        """Compare every watched folder against disk (after the debounce delay)"""
+        self._dirty.update(self._known)
+        if self._dirty:
+            self._debounce.start()
+
+    def clear(self):
+        self._generation += 1
+        self._busy = False
+        self._debounce.stop()
+        self._poll.stop()
+        self._dirty.clear()
+        self._baseline.clear()
+        self._known.clear()
+        self.roots = []
+        watched = self._watcher.directories()
+        if watched:
+            self._watcher.removePaths(watched)
+
+    def _watch(self, folders):
+        watched = set(self._watcher.directories())
+        new = [folder for folder in folders if folder not in watched]
+        if new:
+            # Folders that cannot be watched (inotify limit, network shares)
+            # are still covered by the periodic check
+            self._watcher.addPaths(new)
+        if self._known and not self._poll.isActive():
+            self._poll.start()
+
+    def _directory_changed(self, folder):
+        self._dirty.add(folder)
+        self._debounce.start()
+
+    def _start(self):
+        if self._busy or not self._dirty:
+            return
+        self._busy = True
+        folders = {folder: dict(self._known.get(folder, {})) for folder in self._dirty}
+        args = (self._generation, folders, list(self.roots), set(self._baseline), set(self._known))
+        self._dirty.clear()
+        self._baseline.clear()
+        threading.Thread(target=self._run, args=args, daemon=True).start()
+
+    def _run(self, generation, *args):
+        result = {'updated': [], 'removed': [], 'moved': [], 'seen': {}, 'folders': set(), 'missing': set()}
+        try:
+            with metrics.timer('watcher.diff'):
+                self._diff(*args, result)
+        finally:
+            self._done.emit(generation, result)
+
+    def _diff(self, folders, roots, baseline, known_folders, result):
+        seen = result['seen']  # path -> current fingerprint of known files still there
+        gone = {}  # path -> last known fingerprint of files no longer there
+        new = {}  # path -> fingerprint of files not in the playlist yet
+        for folder, known in folders.items():
+            under_root = any(folder == root or folder.startswith(os.path.join(root, '')) for root in roots)
+            present = set()
+            try:
+                with os.scandir(folder) as entries:
+                    for entry in entries:
+                        try:
+                            if entry.is_dir():
+                                if under_root and entry.path not in known_folders:
+                                    self._walk(entry.path, None if folder in baseline else new, result['folders'])
+                            elif entry.name.lower().endswith(AUDIO_EXTENSIONS) and entry.is_file():
+                                present.add(entry.path)
+                        except OSError:
+                            continue
+            except OSError:
+                if not os.path.isdir(folder):
+                    result['missing'].add(folder)
+            for filepath in present:
+                fingerprint = file_fingerprint(filepath)
+                if fingerprint is None:
+                    continue
+                if filepath in known:
+                    seen[filepath] = fingerprint
+                elif under_root and folder not in baseline:
+                    new[filepath] = fingerprint
+            for filepath, fingerprint in known.items():
+                if filepath not in present:
+                    gone[filepath] = fingerprint or self.library.fingerprint(filepath)
+
+        # A file that vanished while one with the same fingerprint appeared was moved
+        arrivals = {}
+        for filepath, fingerprint in new.items():
+            arrivals.setdefault(fingerprint, []).append(filepath)
+        for old, fingerprint in gone.items():
+            candidates = arrivals.get(fingerprint) if fingerprint is not None else None
+            if candidates:
+                filepath = candidates.pop()
+                del new[filepath]
+                result['moved'].append((old, filepath, fingerprint))
+                self.library.rename(old, filepath)
+            else:
+                result['removed'].append(old)
+        self.library.remove_many(result['removed'])
+
+        # Known files are only parsed again if the library has no entry for
+        # their current fingerprint
+        changed = [filepath for filepath, fingerprint in seen.items()
+                   if fingerprint != folders[os.path.dirname(filepath)][filepath]
+                   and self.library.get(filepath, fingerprint) is None]
+        paths = changed + sorted(new)
+        result['updated'] = list(zip(paths, self.library.resolve(paths, self.parse)))
+
+    def _walk(self, folder, new, folders):
+        # A folder that appeared under a root: watch it and everything below;
+        # its files are new unless this is the root's first check (new is None)
+        for directory, _, files in os.walk(folder):
+            folders.add(directory)
+            if new is None:
+                continue
+            for name in files:
+                if name.lower().endswith(AUDIO_EXTENSIONS):
+                    filepath = os.path.join(directory, name)
+                    fingerprint = file_fingerprint(filepath)
+                    if fingerprint is not None:
+                        new[filepath] = fingerprint
+
+    def _on_done(self, generation, result):
+        if generation != self._generation:
+            return
+        self._busy = False
+        known = self._known
+        for filepath, fingerprint in result['seen'].items():
+            files = known.get(os.path.dirname(filepath))
+            if files is not None and filepath in files:
+                files[filepath] = fingerprint
+        for filepath in result['removed']:
+            known.get(os.path.dirname(filepath), {}).pop(filepath, None)
+        for old, filepath, fingerprint in result['moved']:
+            known.get(os.path.dirname(old), {}).pop(old, None)
+            known.setdefault(os.path.dirname(filepath), {})[filepath] = fingerprint
+        # New files are not recorded here: they become known once the
+        # playlist adds them and calls watch_files
+        for folder in result['missing']:
+            known.pop(folder, None)
+        for folder in result['folders']:
+            known.setdefault(folder, {})
+        self._watch(result['folders'] | {os.path.dirname(filepath) for _, filepath, _ in result['moved']})
+        if result['updated'] or result['removed'] or result['moved']:
+            moved = [(old, filepath) for old, filepath, _ in result['moved']]
+            self.changed.emit(result['updated'], result['removed'], moved)
+        if self._dirty:
+            self._debounce.start()